@@ -1,6 +1,6 @@
 from flask import Flask, render_template, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
+from flask_login import LoginManager, current_user
 from flask_migrate import Migrate
 from flask_caching import Cache
 from flask_wtf.csrf import CSRFProtect
@@ -109,6 +109,14 @@ def create_app():
     # Initialize cache manager (no need to set cache manually)
     from .cache.cache_manager import get_cache_manager
     cache_manager = get_cache_manager()
+    cache_manager.adaptive_ttl.track_writes()
+    from .cache.cache_counters import dashboard_counters
+    dashboard_counters.install()
+    from .cache.unread_counters import unread_counters
+    unread_counters.install()
+    if app.config.get('CACHE_BACKGROUND_REFRESH'):
+        from .cache.cache_warming import start_background_refresh
+        start_background_refresh(app)
     
     migrate = Migrate(app, db)
     login_manager = LoginManager()
@@ -127,6 +135,14 @@ def create_app():
     from .real_time_monitor import init_real_time_monitor
     system_monitor = init_real_time_monitor(socketio)
     
+    # Admission queue for registration rushes
+    from .services.registration_queue import init_registration_queue
+    init_registration_queue(app, socketio)
+    
+    # Notification delivery (SocketIO/email) from the transactional outbox
+    from .services.notification_outbox import init_outbox_dispatcher
+    init_outbox_dispatcher(app, socketio)
+    
     # Register user_loader for Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
@@ -155,18 +171,26 @@ def create_app():
         print('Admin left dashboard room')
     
     @socketio.on('join_user_room')
-    def handle_join_user_room(data):
-        user_id = data.get('user_id')
-        if user_id:
-            join_room(f'user_{user_id}')
-            print(f'User {user_id} joined user room')
+    def handle_join_user_room(data=None):
+        # The room comes from the session, never from the client: user_<id>
+        # carries notification bodies, unread counts and registration results
+        if not current_user.is_authenticated:
+            return
+        join_room(f'user_{current_user.id}')
+        # Rooms for set-based broadcasts (NotificationService.fan_out)
+        join_room('all_users')
+        join_room(f'role_{current_user.vai_tro}')
+        print(f'User {current_user.id} joined user room')
     
     @socketio.on('leave_user_room')
-    def handle_leave_user_room(data):
-        user_id = data.get('user_id')
-        if user_id:
-            leave_room(f'user_{user_id}')
-            print(f'User {user_id} left user room')    
+    def handle_leave_user_room(data=None):
+        if not current_user.is_authenticated:
+            return
+        leave_room(f'user_{current_user.id}')
+        leave_room('all_users')
+        leave_room(f'role_{current_user.vai_tro}')
+        print(f'User {current_user.id} left user room')
+    
     # Register blueprints theo cấu trúc mới 
     from .routes.system_admin.system_admin import system_admin_bp
     from .routes.admin.admin_main import admin_bp  
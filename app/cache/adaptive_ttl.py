@@ -0,0 +1,155 @@
+"""
+Adaptive TTL
+============
+
+Per-prefix timeouts for ``cached_query`` derived from observed traffic.
+
+Every ``adjust_interval`` seconds a prefix's TTL is moved towards a target:
+
+- no writes or invalidations in the window: grow by ``GROWTH`` (stable data
+  such as students_by_class stays cached longer);
+- otherwise: the mean time between changes, since caching longer than the
+  data stays valid only serves stale values (volatile data such as
+  recent_activities refreshes sooner);
+- fewer reads than changes: the minimum, caching barely pays there.
+
+Reads come from CacheStats; changes are explicit invalidations plus ORM
+writes to the models behind the prefix's tags (counted on flush, so writes
+that never call invalidate_* still count). Bounds and the on/off switch are
+read through ConfigManager: ``cache_adaptive_ttl``, ``cache_ttl_min``,
+``cache_ttl_max``. Counters are per process; each worker converges on its
+own view of the same traffic.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+import threading
+import time
+import logging
+
+from .cache_tags import model_tag
+
+logger = logging.getLogger(__name__)
+
+GROWTH = 1.5
+SMOOTHING = 0.5  # weight of the new target vs. the current TTL
+
+
+class AdaptiveTTL:
+    """Adjusts cached_query timeouts from read/write/invalidation rates"""
+
+    def __init__(self, stats, adjust_interval: int = 60):
+        self.stats = stats
+        self.adjust_interval = adjust_interval
+        self._prefixes: Dict[str, Dict[str, Any]] = {}
+        self._writes: Dict[str, int] = {}  # tag -> cumulative ORM writes
+        self._lock = threading.Lock()
+        self._tracking = False
+
+    def register(self, prefix: str, base_ttl: int, tags: Iterable[str]) -> None:
+        """Register a cached_query prefix with its decorator timeout"""
+        with self._lock:
+            self._prefixes[prefix] = {
+                'base': base_ttl,
+                'ttl': base_ttl,
+                'tags': set(tags),
+                'evaluated_at': time.monotonic(),
+                'reads': 0,
+                'invalidations': 0,
+                'writes': 0
+            }
+
+    def prefixes_for_tags(self, tags: Iterable[str]):
+        """Registered prefixes that depend on any of the tags"""
+        tags = set(tags)
+        return [prefix for prefix, state in self._prefixes.items() if state['tags'] & tags]
+
+    def ttl_for(self, prefix: str, default: int) -> int:
+        """Current timeout for prefix (re-evaluated at most every adjust_interval)"""
+        state = self._prefixes.get(prefix)
+        if state is None:
+            return default
+
+        enabled, lower, upper = self._bounds()
+        if not enabled:
+            return state['base']
+
+        if time.monotonic() - state['evaluated_at'] >= self.adjust_interval:
+            with self._lock:
+                if time.monotonic() - state['evaluated_at'] >= self.adjust_interval:
+                    self._evaluate(prefix, state, lower, upper)
+        return max(lower, min(upper, state['ttl']))
+
+    def scaled(self, prefix: str, timeout: int, soft_ttl: Optional[int]) -> Tuple[int, Optional[int]]:
+        """(hard, soft) TTL for prefix; soft_ttl keeps its ratio to the hard TTL"""
+        ttl = self.ttl_for(prefix, timeout)
+        if not soft_ttl:
+            return ttl, soft_ttl
+        return ttl, max(1, int(soft_ttl * ttl / timeout))
+
+    def record_write(self, tag: str, count: int = 1) -> None:
+        with self._lock:
+            self._writes[tag] = self._writes.get(tag, 0) + count
+
+    def track_writes(self) -> None:
+        """Count ORM inserts/updates/deletes per model on every flush"""
+        if self._tracking:
+            return
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        def after_flush(session, flush_context):
+            changed = {}
+            for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+                name = type(obj).__name__
+                changed[name] = changed.get(name, 0) + 1
+            for name, count in changed.items():
+                self.record_write(model_tag(name), count)
+
+        event.listen(Session, 'after_flush', after_flush)
+        self._tracking = True
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Current TTL per prefix (for metrics)"""
+        with self._lock:
+            return {prefix: {'base': state['base'], 'ttl': state['ttl']}
+                    for prefix, state in sorted(self._prefixes.items())}
+
+    def _evaluate(self, prefix: str, state: Dict[str, Any], lower: int, upper: int) -> None:
+        now = time.monotonic()
+        elapsed = max(1.0, now - state['evaluated_at'])
+        counters = self.stats.prefix_counters(prefix)
+        reads_total = counters['hits'] + counters['misses']
+        writes_total = sum(self._writes.get(tag, 0) for tag in state['tags'])
+
+        reads = reads_total - state['reads']
+        changes = (counters['invalidations'] - state['invalidations']) + (writes_total - state['writes'])
+
+        if changes <= 0:
+            target = state['ttl'] * GROWTH
+        elif reads < changes:
+            target = lower
+        else:
+            target = elapsed / changes
+
+        new_ttl = int(max(lower, min(upper, state['ttl'] * (1 - SMOOTHING) + target * SMOOTHING)))
+        if new_ttl != state['ttl']:
+            logger.debug(f"Adaptive TTL {prefix}: {state['ttl']}s -> {new_ttl}s "
+                         f"(reads={reads}, changes={changes}, window={int(elapsed)}s)")
+
+        state.update({
+            'ttl': new_ttl,
+            'evaluated_at': now,
+            'reads': reads_total,
+            'invalidations': counters['invalidations'],
+            'writes': writes_total
+        })
+
+    def _bounds(self) -> Tuple[bool, int, int]:
+        try:
+            from ..config_manager import get_config
+            enabled = bool(get_config('cache_adaptive_ttl', True))
+            lower = int(get_config('cache_ttl_min', 60))
+            upper = int(get_config('cache_ttl_max', 7200))
+        except Exception:
+            enabled, lower, upper = True, 60, 7200
+        return enabled, lower, max(lower, upper)
@@ -0,0 +1,333 @@
+"""
+Dashboard Counters
+==================
+
+Write-through counters for the dashboard, kept in the cache backend and
+maintained by SQLAlchemy events instead of COUNT/GROUP BY scans.
+
+- ``after_insert``/``after_delete``/``after_update`` mapper events collect
+  deltas in ``session.info``; they are applied with the backend's ``inc``
+  (atomic INCRBY on Redis) only after the transaction commits, and dropped
+  on rollback.
+- A delta is only applied to a counter that already exists. Missing
+  counters (cold cache, eviction, new day, new group value) are rebuilt by
+  the next reader with a single query, so an increment never starts from a
+  wrong base.
+- A rebuild must not lose a delta committed while its query runs (skipped
+  because the counter is missing, or overwritten by the stale result).
+  Every delta bumps the counter's ``<key>:seq`` (the group index's for
+  grouped counters) first; a rebuild whose sequence moved meanwhile drops
+  what it stored and the next reader rebuilds again, as in
+  ``unread_counters``.
+- Bulk ``query.delete()``/``update()``, raw SQL and per-process backends
+  drift. Each counter (and each group index) is considered fresh for
+  ``CACHE_COUNTER_TTL`` seconds after it was built; the next reader after
+  that recomputes it, which bounds drift in any configuration.
+  ``reconcile()`` recomputes everything sooner when the cache warmer loop
+  runs (``CACHE_BACKGROUND_REFRESH``).
+
+Counters (``_counter:`` keys, so they bypass the per-process L1)::
+
+    users        total, by vai_tro
+    sessions     total
+    students     total, by lop
+    activities   total, per day of thoi_gian (in the TIMEZONE calendar)
+
+``<key>:built`` expires after ``CACHE_COUNTER_TTL``; the value key itself
+does not, because ``inc`` on per-process backends resets a key's timeout.
+``<key>:seq`` is the change sequence described above.
+"""
+
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+import json
+import threading
+import logging
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.models import NguoiDung, CaThucHanh, SinhVien, NhatKyHoatDong, db
+from app.date_windows import day_window, local_date, local_today
+from .local_cache import raw_backend
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY_PREFIX = "_counter:"
+DAY_COUNTER_TIMEOUT = 3 * 24 * 3600
+DEFAULT_COUNTER_TTL = 3600
+BUILT_SUFFIX = ":built"
+SEQ_SUFFIX = ":seq"
+SESSION_DELTAS_KEY = 'dashboard_counter_deltas'
+
+
+class CounterSpec:
+    """One counted model: total, optionally grouped by a column and by day"""
+
+    def __init__(self, name: str, model, group_by: Optional[str] = None, day_field: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.group_by = group_by
+        self.day_field = day_field
+
+    def total_key(self) -> str:
+        return f"{COUNTER_KEY_PREFIX}{self.name}:total"
+
+    def groups_key(self) -> str:
+        return f"{COUNTER_KEY_PREFIX}{self.name}:groups"
+
+    def group_key(self, value: Any) -> str:
+        return f"{COUNTER_KEY_PREFIX}{self.name}:group:{json.dumps(value)}"
+
+    def day_key(self, day) -> str:
+        return f"{COUNTER_KEY_PREFIX}{self.name}:day:{day.isoformat()}"
+
+    def count_total(self) -> int:
+        return self.model.query.count()
+
+    def count_groups(self) -> Dict[Any, int]:
+        column = getattr(self.model, self.group_by)
+        rows = db.session.query(column, func.count(self.model.id)).group_by(column).all()
+        return {value: count for value, count in rows}
+
+    def count_day(self, day) -> int:
+        column = getattr(self.model, self.day_field)
+        return self.model.query.filter(day_window(day).filter(column)).count()
+
+
+COUNTER_SPECS = [
+    CounterSpec('users', NguoiDung, group_by='vai_tro'),
+    CounterSpec('sessions', CaThucHanh),
+    CounterSpec('students', SinhVien, group_by='lop'),
+    CounterSpec('activities', NhatKyHoatDong, day_field='thoi_gian'),
+]
+
+
+class DashboardCounters:
+    """Event-maintained counters stored in the cache backend"""
+
+    def __init__(self, specs: List[CounterSpec]):
+        self.specs = {spec.name: spec for spec in specs}
+        self._by_model = {spec.model: spec for spec in specs}
+        self._lock = threading.Lock()  # makes inc atomic on per-process backends
+        self._installed = False
+        self.metrics = {'applied': 0, 'skipped': 0, 'rebuilt': 0, 'reconciled': 0}
+
+    # Reads
+
+    def total(self, name: str) -> int:
+        spec = self.specs[name]
+        return self._read(spec.total_key(), spec.count_total)
+
+    def by_group(self, name: str) -> Dict[Any, int]:
+        spec = self.specs[name]
+        cache = self._cache()
+        if cache is None:
+            return spec.count_groups()
+
+        groups = cache.get(spec.groups_key())
+        if groups is not None:
+            values = raw_backend(cache).get_many(*[spec.group_key(value) for value in groups])
+            if all(value is not None for value in values):
+                return {group: int(value) for group, value in zip(groups, values) if int(value) > 0}
+        return self._rebuild_groups(cache, spec)
+
+    def day(self, name: str, day=None) -> int:
+        spec = self.specs[name]
+        day = day or local_today()
+        return self._read(spec.day_key(day), lambda: spec.count_day(day), DAY_COUNTER_TIMEOUT)
+
+    # Maintenance
+
+    def reconcile(self) -> None:
+        """Recompute every counter from the database"""
+        cache = self._cache()
+        if cache is None:
+            return
+        today = local_today()
+        for spec in self.specs.values():
+            self._rebuild(cache, spec.total_key(), spec.count_total)
+            if spec.group_by:
+                self._rebuild_groups(cache, spec)
+            if spec.day_field:
+                self._rebuild(cache, spec.day_key(today), lambda: spec.count_day(today), DAY_COUNTER_TIMEOUT)
+        self.metrics['reconciled'] += 1
+        logger.info("Dashboard counters reconciled")
+
+    def install(self) -> None:
+        """Register the SQLAlchemy listeners (idempotent)"""
+        if self._installed:
+            return
+        for spec in self.specs.values():
+            event.listen(spec.model, 'after_insert', self._after_insert)
+            event.listen(spec.model, 'after_delete', self._after_delete)
+            if spec.group_by or spec.day_field:
+                event.listen(spec.model, 'after_update', self._after_update)
+                for field in filter(None, (spec.group_by, spec.day_field)):
+                    # active_history loads the old value even when the
+                    # attribute was expired (e.g. after a commit)
+                    event.listen(getattr(spec.model, field), 'set', _noop_set, active_history=True)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        self._installed = True
+
+    # Event handlers
+
+    def _after_insert(self, mapper, connection, target) -> None:
+        self._collect(target, 1, self._group_value(target), self._day_value(target))
+
+    def _after_delete(self, mapper, connection, target) -> None:
+        self._collect(target, -1, self._group_value(target), self._day_value(target))
+
+    def _after_update(self, mapper, connection, target) -> None:
+        spec = self._by_model.get(type(target))
+        if spec is None:
+            return
+        state = inspect(target)
+        for field in filter(None, (spec.group_by, spec.day_field)):
+            history = state.attrs[field].history
+            if not history.has_changes() or not history.deleted:
+                continue
+            old, new = history.deleted[0], getattr(target, field)
+            deltas = self._deltas(target)
+            if field == spec.group_by:
+                self._add(deltas, spec.group_key(old), -1, spec.groups_key())
+                self._add(deltas, spec.group_key(new), 1, spec.groups_key())
+            else:
+                if old:
+                    self._add(deltas, spec.day_key(local_date(old)), -1)
+                if new:
+                    self._add(deltas, spec.day_key(local_date(new)), 1)
+
+    def _after_commit(self, session) -> None:
+        deltas = session.info.pop(SESSION_DELTAS_KEY, None)
+        if deltas:
+            self._apply(deltas)
+
+    def _after_rollback(self, session) -> None:
+        session.info.pop(SESSION_DELTAS_KEY, None)
+
+    # Internals
+
+    def _collect(self, target, delta: int, group=None, day=None) -> None:
+        spec = self._by_model.get(type(target))
+        if spec is None:
+            return
+        deltas = self._deltas(target)
+        self._add(deltas, spec.total_key(), delta)
+        if spec.group_by:
+            self._add(deltas, spec.group_key(group), delta, spec.groups_key())
+        if spec.day_field and day:
+            self._add(deltas, spec.day_key(day), delta)
+
+    def _deltas(self, target) -> Dict[str, List]:
+        session = object_session(target)
+        if session is None:
+            return {}
+        return session.info.setdefault(SESSION_DELTAS_KEY, {})
+
+    @staticmethod
+    def _add(deltas: Dict[str, List], key: str, delta: int, index_key: Optional[str] = None) -> None:
+        entry = deltas.setdefault(key, [0, index_key])
+        entry[0] += delta
+
+    def _apply(self, deltas: Dict[str, List]) -> None:
+        cache = self._cache()
+        if cache is None:
+            return
+        backend = raw_backend(cache)
+        try:
+            for key, (delta, index_key) in deltas.items():
+                if not delta:
+                    continue
+                with self._lock:
+                    # Before the existence check, so a rebuild in progress notices
+                    backend.inc((index_key or key) + SEQ_SUFFIX, 1)
+                    if backend.get(key) is None:
+                        # Unknown base value: let the next reader rebuild it
+                        self.metrics['skipped'] += 1
+                        if index_key:
+                            backend.delete(index_key)
+                        continue
+                    backend.inc(key, delta)
+                self.metrics['applied'] += 1
+        except Exception as e:
+            logger.error(f"Failed to apply dashboard counter deltas: {e}")
+
+    def _read(self, key: str, compute: Callable[[], int], timeout: int = 0) -> int:
+        cache = self._cache()
+        if cache is None:
+            return compute()
+        value, built = raw_backend(cache).get_many(key, key + BUILT_SUFFIX)
+        if value is not None and built is not None:
+            return int(value)
+        # A missing value is added (never overwrites an increment that landed
+        # meanwhile); an expired one is replaced, which is the point of the TTL
+        return self._rebuild(cache, key, compute, timeout, replace=value is not None)
+
+    def _rebuild(self, cache, key: str, compute: Callable[[], int], timeout: int = 0, replace: bool = True) -> int:
+        """Recompute and store a counter unless a delta committed meanwhile"""
+        backend = raw_backend(cache)
+        seq = backend.get(key + SEQ_SUFFIX)
+        value = compute()
+        if replace:
+            cache.set(key, value, timeout=timeout)
+        else:
+            cache.add(key, value, timeout=timeout)
+        cache.set(key + BUILT_SUFFIX, 1, timeout=self._ttl())
+        if backend.get(key + SEQ_SUFFIX) != seq:
+            # The result may predate that delta: the next reader rebuilds
+            backend.delete_many(key, key + BUILT_SUFFIX)
+        self.metrics['rebuilt'] += 1
+        return value
+
+    def _rebuild_groups(self, cache, spec: CounterSpec) -> Dict[Any, int]:
+        backend = raw_backend(cache)
+        seq = backend.get(spec.groups_key() + SEQ_SUFFIX)
+        counts = spec.count_groups()
+        for value, count in counts.items():
+            cache.set(spec.group_key(value), count, timeout=0)
+        # The index expires, so by_group() rebuilds every group after the TTL
+        cache.set(spec.groups_key(), list(counts.keys()), timeout=self._ttl())
+        if backend.get(spec.groups_key() + SEQ_SUFFIX) != seq:
+            # Without the index the next by_group() rebuilds every group
+            backend.delete(spec.groups_key())
+        self.metrics['rebuilt'] += 1
+        return counts
+
+    def _group_value(self, target) -> Any:
+        spec = self._by_model.get(type(target))
+        return getattr(target, spec.group_by) if spec and spec.group_by else None
+
+    def _day_value(self, target):
+        spec = self._by_model.get(type(target))
+        if not spec or not spec.day_field:
+            return None
+        value = getattr(target, spec.day_field) or datetime.utcnow()
+        return local_date(value)
+
+    @staticmethod
+    def _cache():
+        from .cache_manager import get_cache_manager
+        return get_cache_manager().get_cache()
+
+    @staticmethod
+    def _ttl() -> int:
+        try:
+            from flask import current_app
+            return current_app.config.get('CACHE_COUNTER_TTL', DEFAULT_COUNTER_TTL)
+        except RuntimeError:
+            return DEFAULT_COUNTER_TTL
+
+
+def _noop_set(target, value, oldvalue, initiator):
+    """Attribute 'set' listener that only exists for active_history (old value in after_update)"""
+    return value
+
+
+dashboard_counters = DashboardCounters(COUNTER_SPECS)
+
+
+def reconcile_counters():
+    """Recompute all dashboard counters from the database"""
+    dashboard_counters.reconcile()
@@ -0,0 +1,108 @@
+"""
+Canonical Cache Keys
+====================
+
+Deterministic, bounded cache keys for ``cached_query``/``cached_route``.
+
+Key layout::
+
+    <namespace>:v<version>:<scope>:<digest>
+
+- ``namespace`` is the decorator's key prefix, kept readable so pattern
+  invalidation (``dashboard_stats*``) keeps working.
+- ``version`` is bumped in code when a function's return shape changes, so
+  old entries are simply never read again.
+- ``scope`` is ``u<id>`` for an authenticated user, ``anon`` for anonymous
+  callers, or ``public`` for keys explicitly shared by everyone.
+- ``digest`` is a 128-bit blake2b of a typed, order-independent encoding of
+  args/kwargs: ``1`` and ``"1"``, or ``{'a': 1, 'b': 2}`` in any insertion
+  order, hash differently/identically as expected.
+"""
+
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+import hashlib
+import json
+
+PUBLIC_SCOPE = "public"
+ANONYMOUS_SCOPE = "anon"
+
+# Memcached rejects keys over 250 bytes; leave room for backend prefixes
+MAX_KEY_LENGTH = 200
+DIGEST_SIZE = 16
+
+
+def canonicalize(value: Any) -> Any:
+    """Convert a value into a JSON-serialisable, type-tagged structure"""
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        # repr keeps 0.1 and 0.1000000001 apart; json would too, but be explicit
+        return ["f", repr(value)]
+    if isinstance(value, bytes):
+        return ["b", value.hex()]
+    if isinstance(value, (list, tuple)):
+        return ["l", [canonicalize(item) for item in value]]
+    if isinstance(value, dict):
+        items = [(canonicalize(k), canonicalize(v)) for k, v in value.items()]
+        return ["d", sorted(items, key=_sort_key)]
+    if isinstance(value, (set, frozenset)):
+        return ["s", sorted((canonicalize(item) for item in value), key=_sort_key)]
+    if isinstance(value, Enum):
+        return ["e", type(value).__name__, canonicalize(value.value)]
+    if isinstance(value, (datetime, date, dt_time)):
+        return ["t", type(value).__name__, value.isoformat()]
+    if isinstance(value, (Decimal, UUID)):
+        return [type(value).__name__, str(value)]
+    if hasattr(value, '__tablename__') and hasattr(value, 'id'):
+        # ORM instances are identified by table and primary key, not state
+        return ["m", value.__tablename__, canonicalize(value.id)]
+    if hasattr(value, 'to_dict') and callable(value.to_dict):
+        # MultiDict and friends
+        try:
+            return ["o", type(value).__name__, canonicalize(value.to_dict(flat=False))]
+        except TypeError:
+            return ["o", type(value).__name__, canonicalize(value.to_dict())]
+    return ["r", f"{type(value).__module__}.{type(value).__qualname__}", repr(value)]
+
+
+def hash_arguments(args: Tuple = (), kwargs: Optional[Dict[str, Any]] = None) -> str:
+    """blake2b digest of the canonical encoding of args/kwargs"""
+    payload = [canonicalize(list(args)), canonicalize(kwargs or {})]
+    encoded = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=DIGEST_SIZE).hexdigest()
+
+
+def build_cache_key(namespace: str, args: Tuple = (), kwargs: Optional[Dict[str, Any]] = None,
+                    version: int = 1, scope: str = PUBLIC_SCOPE,
+                    max_length: int = MAX_KEY_LENGTH) -> str:
+    """
+    Build a canonical cache key
+
+    Args:
+        namespace: Key prefix (usually the decorator's key_prefix)
+        args/kwargs: Call arguments, hashed
+        version: Namespace version
+        scope: Owner of the entry, see user_scope()
+        max_length: Long namespaces are truncated and suffixed with a hash
+    """
+    suffix = f":v{version}:{scope}:{hash_arguments(args, kwargs)}"
+    room = max_length - len(suffix)
+    if len(namespace) > room:
+        namespace_hash = hashlib.blake2b(namespace.encode('utf-8'), digest_size=4).hexdigest()
+        namespace = f"{namespace[:max(0, room - len(namespace_hash) - 1)]}~{namespace_hash}"
+    return namespace + suffix
+
+
+def user_scope(user) -> str:
+    """Scope segment for a Flask-Login user (``anon`` if not authenticated)"""
+    if user is not None and getattr(user, 'is_authenticated', False):
+        return f"u{user.get_id()}"
+    return ANONYMOUS_SCOPE
+
+
+def _sort_key(item: Any) -> str:
+    return json.dumps(item, separators=(',', ':'), ensure_ascii=False)
@@ -9,21 +9,38 @@ Features:
 - Route caching decorators
 - Database query caching
 - API response caching  
-- Cache invalidation strategies
-- Cache monitoring and metrics
+- Cache invalidation strategies (tag-based, see cache_tags)
+- Cache monitoring and metrics (per key prefix, see cache_stats)
+- Per-process L1 tier in front of the shared backend (see local_cache)
+- Single-flight recompute on miss (see single_flight)
+- Stale-while-revalidate for queries with a soft TTL (see stale_refresh)
+- Canonical, versioned, user-scoped cache keys (see cache_keys)
+- Compact serialization, compression and a size cap (see serialization)
+- HTTP revalidation for cached routes (ETag / Last-Modified / 304)
+- Adaptive query TTLs from observed read/write rates (see adaptive_ttl)
 - Performance optimization
 """
 
 from functools import wraps
 from datetime import datetime, timedelta
-from flask import current_app, request, jsonify, g
+from flask import current_app, request, jsonify, g, make_response
+from werkzeug.http import http_date
 from flask_login import current_user
-from typing import Optional, Dict, Any, Union, Callable
+from typing import Optional, Dict, Any, Union, Callable, Tuple
 import hashlib
 import json
 import time
 import logging
 
+from .adaptive_ttl import AdaptiveTTL
+from .cache_stats import CacheStats, summarize, render_prometheus
+from .cache_keys import build_cache_key, user_scope, PUBLIC_SCOPE
+from .cache_tags import CacheTagIndex, model_tag, user_tag, prefix_tag
+from .local_cache import LocalLRUCache, TieredCache
+from .serialization import CacheCodec, CodecCache, CachedResponse
+from .single_flight import SingleFlight
+from .stale_refresh import StaleEntry, BackgroundRefresher, unwrap
+
 # Type hints for cache objects
 try:
     from flask_caching import Cache
@@ -42,49 +59,89 @@ class CacheManager:
     
     def __init__(self, cache=None):
         self.cache = cache
-        self.metrics = {
-            'hits': 0,
-            'misses': 0,
-            'invalidations': 0,
-            'errors': 0        }
+        self.tag_index = CacheTagIndex()
+        self.stats = CacheStats(tag_index=self.tag_index)
+        self.adaptive_ttl = AdaptiveTTL(self.stats)
+        self.single_flight = SingleFlight()
+        self.refresher = BackgroundRefresher()
+    
+    @property
+    def metrics(self) -> Dict[str, int]:
+        """Worker-wide totals (hits, misses, invalidations, errors)"""
+        totals = self.stats.totals()
+        return {name: totals[name] for name in ('hits', 'misses', 'invalidations', 'errors')}
     
     def get_cache(self) -> Optional[Any]:
-        """Get cache instance from current app"""
+        """Get cache instance from current app (resolved once per app)"""
         if self.cache:
             return self.cache
         
         try:
             from flask import current_app
             
-            # Try to get cache from Flask-Caching extension
-            cache_ext = current_app.extensions.get('cache')
-            if cache_ext and isinstance(cache_ext, dict):
-                # Flask-Caching stores cache as {Cache_instance: Backend_instance}
-                # We need the Cache instance (key) which has get/set/delete methods
-                for cache_instance in cache_ext.keys():
-                    if hasattr(cache_instance, 'get') and hasattr(cache_instance, 'set') and hasattr(cache_instance, 'delete'):
-                        return cache_instance
+            resolved = current_app.extensions.get('cache_manager_cache')
+            if resolved is not None:
+                return resolved
+            
+            backend = self._resolve_backend()
+            if backend is None:
+                return None
+            
+            if current_app.config.get('CACHE_CODEC_ENABLED', True):
+                backend = CodecCache(backend, CacheCodec(
+                    serializer=current_app.config.get('CACHE_SERIALIZER', 'pickle'),
+                    compression=current_app.config.get('CACHE_COMPRESSION', 'zlib'),
+                    compress_threshold=current_app.config.get('CACHE_COMPRESS_THRESHOLD', 1024),
+                    max_size=current_app.config.get('CACHE_MAX_VALUE_BYTES', 1024 * 1024)
+                ))
             
-            # If cache_ext is the cache instance itself
-            if cache_ext and hasattr(cache_ext, 'get') and hasattr(cache_ext, 'set') and hasattr(cache_ext, 'delete'):
-                return cache_ext
+            resolved = backend
+            if current_app.config.get('CACHE_L1_ENABLED', True):
+                resolved = TieredCache(backend, LocalLRUCache(
+                    max_entries=current_app.config.get('CACHE_L1_MAX_ENTRIES', 1000),
+                    max_bytes=current_app.config.get('CACHE_L1_MAX_BYTES', 16 * 1024 * 1024),
+                    default_ttl=current_app.config.get('CACHE_L1_TTL', 30)
+                ))
+                # Redis backend: broadcast L1 invalidations to other workers
+                redis_client = getattr(getattr(backend, 'cache', None), '_write_client', None)
+                resolved.enable_cross_worker_invalidation(redis_client)
             
-            # Fallback: try to create cache from config
-            from flask_caching import Cache
-            fallback_cache = Cache(current_app)
-            logger.warning("Using fallback cache instance")
-            return fallback_cache
+            current_app.extensions['cache_manager_cache'] = resolved
+            return resolved
             
         except Exception as e:
             logger.error(f"Error getting cache: {e}")
             return None
     
-    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
-        """Set a value in cache"""
+    def _resolve_backend(self) -> Optional[Any]:
+        """Find the Flask-Caching instance registered on the current app"""
+        # Try to get cache from Flask-Caching extension
+        cache_ext = current_app.extensions.get('cache')
+        if cache_ext and isinstance(cache_ext, dict):
+            # Flask-Caching stores cache as {Cache_instance: Backend_instance}
+            # We need the Cache instance (key) which has get/set/delete methods
+            for cache_instance in cache_ext.keys():
+                if hasattr(cache_instance, 'get') and hasattr(cache_instance, 'set') and hasattr(cache_instance, 'delete'):
+                    return cache_instance
+        
+        # If cache_ext is the cache instance itself
+        if cache_ext and hasattr(cache_ext, 'get') and hasattr(cache_ext, 'set') and hasattr(cache_ext, 'delete'):
+            return cache_ext
+        
+        # Fallback: try to create cache from config
+        from flask_caching import Cache
+        fallback_cache = Cache(current_app)
+        logger.warning("Using fallback cache instance")
+        return fallback_cache
+    
+    def set(self, key: str, value: Any, timeout: Optional[int] = None, tags=None) -> bool:
+        """Set a value in cache, optionally registering it under tags"""
         cache = self.get_cache()
         if cache and hasattr(cache, 'set'):
             try:
                 cache.set(key, value, timeout=timeout)
+                if tags:
+                    self.tag_index.register(cache, key, tags, timeout)
                 return True
             except Exception as e:
                 self.record_error()
@@ -125,70 +182,108 @@ class CacheManager:
     def get_cache_metrics(self):
         """Get cache metrics and status"""
         cache = self.get_cache()
-        return {
+        totals = self.metrics
+        metrics = {
             'cache_type': type(cache).__name__ if cache else 'None',
             'cache_available': cache is not None,
             'hit_rate': self.get_hit_rate(),
-            'total_hits': self.metrics['hits'],
-            'total_misses': self.metrics['misses'],
-            'total_errors': self.metrics['errors'],
-            'total_invalidations': self.metrics['invalidations'],
+            'total_hits': totals['hits'],
+            'total_misses': totals['misses'],
+            'total_errors': totals['errors'],
+            'total_invalidations': totals['invalidations'],
             'timestamp': datetime.now().isoformat()
         }
+        if isinstance(cache, TieredCache):
+            metrics['tiers'] = cache.get_l1_metrics()
+        codec_cache = cache.backend if isinstance(cache, TieredCache) else cache
+        if isinstance(codec_cache, CodecCache):
+            metrics['serialization'] = codec_cache.codec.get_metrics()
+        metrics['single_flight'] = dict(self.single_flight.metrics)
+        metrics['background_refresh'] = dict(self.refresher.metrics)
+        metrics['adaptive_ttl'] = self.adaptive_ttl.snapshot()
+        return metrics
+    
+    def get_prefix_stats(self):
+        """Per-prefix statistics aggregated across all workers"""
+        cache = self.get_cache()
+        if cache:
+            self.stats.publish(cache)
+        aggregated = self.stats.aggregate(cache)
+        return {
+            'workers': aggregated['workers'],
+            'prefixes': summarize(aggregated['prefixes']),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def get_prometheus_metrics(self) -> str:
+        """Per-prefix statistics in Prometheus text format"""
+        cache = self.get_cache()
+        if cache:
+            self.stats.publish(cache)
+        return render_prometheus(self.stats.aggregate(cache)['prefixes'])
     
-    def record_hit(self):
+    def record_hit(self, prefix=None):
         """Record cache hit"""
-        self.metrics['hits'] += 1
+        self.stats.record(prefix, 'hits')
         
-    def record_miss(self):
+    def record_miss(self, prefix=None):
         """Record cache miss"""
-        self.metrics['misses'] += 1
+        self.stats.record(prefix, 'misses')
         
-    def record_invalidation(self):
+    def record_invalidation(self, prefix=None):
         """Record cache invalidation"""
-        self.metrics['invalidations'] += 1
+        self.stats.record(prefix, 'invalidations')
         
-    def record_error(self):
+    def record_error(self, prefix=None):
         """Record cache error"""
-        self.metrics['errors'] += 1
+        self.stats.record(prefix, 'errors')
     
     def get_hit_rate(self):
         """Calculate cache hit rate"""
-        total = self.metrics['hits'] + self.metrics['misses']
+        totals = self.stats.totals()
+        total = totals['hits'] + totals['misses']
         if total == 0:
             return 0
-        return (self.metrics['hits'] / total) * 100
+        return (totals['hits'] / total) * 100
     
-    def generate_cache_key(self, prefix, *args, **kwargs):
-        """Generate consistent cache key"""
-        key_parts = [prefix]
-        
-        # Add user context if available
-        if hasattr(g, 'current_user') and current_user.is_authenticated:
-            key_parts.append(f"user_{current_user.id}")
-        
-        # Add arguments
-        for arg in args:
-            if isinstance(arg, (str, int, float)):
-                key_parts.append(str(arg))
-            else:
-                key_parts.append(hashlib.md5(str(arg).encode()).hexdigest()[:8])
-        
-        # Add keyword arguments
-        for k, v in sorted(kwargs.items()):
-            key_parts.append(f"{k}_{v}")
+    def generate_cache_key(self, prefix, args: Tuple = (), kwargs: Optional[Dict[str, Any]] = None,
+                           version: int = 1, public: bool = False) -> str:
+        """
+        Generate a canonical cache key (see cache_keys.build_cache_key)
         
-        return "_".join(key_parts)
+        Args:
+            prefix: Key namespace
+            args/kwargs: Call arguments, hashed with blake2b
+            version: Namespace version, bump when the cached shape changes
+            public: Share the entry between users; otherwise the key is
+                scoped to the current user (``anon`` when logged out)
+        """
+        scope = PUBLIC_SCOPE if public else user_scope(current_user)
+        return build_cache_key(prefix, args, kwargs, version=version, scope=scope)
     
-    def cached_route(self, timeout=300, key_prefix=None, unless=None):
+    def cached_route(self, timeout=300, key_prefix=None, unless=None, tags=None, version=1, public=False,
+                     cache_control=None):
         """
         Decorator for caching route responses
         
+        Successful GET responses are cached with a strong ETag and a
+        Last-Modified date, and conditional requests (If-None-Match /
+        If-Modified-Since) are answered with 304 Not Modified.
+        
         Args:
             timeout: Cache timeout in seconds (default 5 minutes)
             key_prefix: Custom cache key prefix
             unless: Function that returns True to skip caching
+            tags: Extra invalidation tags, e.g. [model_tag('NguoiDung')]
+            version: Key namespace version
+            public: Share responses between users; only for pages that do
+                not render anything user-specific
+            cache_control: Cache-Control header; defaults to revalidating on
+                every load ("private, no-cache", or "public, no-cache")
         """
+        if cache_control is None:
+            cache_control = 'public, no-cache' if public else 'private, no-cache'
+        
         def decorator(func):
             @wraps(func)
             def wrapper(*args, **kwargs):
@@ -198,53 +293,103 @@ class CacheManager:
                     return func(*args, **kwargs)
                 
                 # Check if caching should be skipped
-                if unless and unless():
+                if request.method not in ('GET', 'HEAD') or (unless and unless()):
                     return func(*args, **kwargs)
                 
                 # Generate cache key
                 prefix = key_prefix or f"route_{func.__name__}"
                 cache_key = self.generate_cache_key(
-                    prefix, 
-                    request.method,
-                    request.path,
-                    request.args.to_dict(),
-                    *args, 
-                    **kwargs
+                    prefix,
+                    (request.method, request.path, request.args, *args),
+                    kwargs,
+                    version=version,
+                    public=public
                 )
                 
                 try:
                     # Try to get from cache
+                    self.stats.maybe_publish(cache)
                     cached_result = cache.get(cache_key)
                     if cached_result is not None:
-                        self.record_hit()
+                        self.record_hit(prefix)
                         logger.debug(f"Cache hit for key: {cache_key}")
-                        return cached_result
+                        return self._conditional_response(cached_result, cache_control, public)
                       # Cache miss - execute function
-                    self.record_miss()
+                    self.record_miss(prefix)
                     logger.debug(f"Cache miss for key: {cache_key}")
-                    result = func(*args, **kwargs)
                     
-                    # Store in cache
-                    cache.set(cache_key, result, timeout=timeout)
-                    return result
+                    # Tag with prefix + owning user; concurrent misses wait for one render
+                    key_tags = [prefix_tag(prefix), *(tags or [])]
+                    if current_user and current_user.is_authenticated:
+                        key_tags.append(user_tag(current_user.id))
+                    result = self.single_flight.do(
+                        cache, cache_key,
+                        lambda: self._render_route(prefix, func, *args, **kwargs),
+                        lambda value: isinstance(value, CachedResponse) and
+                            self._store(cache, cache_key, value, timeout, key_tags, prefix)
+                    )
+                    return self._conditional_response(result, cache_control, public)
                     
                 except Exception as e:
-                    self.record_error()
+                    self.record_error(prefix)
                     logger.error(f"Cache error for key {cache_key}: {e}")
                     return func(*args, **kwargs)
                     
             return wrapper
         return decorator
     
-    def cached_query(self, timeout=600, key_prefix=None):
+    def cached_query(self, timeout=600, key_prefix=None, tags=None, soft_ttl=None, version=1, public=True,
+                     adaptive=True):
         """
         Decorator for caching database queries
         
         Args:
-            timeout: Cache timeout in seconds (default 10 minutes)
+            timeout: Cache timeout in seconds (default 10 minutes); with
+                soft_ttl this is the hard TTL
             key_prefix: Custom cache key prefix
+            tags: Invalidation tags, e.g. [model_tag('CaThucHanh')]
+            soft_ttl: After this many seconds the cached value is served
+                stale while it is refreshed in the background
+            version: Key namespace version
+            public: Queries are keyed by their arguments only; pass False
+                when the function reads current_user
+            adaptive: Let AdaptiveTTL move timeout (and soft_ttl with it)
+                within the configured bounds
+        
+        The wrapped function gains ``refresh(*args, **kwargs)``, which
+        recomputes and stores the value unconditionally (used by CacheWarmer).
         """
         def decorator(func):
+            prefix = key_prefix or f"query_{func.__name__}"
+            key_tags = [prefix_tag(prefix), *(tags or [])]
+            if adaptive:
+                self.adaptive_ttl.register(prefix, timeout, key_tags)
+            
+            def ttls():
+                if not adaptive:
+                    return timeout, soft_ttl
+                return self.adaptive_ttl.scaled(prefix, timeout, soft_ttl)
+            
+            def compute(*args, **kwargs):
+                value = self._timed(prefix, func, *args, **kwargs)
+                current_soft_ttl = ttls()[1]
+                if value is None or not current_soft_ttl:
+                    return value
+                return StaleEntry.wrap(value, current_soft_ttl)
+            
+            def make_key(args, kwargs):
+                return self.generate_cache_key(prefix, args, kwargs, version=version, public=public)
+            
+            def refresh_key(cache_key, *args, **kwargs):
+                cache = self.get_cache()
+                value = compute(*args, **kwargs)
+                if cache and value is not None:
+                    self._store(cache, cache_key, value, ttls()[0], key_tags, prefix)
+                return unwrap(value)
+            
+            def refresh(*args, **kwargs):
+                return refresh_key(make_key(args, kwargs), *args, **kwargs)
+            
             @wraps(func)
             def wrapper(*args, **kwargs):
                 cache = self.get_cache()
@@ -252,79 +397,146 @@ class CacheManager:
                     return func(*args, **kwargs)
                 
                 # Generate cache key
-                prefix = key_prefix or f"query_{func.__name__}"
-                cache_key = self.generate_cache_key(prefix, *args, **kwargs)
+                cache_key = make_key(args, kwargs)
                 
                 try:
                     # Try to get from cache
+                    self.stats.maybe_publish(cache)
                     cached_result = cache.get(cache_key)
                     if cached_result is not None:
-                        self.record_hit()
+                        self.record_hit(prefix)
                         logger.debug(f"Query cache hit: {cache_key}")
-                        return cached_result
-                      # Cache miss - execute query
-                    self.record_miss()
-                    logger.debug(f"Query cache miss: {cache_key}")
-                    result = func(*args, **kwargs)
+                        if isinstance(cached_result, StaleEntry) and cached_result.is_stale():
+                            self.stats.record(prefix, 'stale_hits')
+                            # Serve stale, refresh off the request thread
+                            self.refresher.schedule(
+                                current_app._get_current_object(), cache, cache_key,
+                                lambda: refresh_key(cache_key, *args, **kwargs)
+                            )
+                        return unwrap(cached_result)
                     
-                    # Store in cache
-                    cache.set(cache_key, result, timeout=timeout)
-                    return result
+                    # Cache miss - concurrent misses wait for a single recompute
+                    self.record_miss(prefix)
+                    logger.debug(f"Query cache miss: {cache_key}")
+                    return unwrap(self.single_flight.do(
+                        cache, cache_key,
+                        lambda: compute(*args, **kwargs),
+                        lambda value: self._store(cache, cache_key, value, ttls()[0], key_tags, prefix)
+                    ))
                     
                 except Exception as e:
-                    self.record_error()
+                    self.record_error(prefix)
                     logger.error(f"Query cache error: {e}")
                     return func(*args, **kwargs)
-                    
+            
+            wrapper.refresh = refresh
+            wrapper.cache_key_prefix = prefix
+            wrapper.cache_timeout = timeout
+            wrapper.soft_ttl = soft_ttl
+            wrapper.cache_key = lambda *args, **kwargs: make_key(args, kwargs)
             return wrapper
         return decorator
     
+    def _render_route(self, prefix, func, *args, **kwargs):
+        """Run a view; 200 responses become a CachedResponse with validators"""
+        response = make_response(self._timed(prefix, func, *args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough:
+            # Redirects, errors and streamed files are not cached
+            return response
+        body = response.get_data()
+        response.set_etag(hashlib.blake2b(body, digest_size=16).hexdigest())
+        response.headers['Last-Modified'] = http_date(time.time())
+        return CachedResponse.from_response(response)
+    
+    def _conditional_response(self, result, cache_control, public):
+        """Rebuild a cached response and answer conditional requests with 304"""
+        if not isinstance(result, CachedResponse):
+            return result
+        response = result.to_response()
+        response.headers['Cache-Control'] = cache_control
+        if not public:
+            response.vary.add('Cookie')
+        return response.make_conditional(request)
+    
+    def _timed(self, prefix, func, *args, **kwargs):
+        """Run a recompute and record its latency under prefix"""
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stats.observe_recompute(prefix, time.perf_counter() - started)
+    
+    def _store(self, cache, cache_key, value, timeout, tags, prefix=None):
+        """Store a computed value and register its invalidation tags"""
+        cache.set(cache_key, value, timeout=timeout)
+        self.tag_index.register(cache, cache_key, tags, timeout)
+        self.stats.observe_payload(prefix, value)
+    
+    def invalidate_tags(self, *tags):
+        """
+        Invalidate every cache key registered under any of the given tags
+        
+        Args:
+            tags: Tags such as model_tag('CaThucHanh') or user_tag(42)
+        """
+        cache = self.get_cache()
+        if not cache:
+            logger.warning(f"Cache not available, skipping invalidation for tags: {tags}")
+            return 0
+        
+        try:
+            removed = self.tag_index.invalidate_tags(cache, tags)
+            logger.debug(f"Invalidated {removed} keys for tags: {tags}")
+            affected = self.adaptive_ttl.prefixes_for_tags(tags)
+            for prefix in affected:
+                self.record_invalidation(prefix)
+            if not affected:
+                self.record_invalidation()
+            return removed
+        except Exception as e:
+            self.record_error()
+            logger.error(f"Cache invalidation error: {e}")
+            return 0
     
     def invalidate_pattern(self, pattern):
         """
         Invalidate cache keys matching a pattern
         
+        Only keys written through this manager (and therefore present in
+        the tag index) can be matched.
+        
         Args:
             pattern: Pattern to match (supports wildcards)
         """
         cache = self.get_cache()
         if not cache:
             logger.warning(f"Cache not available, skipping invalidation for pattern: {pattern}")
-            return
+            return 0
         
-        try:            # Flask-Caching doesn't support pattern-based deletion
-            # For now, we clear all cache as a safe fallback
-            # In production, you might want to track keys in Redis
-            if hasattr(cache, 'clear'):
-                cache.clear()
-                logger.info(f"Cleared all cache for pattern: {pattern}")
-            else:
-                logger.warning(f"Cache clear not available for pattern: {pattern}")
+        try:
+            removed = self.tag_index.invalidate_matching(cache, pattern)
+            logger.debug(f"Invalidated {removed} keys for pattern: {pattern}")
             self.record_invalidation()
+            return removed
         except Exception as e:
             self.record_error()
             logger.error(f"Cache invalidation error: {e}")
+            return 0
     
-    def invalidate_user_cache(self, user_id):
-        """Invalidate all cache entries for a specific user"""
-        patterns = [
-            f"*user_{user_id}*",
-            f"route_*user_{user_id}*",
-            f"query_*user_{user_id}*",
-            f"api_*user_{user_id}*"
-        ]
-        for pattern in patterns:
-            self.invalidate_pattern(pattern)
+    def invalidate_user_cache(self, user_id=None):
+        """Invalidate all cache entries for a specific user (all users if None)"""
+        if user_id is not None:
+            return self.invalidate_tags(user_tag(user_id))
+        
+        cache = self.get_cache()
+        if not cache:
+            return 0
+        user_tags = [tag for tag in self.tag_index.known_tags(cache) if tag.startswith('user:')]
+        return self.invalidate_tags(*user_tags) if user_tags else 0
     
     def invalidate_model_cache(self, model_name):
         """Invalidate cache entries related to a model"""
-        patterns = [
-            f"query_*{model_name.lower()}*",
-            f"api_*{model_name.lower()}*",
-            f"route_*{model_name.lower()}*"
-        ]
-        for pattern in patterns:
-            self.invalidate_pattern(pattern)
+        return self.invalidate_tags(model_tag(model_name))
     
     def clear_all_cache(self):
         """Clear all cache entries"""
@@ -332,6 +544,7 @@ class CacheManager:
         if cache and hasattr(cache, 'clear'):
             try:
                 cache.clear()
+                self.tag_index.clear(cache)
                 logger.info("All cache cleared")
             except Exception as e:
                 logger.error(f"Error clearing cache: {e}")
@@ -370,13 +583,14 @@ def get_cache_manager():
     return cache_manager
 
 # Convenience decorators
-def cached_route(timeout=300, key_prefix=None, unless=None):
+def cached_route(timeout=300, key_prefix=None, unless=None, tags=None, version=1, public=False,
+                 cache_control=None):
     """Route caching decorator"""
-    return get_cache_manager().cached_route(timeout, key_prefix, unless)
+    return get_cache_manager().cached_route(timeout, key_prefix, unless, tags, version, public, cache_control)
 
-def cached_query(timeout=600, key_prefix=None):
+def cached_query(timeout=600, key_prefix=None, tags=None, soft_ttl=None, version=1, public=True, adaptive=True):
     """Query caching decorator"""
-    return get_cache_manager().cached_query(timeout, key_prefix)
+    return get_cache_manager().cached_query(timeout, key_prefix, tags, soft_ttl, version, public, adaptive)
 
 def invalidate_user_cache(user_id=None):
     """Invalidate user-specific cache"""
@@ -390,3 +604,7 @@ def invalidate_cache(pattern):
     """Invalidate cache by pattern"""
     return get_cache_manager().invalidate_pattern(pattern)
 
+def invalidate_tags(*tags):
+    """Invalidate cache by tags"""
+    return get_cache_manager().invalidate_tags(*tags)
+
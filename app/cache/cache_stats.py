@@ -0,0 +1,289 @@
+"""
+Per-Prefix Cache Statistics
+===========================
+
+Hit/miss counters, recompute latency histograms and payload sizes for every
+``cached_query``/``cached_route`` key prefix.
+
+- Recording is lock-free: each thread writes into its own buffer; buffers
+  are only merged when a snapshot is taken. Buffers of finished threads are
+  folded into a retired total so per-request threads do not accumulate.
+- Latencies go into fixed histogram buckets, so snapshots from several
+  workers can be merged by adding bucket counts; p50/p95/p99 are estimated
+  from the merged buckets.
+- Each worker periodically publishes its snapshot to the cache backend
+  (``_stats:<worker>``) and registers that key under the ``stats:workers``
+  tag of the tag index, so workers never rewrite a shared list; the entry
+  expires with the snapshot. ``aggregate()`` merges all live workers.
+"""
+
+from typing import Any, Dict, List, Optional
+import os
+import pickle
+import threading
+import time
+import uuid
+import logging
+
+from .cache_tags import CacheTagIndex
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY_PREFIX = "_stats:"
+STATS_WORKERS_TAG = "stats:workers"
+GLOBAL_PREFIX = "_global"
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNTER_FIELDS = ('hits', 'misses', 'stale_hits', 'errors', 'invalidations')
+
+
+def _new_entry() -> Dict[str, Any]:
+    entry = {name: 0 for name in COUNTER_FIELDS}
+    entry.update({
+        'recomputes': 0,
+        'recompute_seconds': 0.0,
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        'payload_count': 0,
+        'payload_bytes': 0,
+        'payload_max': 0
+    })
+    return entry
+
+
+def merge_entries(target: Dict[str, Dict[str, Any]], source: Dict[str, Dict[str, Any]]) -> None:
+    """Add the per-prefix counters of source into target"""
+    for prefix, entry in source.items():
+        merged = target.get(prefix)
+        if merged is None:
+            merged = target[prefix] = _new_entry()
+        for name in COUNTER_FIELDS + ('recomputes', 'recompute_seconds', 'payload_count', 'payload_bytes'):
+            merged[name] += entry.get(name, 0)
+        merged['payload_max'] = max(merged['payload_max'], entry.get('payload_max', 0))
+        for i, count in enumerate(entry.get('buckets', [])):
+            merged['buckets'][i] += count
+
+
+def percentile(buckets: List[int], q: float) -> Optional[float]:
+    """Estimate a quantile from histogram bucket counts (linear within a bucket)"""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+            if i >= len(LATENCY_BUCKETS):
+                return lower
+            upper = LATENCY_BUCKETS[i]
+            return lower + (upper - lower) * ((rank - seen) / count)
+        seen += count
+    return LATENCY_BUCKETS[-1]
+
+
+def summarize(entries: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Human-readable per-prefix summary (hit rate, percentiles, sizes)"""
+    summary = {}
+    for prefix, entry in sorted(entries.items()):
+        lookups = entry['hits'] + entry['misses']
+        summary[prefix] = {
+            'hits': entry['hits'],
+            'misses': entry['misses'],
+            'stale_hits': entry['stale_hits'],
+            'errors': entry['errors'],
+            'invalidations': entry['invalidations'],
+            'hit_rate': (entry['hits'] / lookups * 100) if lookups else 0,
+            'recomputes': entry['recomputes'],
+            'recompute_seconds_total': round(entry['recompute_seconds'], 6),
+            'recompute_p50': percentile(entry['buckets'], 0.50),
+            'recompute_p95': percentile(entry['buckets'], 0.95),
+            'recompute_p99': percentile(entry['buckets'], 0.99),
+            'payload_avg_bytes': (entry['payload_bytes'] // entry['payload_count']) if entry['payload_count'] else 0,
+            'payload_max_bytes': entry['payload_max'],
+            # Time saved by hits, assuming each hit would have cost an average recompute
+            'estimated_seconds_saved': round(
+                entry['hits'] * entry['recompute_seconds'] / entry['recomputes'], 3
+            ) if entry['recomputes'] else 0
+        }
+    return summary
+
+
+class CacheStats:
+    """Per-prefix cache statistics with per-thread buffers"""
+
+    def __init__(self, publish_interval: int = 15, worker_ttl: int = 300, tag_index: Optional[CacheTagIndex] = None):
+        self.publish_interval = publish_interval
+        self.worker_ttl = worker_ttl
+        self.tag_index = tag_index or CacheTagIndex()
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._buffers = []  # [(thread, {prefix: entry})]
+        self._retired: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._last_publish = 0.0
+
+    # Recording (lock-free after the first call on a thread)
+
+    def record(self, prefix: Optional[str], field: str, amount: int = 1) -> None:
+        self._entry(prefix)[field] += amount
+
+    def observe_recompute(self, prefix: Optional[str], seconds: float) -> None:
+        entry = self._entry(prefix)
+        entry['recomputes'] += 1
+        entry['recompute_seconds'] += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                entry['buckets'][i] += 1
+                return
+        entry['buckets'][-1] += 1
+
+    def observe_payload(self, prefix: Optional[str], value: Any) -> None:
+        try:
+            size = len(value) if isinstance(value, (bytes, str)) else len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return
+        entry = self._entry(prefix)
+        entry['payload_count'] += 1
+        entry['payload_bytes'] += size
+        if size > entry['payload_max']:
+            entry['payload_max'] = size
+
+    # Snapshots
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Merged counters of this worker"""
+        with self._lock:
+            live = []
+            for thread, buffer in self._buffers:
+                if thread.is_alive():
+                    live.append((thread, buffer))
+                else:
+                    merge_entries(self._retired, buffer)
+            self._buffers = live
+
+            merged: Dict[str, Dict[str, Any]] = {}
+            merge_entries(merged, self._retired)
+            for _, buffer in live:
+                merge_entries(merged, dict(buffer))
+        return merged
+
+    def prefix_counters(self, prefix: str) -> Dict[str, int]:
+        """Counters of a single prefix (cheaper than a full snapshot)"""
+        counters = {name: 0 for name in COUNTER_FIELDS}
+        with self._lock:
+            for source in [self._retired] + [buffer for _, buffer in self._buffers]:
+                entry = source.get(prefix)
+                if entry:
+                    for name in COUNTER_FIELDS:
+                        counters[name] += entry[name]
+        return counters
+
+    def totals(self) -> Dict[str, int]:
+        """Counters summed over all prefixes"""
+        totals = {name: 0 for name in COUNTER_FIELDS}
+        for entry in self.snapshot().values():
+            for name in COUNTER_FIELDS:
+                totals[name] += entry[name]
+        return totals
+
+    def reset(self) -> None:
+        with self._lock:
+            self._retired = {}
+            for _, buffer in self._buffers:
+                buffer.clear()
+
+    # Cross-worker aggregation
+
+    def maybe_publish(self, cache) -> None:
+        """Publish this worker's snapshot if publish_interval has passed"""
+        if time.monotonic() - self._last_publish < self.publish_interval:
+            return
+        if not self._publish_lock.acquire(blocking=False):
+            return
+        try:
+            self.publish(cache)
+        finally:
+            self._publish_lock.release()
+
+    def publish(self, cache) -> None:
+        self._last_publish = time.monotonic()
+        try:
+            key = STATS_KEY_PREFIX + self.worker_id
+            cache.set(key, self.snapshot(), timeout=self.worker_ttl)
+            # Re-registering refreshes the entry's TTL along with the snapshot
+            self.tag_index.register(cache, key, [STATS_WORKERS_TAG], timeout=self.worker_ttl)
+        except Exception as e:
+            logger.warning(f"Failed to publish cache stats: {e}")
+
+    def aggregate(self, cache=None) -> Dict[str, Any]:
+        """Merged counters of every live worker (this worker always fresh)"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        merge_entries(merged, self.snapshot())
+        workers = [self.worker_id]
+
+        if cache is not None:
+            try:
+                for key in self.tag_index.keys_for_tag(cache, STATS_WORKERS_TAG):
+                    wid = key[len(STATS_KEY_PREFIX):]
+                    if wid == self.worker_id or wid in workers:
+                        continue
+                    remote = cache.get(key)
+                    if remote:
+                        merge_entries(merged, remote)
+                        workers.append(wid)
+            except Exception as e:
+                logger.warning(f"Failed to aggregate cache stats: {e}")
+
+        return {'workers': workers, 'prefixes': merged}
+
+    def _entry(self, prefix: Optional[str]) -> Dict[str, Any]:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = {}
+            with self._lock:
+                self._buffers.append((threading.current_thread(), buffer))
+        prefix = prefix or GLOBAL_PREFIX
+        entry = buffer.get(prefix)
+        if entry is None:
+            entry = buffer[prefix] = _new_entry()
+        return entry
+
+
+def render_prometheus(prefixes: Dict[str, Dict[str, Any]], namespace: str = "lab_manager_cache") -> str:
+    """Prometheus text exposition format for aggregated per-prefix stats"""
+    lines = []
+
+    def metric(name, kind, help_text):
+        lines.append(f"# HELP {namespace}_{name} {help_text}")
+        lines.append(f"# TYPE {namespace}_{name} {kind}")
+
+    def label(prefix):
+        return prefix.replace('\\', '\\\\').replace('"', '\\"')
+
+    for field in COUNTER_FIELDS:
+        metric(f"{field}_total", "counter", f"Cache {field.replace('_', ' ')} by key prefix")
+        for prefix, entry in sorted(prefixes.items()):
+            lines.append(f'{namespace}_{field}_total{{prefix="{label(prefix)}"}} {entry[field]}')
+
+    metric("recompute_seconds", "histogram", "Time spent recomputing a missed value")
+    for prefix, entry in sorted(prefixes.items()):
+        if not entry['recomputes']:
+            continue
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), entry['buckets']):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{namespace}_recompute_seconds_bucket{{prefix="{label(prefix)}",le="{le}"}} {cumulative}')
+        lines.append(f'{namespace}_recompute_seconds_sum{{prefix="{label(prefix)}"}} {entry["recompute_seconds"]}')
+        lines.append(f'{namespace}_recompute_seconds_count{{prefix="{label(prefix)}"}} {entry["recomputes"]}')
+
+    metric("payload_bytes", "summary", "Size of stored cache values")
+    for prefix, entry in sorted(prefixes.items()):
+        if not entry['payload_count']:
+            continue
+        lines.append(f'{namespace}_payload_bytes_sum{{prefix="{label(prefix)}"}} {entry["payload_bytes"]}')
+        lines.append(f'{namespace}_payload_bytes_count{{prefix="{label(prefix)}"}} {entry["payload_count"]}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,215 @@
+"""
+Cache Tag Index
+===============
+
+Key registry for selective cache invalidation.
+
+Flask-Caching cannot delete by pattern, so every key written through
+``cached_query``/``cached_route`` is registered under tags such as
+``model:cathuchanh``, ``user:42`` or ``prefix:dashboard_stats``. A write
+then deletes only the keys behind the affected tags instead of calling
+``cache.clear()``.
+
+The index lives in the cache backend itself so all workers share it
+(Redis). A tag is an append-only list of slots, one key per member, so
+registering never rewrites a shared structure::
+
+    _tag:<tag>:n          slot counter, allocated with the backend's inc (INCRBY)
+    _tag:<tag>:lo         slots up to here were invalidated or expired
+    _tag:<tag>:<slot>     one member cache key, same TTL as the member
+    _tagm:<tag>:<key>     member marker (add/SETNX) holding its slot
+
+The marker makes registration idempotent: only the worker whose ``add``
+succeeds allocates a slot. Known tags are themselves members of a
+registry tag, so ``invalidate_user_cache()`` and pattern invalidation can
+enumerate them.
+"""
+
+from fnmatch import fnmatch
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import re
+import threading
+import logging
+
+from .local_cache import raw_backend
+
+logger = logging.getLogger(__name__)
+
+TAG_KEY_PREFIX = "_tag:"
+TAG_MARKER_PREFIX = "_tagm:"
+TAG_REGISTRY = "_registry"
+COMPACT_EVERY = 256  # slots allocated between attempts to advance the floor
+
+
+def model_tag(model_name: str) -> str:
+    """Tag for keys that depend on a model"""
+    return f"model:{model_name.lower()}"
+
+
+def user_tag(user_id: Any) -> str:
+    """Tag for keys owned by a user"""
+    return f"user:{user_id}"
+
+
+def prefix_tag(prefix: str) -> str:
+    """Tag for keys sharing a key prefix"""
+    return f"prefix:{prefix}"
+
+
+class CacheTagIndex:
+    """Tag -> keys registry stored in the cache backend"""
+
+    def __init__(self):
+        # inc/add are atomic on Redis; the lock only matters for per-process
+        # backends (simple), whose inc is a get + set
+        self._lock = threading.RLock()
+
+    def register(self, cache, key: str, tags: Iterable[str], timeout: Optional[int] = None) -> None:
+        """Register a key under tags"""
+        tags = [tag for tag in set(tags) if tag]
+        if not tags:
+            return
+        backend = raw_backend(cache)
+        for tag in tags:
+            if self._add_member(backend, tag, key, timeout or 0):
+                self._add_member(backend, TAG_REGISTRY, tag, 0)
+
+    def keys_for_tag(self, cache, tag: str) -> List[str]:
+        """Get the live keys registered under a tag"""
+        return [key for _, key in self._scan(raw_backend(cache), tag)[1]]
+
+    def invalidate_tags(self, cache, tags: Iterable[str]) -> int:
+        """Delete every key under the tags; returns the number of keys deleted"""
+        backend = raw_backend(cache)
+        keys = set()
+        for tag in set(tags):
+            # Unlist first: a member registered meanwhile lists the tag again
+            self._drop_member(backend, TAG_REGISTRY, tag)
+            top, members = self._scan(backend, tag)
+            keys.update(key for _, key in members)
+            self._drop(backend, tag, members, floor=top)
+
+        self._delete_keys(cache, keys)
+        return len(keys)
+
+    def invalidate_matching(self, cache, pattern: str) -> int:
+        """Delete registered keys matching a glob pattern (fnmatch)"""
+        backend = raw_backend(cache)
+        keys = set()
+        # Every key has exactly one prefix tag, so scanning those is enough.
+        # The literal head of the pattern skips prefixes that cannot match.
+        head = re.split(r"[*?\[]", pattern, 1)[0]
+
+        for tag in self.known_tags(cache):
+            if not tag.startswith("prefix:"):
+                continue
+            prefix = tag[len("prefix:"):]
+            if not (prefix.startswith(head) or head.startswith(prefix)):
+                continue
+            matched = [(slot, key) for slot, key in self._scan(backend, tag)[1] if fnmatch(key, pattern)]
+            if matched:
+                keys.update(key for _, key in matched)
+                self._drop(backend, tag, matched)
+
+        self._delete_keys(cache, keys)
+        return len(keys)
+
+    def known_tags(self, cache) -> Dict[str, float]:
+        """Tags currently tracked"""
+        return {tag: 0 for _, tag in self._scan(raw_backend(cache), TAG_REGISTRY)[1]}
+
+    def clear(self, cache) -> None:
+        """Drop the whole index (used together with cache.clear())"""
+        backend = raw_backend(cache)
+        for tag in list(self.known_tags(cache)) + [TAG_REGISTRY]:
+            top, members = self._scan(backend, tag)
+            self._drop(backend, tag, members, floor=top)
+
+    # Slots
+
+    def _add_member(self, backend, tag: str, key: str, timeout: int) -> bool:
+        """Allocate a slot for key unless it is already registered; True if newly added"""
+        marker = self._marker(tag, key)
+        with self._lock:
+            if not backend.add(marker, 0, timeout=timeout):
+                # Already registered: the value was re-stored (refresh/SWR), so
+                # give its index entry the new TTL or it would expire first
+                slot = backend.get(marker)
+                if slot:
+                    backend.set(self._slot(tag, slot), key, timeout=timeout)
+                    backend.set(marker, slot, timeout=timeout)
+                return False
+            slot = backend.inc(self._counter(tag), 1)
+            if not slot:
+                backend.delete(marker)
+                return False
+            backend.set(self._slot(tag, slot), key, timeout=timeout)
+            backend.set(marker, slot, timeout=timeout)
+        if slot % COMPACT_EVERY == 0:
+            self._compact(backend, tag, slot)
+        return True
+
+    def _scan(self, backend, tag: str) -> Tuple[int, List[Tuple[int, str]]]:
+        """(highest allocated slot, live (slot, key) members above the floor)"""
+        top, floor = backend.get_many(self._counter(tag), self._floor(tag))
+        top = int(top or 0)
+        slots = list(range(int(floor or 0) + 1, top + 1))
+        if not slots:
+            return top, []
+        keys = backend.get_many(*[self._slot(tag, slot) for slot in slots])
+        return top, [(slot, key) for slot, key in zip(slots, keys) if key is not None]
+
+    def _drop(self, backend, tag: str, members: List[Tuple[int, str]], floor: Optional[int] = None) -> None:
+        """Forget members; floor (the scanned top) retires every slot up to it"""
+        index_keys = [self._slot(tag, slot) for slot, _ in members]
+        index_keys += [self._marker(tag, key) for _, key in members]
+        if index_keys:
+            backend.delete_many(*index_keys)
+        if floor:
+            # Slots allocated after the scan stay above the floor for the next invalidation
+            backend.set(self._floor(tag), floor, timeout=0)
+
+    def _drop_member(self, backend, tag: str, key: str) -> None:
+        slot = backend.get(self._marker(tag, key))
+        if slot:
+            self._drop(backend, tag, [(int(slot), key)])
+
+    def _compact(self, backend, tag: str, top: int) -> None:
+        """Advance the floor past the leading run of expired slots"""
+        floor = int(backend.get(self._floor(tag)) or 0)
+        slots = list(range(floor + 1, top + 1))
+        if not slots:
+            return
+        keys = backend.get_many(*[self._slot(tag, slot) for slot in slots])
+        dead = 0
+        for key in keys:
+            if key is not None:
+                break
+            dead += 1
+        if dead:
+            backend.set(self._floor(tag), floor + dead, timeout=0)
+
+    @staticmethod
+    def _counter(tag: str) -> str:
+        return f"{TAG_KEY_PREFIX}{tag}:n"
+
+    @staticmethod
+    def _floor(tag: str) -> str:
+        return f"{TAG_KEY_PREFIX}{tag}:lo"
+
+    @staticmethod
+    def _slot(tag: str, slot: int) -> str:
+        return f"{TAG_KEY_PREFIX}{tag}:{slot}"
+
+    @staticmethod
+    def _marker(tag: str, key: str) -> str:
+        return f"{TAG_MARKER_PREFIX}{tag}:{key}"
+
+    def _delete_keys(self, cache, keys) -> None:
+        if not keys:
+            return
+        if hasattr(cache, 'delete_many'):
+            cache.delete_many(*keys)
+        else:
+            for key in keys:
+                cache.delete(key)
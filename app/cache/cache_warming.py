@@ -3,15 +3,25 @@ Cache Warming and Maintenance
 ============================
 
 Strategies and utilities for cache warming, cleanup, and maintenance.
+
+Functions decorated with ``cached_query`` can also be registered for
+proactive refresh: a background loop recomputes them before they expire,
+so dashboard requests are served from cache instead of recomputing.
 """
 
 from app.cache.cached_queries import (
     get_dashboard_statistics, get_total_users, get_total_sessions,
-    get_activities_today, get_system_settings, get_recent_activities
+    get_activities_today, get_system_settings, get_recent_activities,
+    get_active_users_count, get_recent_users,
+    get_active_sessions_count, get_sessions_today, get_sessions_by_status,
+    get_activities_by_type
 )
-from app.cache.cache_manager import cache_manager
+from app.cache.cache_manager import get_cache_manager
+from app.cache.cache_counters import reconcile_counters
 from flask import current_app
 from datetime import datetime, timedelta
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,10 +29,98 @@ logger = logging.getLogger(__name__)
 class CacheWarmer:
     """Cache warming and maintenance utility"""
     
+    # Proactive refresh registry shared by all warmers:
+    # {name: {'func', 'args', 'kwargs', 'interval', 'next_run'}}
+    _refresh_registry = {}
+    _registry_lock = threading.Lock()
+    _refresh_thread = None
+    
     def __init__(self):
         self.warmed_keys = []
         self.failed_keys = []
     
+    @classmethod
+    def register_refresh(cls, func, *args, interval=None, **kwargs):
+        """
+        Register a cached_query function for proactive refresh
+        
+        Args:
+            func: Function decorated with cached_query (must expose .refresh)
+            interval: Seconds between refreshes; defaults to the soft TTL, or
+                80% of the timeout so the value is replaced before it expires
+        """
+        if not hasattr(func, 'refresh'):
+            raise ValueError(f"{func.__name__} is not decorated with cached_query")
+        
+        if interval is None:
+            interval = func.soft_ttl or int(func.cache_timeout * 0.8)
+        
+        name = func.cache_key(*args, **kwargs)
+        with cls._registry_lock:
+            cls._refresh_registry[name] = {
+                'func': func,
+                'args': args,
+                'kwargs': kwargs,
+                'interval': max(1, int(interval)),
+                'next_run': 0
+            }
+        return name
+    
+    def refresh_registered(self, force=False):
+        """Refresh registered functions that are due (or all if force)"""
+        now = time.monotonic()
+        with self._registry_lock:
+            due = [(name, entry) for name, entry in self._refresh_registry.items()
+                   if force or entry['next_run'] <= now]
+            for _, entry in due:
+                entry['next_run'] = now + entry['interval']
+        
+        refreshed = []
+        for name, entry in due:
+            try:
+                entry['func'].refresh(*entry['args'], **entry['kwargs'])
+                refreshed.append(name)
+                self.warmed_keys.append(name)
+            except Exception as e:
+                logger.error(f"Proactive refresh failed for {name}: {str(e)}")
+                self.failed_keys.append(name)
+        return refreshed
+    
+    @classmethod
+    def start_background_refresh(cls, app, tick=5):
+        """
+        Start the daemon thread that runs refresh_registered every tick
+        
+        The same loop reconciles the dashboard counters every
+        CACHE_COUNTER_RECONCILE_INTERVAL seconds (0 disables it).
+        """
+        if cls._refresh_thread is not None:
+            return cls._refresh_thread
+        
+        reconcile_interval = app.config.get('CACHE_COUNTER_RECONCILE_INTERVAL', 900)
+        
+        def loop():
+            warmer = cls()
+            next_reconcile = time.monotonic() + reconcile_interval
+            while True:
+                try:
+                    with app.app_context():
+                        warmer.refresh_registered()
+                        if reconcile_interval and time.monotonic() >= next_reconcile:
+                            next_reconcile = time.monotonic() + reconcile_interval
+                            reconcile_counters()
+                except Exception as e:
+                    logger.error(f"Background cache refresh loop error: {str(e)}")
+                # Keep the report bounded on a long-running loop
+                warmer.warmed_keys = []
+                warmer.failed_keys = []
+                time.sleep(tick)
+        
+        cls._refresh_thread = threading.Thread(target=loop, daemon=True, name='cache-warmer')
+        cls._refresh_thread.start()
+        logger.info(f"Background cache refresh started for {len(cls._refresh_registry)} functions")
+        return cls._refresh_thread
+    
     def warm_dashboard_caches(self):
         """Warm up dashboard-related caches"""
         try:
@@ -180,6 +278,20 @@ def schedule_cache_warming():
         logger.error(f"Scheduled cache warming failed: {str(e)}")
         return False, {'error': str(e)}
 
+def register_dashboard_refreshers():
+    """Register the admin dashboard queries for proactive refresh"""
+    # Counter-backed functions (totals, by role, activities today) need no refresh
+    for func in (get_active_users_count, get_recent_users,
+                 get_active_sessions_count, get_sessions_today,
+                 get_sessions_by_status, get_recent_activities,
+                 get_activities_by_type, get_dashboard_statistics):
+        CacheWarmer.register_refresh(func)
+
+def start_background_refresh(app, tick=5):
+    """Register dashboard refreshers and start the background refresh loop"""
+    register_dashboard_refreshers()
+    return CacheWarmer.start_background_refresh(app, tick)
+
 def intelligent_cache_invalidation(model_name, operation, record_id=None):
     """
     Intelligent cache invalidation based on model changes
@@ -200,7 +312,7 @@ def intelligent_cache_invalidation(model_name, operation, record_id=None):
         if model_name in ['nguoidung', 'user']:
             invalidate_user_caches()
             if record_id:
-                cache_manager.invalidate_user_cache(record_id)
+                get_cache_manager().invalidate_user_cache(record_id)
                 
         elif model_name in ['cathuchanh', 'labsession']:
             invalidate_session_caches()
@@ -208,12 +320,12 @@ def intelligent_cache_invalidation(model_name, operation, record_id=None):
         elif model_name in ['nhatkyhoatdong', 'activitylog']:
             invalidate_activity_caches()
             
-        elif model_name in ['caidatheThong', 'systemsetting']:
+        elif model_name in ['caidathethong', 'systemsetting']:
             invalidate_system_caches()
         
         # Always invalidate dashboard stats for significant changes
         if operation in ['create', 'delete']:
-            cache_manager.invalidate_pattern('dashboard_stats*')
+            get_cache_manager().invalidate_pattern('dashboard_stats*')
         
         logger.info(f"Intelligent cache invalidation completed for {model_name} {operation}")
         
@@ -7,38 +7,51 @@ These functions provide caching for expensive database operations.
 """
 
 from app.models import NguoiDung, CaThucHanh, NhatKyHoatDong, CaiDatHeThong, SinhVien, db
-from app.cache.cache_manager import cached_query, invalidate_model_cache
-from datetime import datetime, timedelta
+from app.cache.cache_manager import cached_query, invalidate_model_cache, invalidate_tags
+from app.cache.cache_tags import model_tag
+from app.cache.cache_counters import dashboard_counters
+from app.date_windows import today, last_hours, last_days
+from datetime import datetime
 from sqlalchemy import func, desc
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Plain counts (totals, by role/class, activities today) are read from
+# event-maintained counters (see cache_counters) instead of scanning tables.
+
+# Cached queries recompute on the primary, never with read_from_replica: the
+# recompute right after an invalidation would read a lagging replica and cache
+# the pre-write value for the whole TTL. Uncached reports use the replica.
+
+# Dashboard queries use soft_ttl = the advertised cache period and a hard TTL
+# of twice that: past the soft TTL the stale value is served while it is
+# refreshed in the background, so dashboards do not block on recomputes.
+
+# Invalidation tags per model (see cache_tags)
+USER_TAGS = [model_tag('NguoiDung')]
+SESSION_TAGS = [model_tag('CaThucHanh')]
+ACTIVITY_TAGS = [model_tag('NhatKyHoatDong')]
+SETTING_TAGS = [model_tag('CaiDatHeThong')]
+STUDENT_TAGS = [model_tag('SinhVien')]
+
 # User-related cached queries
-@cached_query(timeout=600, key_prefix="user_count")
 def get_total_users():
-    """Get total number of users (cached for 10 minutes)"""
-    return NguoiDung.query.count()
+    """Get total number of users (event-maintained counter)"""
+    return dashboard_counters.total('users')
 
-@cached_query(timeout=300, key_prefix="active_users")
+@cached_query(timeout=600, soft_ttl=300, key_prefix="active_users", tags=USER_TAGS)
 def get_active_users_count(hours=24):
-    """Get count of users active in last N hours (cached for 5 minutes)"""
-    cutoff = datetime.utcnow() - timedelta(hours=hours)
-    return NguoiDung.query.filter(NguoiDung.last_seen >= cutoff).count()
+    """Get count of users active in last N hours (soft TTL 5 min, hard 10 min)"""
+    return NguoiDung.query.filter(last_hours(hours).filter(NguoiDung.last_seen)).count()
 
-@cached_query(timeout=900, key_prefix="users_by_role")
 def get_users_by_role():
-    """Get user count by role (cached for 15 minutes)"""
-    result = db.session.query(
-        NguoiDung.vai_tro,
-        func.count(NguoiDung.id).label('count')
-    ).group_by(NguoiDung.vai_tro).all()
-    
-    return {role: count for role, count in result}
+    """Get user count by role (event-maintained counter)"""
+    return dashboard_counters.by_group('users')
 
-@cached_query(timeout=1200, key_prefix="recent_users")
+@cached_query(timeout=2400, soft_ttl=1200, key_prefix="recent_users", tags=USER_TAGS)
 def get_recent_users(limit=10):
-    """Get recently created users (cached for 20 minutes)"""
+    """Get recently created users (soft TTL 20 min, hard 40 min)"""
     users = NguoiDung.query.order_by(desc(NguoiDung.ngay_tao)).limit(limit).all()
     return [{
         'id': user.id,
@@ -49,27 +62,23 @@ def get_recent_users(limit=10):
     } for user in users]
 
 # Lab session related cached queries
-@cached_query(timeout=300, key_prefix="session_count")
 def get_total_sessions():
-    """Get total number of lab sessions (cached for 5 minutes)"""
-    return CaThucHanh.query.count()
+    """Get total number of lab sessions (event-maintained counter)"""
+    return dashboard_counters.total('sessions')
 
-@cached_query(timeout=180, key_prefix="active_sessions")
+@cached_query(timeout=360, soft_ttl=180, key_prefix="active_sessions", tags=SESSION_TAGS)
 def get_active_sessions_count():
-    """Get count of currently active lab sessions (cached for 3 minutes)"""
+    """Get count of currently active lab sessions (soft TTL 3 min, hard 6 min)"""
     now = datetime.utcnow()
     return CaThucHanh.query.filter(
         CaThucHanh.gio_bat_dau <= now,
         CaThucHanh.gio_ket_thuc >= now
     ).count()
 
-@cached_query(timeout=600, key_prefix="sessions_today")
+@cached_query(timeout=1200, soft_ttl=600, key_prefix="sessions_today", tags=SESSION_TAGS)
 def get_sessions_today():
-    """Get lab sessions for today (cached for 10 minutes)"""
-    today = datetime.utcnow().date()
-    sessions = CaThucHanh.query.filter(
-        func.date(CaThucHanh.gio_bat_dau) == today
-    ).all()
+    """Get lab sessions for today (soft TTL 10 min, hard 20 min)"""
+    sessions = CaThucHanh.query.filter(today().filter(CaThucHanh.gio_bat_dau)).all()
     
     return [{
         'id': session.id,
@@ -79,9 +88,9 @@ def get_sessions_today():
         'trang_thai': getattr(session, 'trang_thai', 'unknown')
     } for session in sessions]
 
-@cached_query(timeout=1800, key_prefix="sessions_by_status")
+@cached_query(timeout=3600, soft_ttl=1800, key_prefix="sessions_by_status", tags=SESSION_TAGS)
 def get_sessions_by_status():
-    """Get session count by status (cached for 30 minutes)"""
+    """Get session count by status (soft TTL 30 min, hard 60 min)"""
     # Assuming status logic based on time
     now = datetime.utcnow()
     
@@ -100,9 +109,9 @@ def get_sessions_by_status():
     }
 
 # Activity log cached queries
-@cached_query(timeout=120, key_prefix="recent_activities")
+@cached_query(timeout=240, soft_ttl=120, key_prefix="recent_activities", tags=ACTIVITY_TAGS + USER_TAGS)
 def get_recent_activities(limit=20):
-    """Get recent activity log entries (cached for 2 minutes)"""
+    """Get recent activity log entries (soft TTL 2 min, hard 4 min)"""
     activities = NhatKyHoatDong.query.order_by(desc(NhatKyHoatDong.thoi_gian)).limit(limit).all()
     
     return [{
@@ -114,61 +123,51 @@ def get_recent_activities(limit=20):
         'nguoi_dung_ten': activity.nguoi_dung.ten_nguoi_dung if activity.nguoi_dung else 'Unknown'
     } for activity in activities]
 
-@cached_query(timeout=900, key_prefix="activities_today")
 def get_activities_today():
-    """Get activity count for today (cached for 15 minutes)"""
-    today = datetime.utcnow().date()
-    return NhatKyHoatDong.query.filter(
-        func.date(NhatKyHoatDong.thoi_gian) == today
-    ).count()
+    """Get activity count for today (event-maintained counter)"""
+    return dashboard_counters.day('activities')
 
-@cached_query(timeout=1800, key_prefix="activities_by_type")
+@cached_query(timeout=3600, soft_ttl=1800, key_prefix="activities_by_type", tags=ACTIVITY_TAGS)
 def get_activities_by_type(days=7):
-    """Get activity count by type for last N days (cached for 30 minutes)"""
-    cutoff = datetime.utcnow() - timedelta(days=days)
-    
+    """Get activity count by type for last N days (soft TTL 30 min, hard 60 min)"""
     result = db.session.query(
         NhatKyHoatDong.hanh_dong,
         func.count(NhatKyHoatDong.id).label('count')
     ).filter(
-        NhatKyHoatDong.thoi_gian >= cutoff
+        last_days(days).filter(NhatKyHoatDong.thoi_gian)
     ).group_by(NhatKyHoatDong.hanh_dong).all()
     
     return {activity_type: count for activity_type, count in result}
 
 # System settings cached queries
-@cached_query(timeout=3600, key_prefix="system_settings")
+@cached_query(timeout=3600, key_prefix="system_settings", tags=SETTING_TAGS)
 def get_system_settings():
     """Get all system settings (cached for 1 hour)"""
     settings = CaiDatHeThong.query.all()
     return {setting.khoa: setting.gia_tri for setting in settings}
 
-@cached_query(timeout=3600, key_prefix="system_setting")
+@cached_query(timeout=3600, key_prefix="system_setting", tags=SETTING_TAGS)
 def get_system_setting(key, default=None):
     """Get specific system setting (cached for 1 hour)"""
     setting = CaiDatHeThong.query.filter_by(khoa=key).first()
     return setting.value if setting else default
 
 # Student related cached queries
-@cached_query(timeout=600, key_prefix="student_count")
 def get_total_students():
-    """Get total number of students (cached for 10 minutes)"""
-    return SinhVien.query.count()
+    """Get total number of students (event-maintained counter)"""
+    return dashboard_counters.total('students')
 
-@cached_query(timeout=900, key_prefix="students_by_class")
 def get_students_by_class():
-    """Get student count by class (cached for 15 minutes)"""
-    result = db.session.query(
-        SinhVien.lop,
-        func.count(SinhVien.id).label('count')
-    ).group_by(SinhVien.lop).all()
-    
-    return {class_name or 'Unassigned': count for class_name, count in result}
+    """Get student count by class (event-maintained counter)"""
+    result = {}
+    for class_name, count in dashboard_counters.by_group('students').items():
+        result[class_name or 'Unassigned'] = result.get(class_name or 'Unassigned', 0) + count
+    return result
 
 # Dashboard statistics cached queries
-@cached_query(timeout=300, key_prefix="dashboard_stats")
+@cached_query(timeout=600, soft_ttl=300, key_prefix="dashboard_stats", tags=USER_TAGS + SESSION_TAGS + ACTIVITY_TAGS + STUDENT_TAGS)
 def get_dashboard_statistics():
-    """Get comprehensive dashboard statistics (cached for 5 minutes)"""
+    """Get comprehensive dashboard statistics (soft TTL 5 min, hard 10 min)"""
     return {
         'users': {
             'total': get_total_users(),
@@ -194,59 +193,27 @@ def get_dashboard_statistics():
     }
 
 # Cache invalidation helpers
+# Each helper drops only the keys tagged with its model; dashboard_stats is
+# tagged with every model it aggregates, so it goes along automatically.
 def invalidate_user_caches():
     """Invalidate all user-related caches"""
-    patterns = [
-        "user_count*",
-        "active_users*", 
-        "users_by_role*",
-        "recent_users*",
-        "dashboard_stats*"
-    ]
-    for pattern in patterns:
-        invalidate_model_cache(pattern)
+    invalidate_model_cache('NguoiDung')
 
 def invalidate_session_caches():
-    """Invalidate all session-related caches"""
-    patterns = [
-        "session_count*",
-        "active_sessions*",
-        "sessions_today*",
-        "sessions_by_status*",
-        "dashboard_stats*"
-    ]
-    for pattern in patterns:
-        invalidate_model_cache(pattern)
+    """Invalidate all session-related caches (sessions and their registrations)"""
+    invalidate_tags(model_tag('CaThucHanh'), model_tag('DangKyCa'))
 
 def invalidate_activity_caches():
     """Invalidate all activity-related caches"""
-    patterns = [
-        "recent_activities*",
-        "activities_today*",
-        "activities_by_type*",
-        "dashboard_stats*"
-    ]
-    for pattern in patterns:
-        invalidate_model_cache(pattern)
+    invalidate_model_cache('NhatKyHoatDong')
 
 def invalidate_student_caches():
     """Invalidate all student-related caches"""
-    patterns = [
-        "student_count*",
-        "students_by_class*",
-        "dashboard_stats*"
-    ]
-    for pattern in patterns:
-        invalidate_model_cache(pattern)
+    invalidate_model_cache('SinhVien')
 
 def invalidate_system_caches():
     """Invalidate all system-related caches"""
-    patterns = [
-        "system_settings*",
-        "system_setting*"
-    ]
-    for pattern in patterns:
-        invalidate_model_cache(pattern)
+    invalidate_model_cache('CaiDatHeThong')
 
 def invalidate_all_caches():
     """Invalidate all cached data - use with caution as this clears all caches"""
@@ -259,9 +226,8 @@ def invalidate_all_caches():
         invalidate_system_caches()
         
         # Also try to clear all cache using cache manager
-        from app.cache.cache_manager import cache_manager
-        if hasattr(cache_manager, 'clear_all_cache'):
-            cache_manager.clear_all_cache()
+        from app.cache.cache_manager import get_cache_manager
+        get_cache_manager().clear_all_cache()
         
         logger.info("All caches invalidated successfully")
         return True
@@ -0,0 +1,252 @@
+"""
+Two-Tier Cache
+==============
+
+Per-process LRU (L1) in front of the shared Flask-Caching backend (L2).
+
+- L1 is bounded by entry count and by serialized bytes, and every entry
+  carries its own TTL (never longer than ``CACHE_L1_TTL``).
+- Values are kept pickled so callers never share mutable objects, the
+  same guarantee the simple/redis backends give.
+- Deletes and clears are broadcast to other workers over Redis pub/sub
+  when the backend is Redis; otherwise the short L1 TTL bounds staleness.
+- Internal keys (``_`` prefix, e.g. the tag index and counters) bypass L1
+  because they are shared between workers and updated in place.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "lab_manager:l1_invalidate"
+
+
+class LocalLRUCache:
+    """Thread-safe bounded LRU with per-entry TTL and byte accounting"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024, default_ttl: int = 30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (expires_at, payload bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+        return pickle.loads(payload)
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        try:
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return False
+        if len(payload) > self.max_bytes:
+            return False
+
+        ttl = min(ttl, self.default_ttl) if ttl else self.default_ttl
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, payload)
+            self._bytes += len(payload)
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+    def _remove(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+
+class TieredCache:
+    """
+    Cache facade: L1 (LocalLRUCache) then L2 (Flask-Caching instance).
+
+    Exposes the subset of the Flask-Caching API used by CacheManager, so it
+    can be returned from ``CacheManager.get_cache()`` transparently.
+    """
+
+    def __init__(self, backend, local: LocalLRUCache):
+        self.backend = backend
+        self.local = local
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.metrics = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0}
+        self._metrics_lock = threading.Lock()
+        self._redis = None
+        self._listener = None
+
+    @property
+    def cache(self):
+        """Underlying backend object (mirrors Flask-Caching's ``Cache.cache``)"""
+        return getattr(self.backend, 'cache', None)
+
+    def get(self, key: str) -> Any:
+        if self._bypass_l1(key):
+            return self.backend.get(key)
+
+        value = self.local.get(key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+
+        value = self.backend.get(key)
+        if value is None:
+            self._count('misses')
+            return None
+
+        self._count('l2_hits')
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> Any:
+        result = self.backend.set(key, value, timeout=timeout)
+        if self._bypass_l1(key):
+            return result
+        # Other workers may hold an older copy in their L1
+        self.local.set(key, value, timeout)
+        self._publish(keys=[key])
+        return result
+
+    def delete(self, key: str) -> Any:
+        self.local.delete(key)
+        if not self._bypass_l1(key):
+            self._publish(keys=[key])
+        return self.backend.delete(key)
+
+    def delete_many(self, *keys) -> Any:
+        for key in keys:
+            self.local.delete(key)
+        public_keys = [key for key in keys if not self._bypass_l1(key)]
+        if public_keys:
+            self._publish(keys=public_keys)
+        return self.backend.delete_many(*keys)
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        # Only used for internal lease keys, which never live in L1
+        return self.backend.add(key, value, timeout=timeout)
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def clear(self) -> Any:
+        self.local.clear()
+        self._publish(clear=True)
+        return self.backend.clear()
+
+    def get_l1_metrics(self) -> Dict[str, Any]:
+        """Separate L1/L2 hit rates plus L1 occupancy"""
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        total = metrics['l1_hits'] + metrics['l2_hits'] + metrics['misses']
+        l2_lookups = metrics['l2_hits'] + metrics['misses']
+        return {
+            'l1_hits': metrics['l1_hits'],
+            'l2_hits': metrics['l2_hits'],
+            'misses': metrics['misses'],
+            'l1_hit_rate': (metrics['l1_hits'] / total * 100) if total else 0,
+            'l2_hit_rate': (metrics['l2_hits'] / l2_lookups * 100) if l2_lookups else 0,
+            'l1': self.local.stats(),
+            'cross_worker_invalidation': self._redis is not None
+        }
+
+    def enable_cross_worker_invalidation(self, redis_client) -> None:
+        """Subscribe to L1 invalidation messages published by other workers"""
+        if self._listener is not None or redis_client is None:
+            return
+        self._redis = redis_client
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+        logger.info(f"L1 cross-worker invalidation enabled for worker {self.worker_id}")
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    self._handle_message(message.get('data'))
+            except Exception as e:
+                logger.warning(f"L1 invalidation listener error: {e}")
+                time.sleep(5)
+
+    def _handle_message(self, data) -> None:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get('origin') == self.worker_id:
+            return
+        if message.get('clear'):
+            self.local.clear()
+        for key in message.get('keys', []):
+            self.local.delete(key)
+
+    def _publish(self, keys=None, clear: bool = False) -> None:
+        if self._redis is None:
+            return
+        try:
+            self._redis.publish(INVALIDATION_CHANNEL, json.dumps({
+                'origin': self.worker_id,
+                'keys': keys or [],
+                'clear': clear
+            }))
+        except Exception as e:
+            logger.warning(f"Failed to publish L1 invalidation: {e}")
+
+    def _count(self, name: str) -> None:
+        with self._metrics_lock:
+            self.metrics[name] += 1
+
+    @staticmethod
+    def _bypass_l1(key: str) -> bool:
+        return key.startswith('_')
+
+
+def raw_backend(cache):
+    """Innermost backend object (cachelib) under the Tiered/Codec/Flask-Caching facades
+
+    Its ``inc``/``add``/``get_many`` are the atomic primitives (INCRBY/SETNX on
+    Redis). Only use it for internal ``_`` keys, which the facades pass through.
+    """
+    return getattr(cache, 'cache', None) or cache
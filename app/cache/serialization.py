@@ -0,0 +1,274 @@
+"""
+Cache Serialization
+===================
+
+Compact encoding for values stored in the shared cache backend.
+
+``CodecCache`` wraps the Flask-Caching instance and stores every public key
+as ``MAGIC + flags + payload`` bytes:
+
+- serializer: pickle (default) or msgpack when installed
+  (``CACHE_SERIALIZER=msgpack``); values msgpack cannot represent fall back
+  to pickle per entry.
+- Flask ``Response`` objects are reduced to ``(body, status, headers)``
+  instead of pickling the whole object, and read back as ``CachedResponse``
+  so ``cached_route`` applies the same conditional handling on L1 and L2 hits.
+- payloads above ``CACHE_COMPRESS_THRESHOLD`` bytes are compressed with
+  zlib, or lz4 when installed and ``CACHE_COMPRESSION=lz4``.
+- entries larger than ``CACHE_MAX_VALUE_BYTES`` after compression are
+  refused (``set`` returns False) instead of evicting half the cache.
+
+Internal ``_`` keys (tag index, counters, leases) are passed through
+untouched so backend ``inc`` keeps working. Values written before the codec
+was enabled are returned as they are.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+import pickle
+import threading
+import zlib
+import logging
+
+from .stale_refresh import StaleEntry
+
+# Optional fast codecs
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LMC"
+
+SERIALIZER_PICKLE = 0
+SERIALIZER_MSGPACK = 1
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZ4 = 2
+
+# msgpack extension type codes
+EXT_STALE = 1
+EXT_DATETIME = 2
+EXT_DATE = 3
+EXT_RESPONSE = 4
+EXT_TUPLE = 5
+
+
+class CachedResponse:
+    """Compact stand-in for a Flask Response: body, status and headers"""
+
+    __slots__ = ('body', 'status', 'headers')
+
+    def __init__(self, body: bytes, status: int, headers):
+        self.body = body
+        self.status = status
+        self.headers = headers
+
+    def __getstate__(self):
+        return (self.body, self.status, self.headers)
+
+    def __setstate__(self, state):
+        self.body, self.status, self.headers = state
+
+    @classmethod
+    def from_response(cls, response) -> 'CachedResponse':
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ('content-length', 'set-cookie')]
+        return cls(response.get_data(), response.status_code, headers)
+
+    def to_response(self):
+        from flask import current_app
+        return current_app.response_class(self.body, status=self.status, headers=self.headers)
+
+
+def _is_response(value) -> bool:
+    return hasattr(value, 'get_data') and hasattr(value, 'status_code') and hasattr(value, 'headers')
+
+
+class CacheCodec:
+    """Serialize + compress + size-check cache values"""
+
+    def __init__(self, serializer: str = 'pickle', compression: str = 'zlib',
+                 compress_threshold: int = 1024, max_size: int = 1024 * 1024):
+        if serializer == 'msgpack' and msgpack is None:
+            logger.warning("CACHE_SERIALIZER=msgpack but msgpack is not installed, using pickle")
+            serializer = 'pickle'
+        if compression == 'lz4' and lz4_frame is None:
+            logger.warning("CACHE_COMPRESSION=lz4 but lz4 is not installed, using zlib")
+            compression = 'zlib'
+        self.serializer = SERIALIZER_MSGPACK if serializer == 'msgpack' else SERIALIZER_PICKLE
+        self.compression = {'none': COMPRESSION_NONE, 'lz4': COMPRESSION_LZ4}.get(compression, COMPRESSION_ZLIB)
+        self.compress_threshold = compress_threshold
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self.metrics = {'encoded': 0, 'compressed': 0, 'oversized': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+
+    def encode(self, value: Any) -> Optional[bytes]:
+        """Encoded bytes, or None if the entry exceeds max_size"""
+        if _is_response(value):
+            value = CachedResponse.from_response(value)
+
+        serializer, payload = self._serialize(value)
+        raw_size = len(payload)
+
+        compression = COMPRESSION_NONE
+        if self.compression != COMPRESSION_NONE and raw_size >= self.compress_threshold:
+            compressed = self._compress(payload)
+            if len(compressed) < raw_size:
+                payload, compression = compressed, self.compression
+
+        data = MAGIC + bytes([serializer << 4 | compression]) + payload
+        with self._lock:
+            if self.max_size and len(data) > self.max_size:
+                self.metrics['oversized'] += 1
+                return None
+            self.metrics['encoded'] += 1
+            self.metrics['raw_bytes'] += raw_size
+            self.metrics['stored_bytes'] += len(data)
+            if compression:
+                self.metrics['compressed'] += 1
+        return data
+
+    def decode(self, data: Any) -> Any:
+        if not isinstance(data, bytes) or not data.startswith(MAGIC) or len(data) <= len(MAGIC):
+            return data  # written before the codec was enabled
+        flags = data[len(MAGIC)]
+        payload = data[len(MAGIC) + 1:]
+        compression = flags & 0x0F
+        if compression == COMPRESSION_ZLIB:
+            payload = zlib.decompress(payload)
+        elif compression == COMPRESSION_LZ4:
+            payload = lz4_frame.decompress(payload)
+
+        if flags >> 4 == SERIALIZER_MSGPACK:
+            value = _unpackb(payload)
+        else:
+            value = pickle.loads(payload)
+        # Responses stay CachedResponse: cached_route adds the validators and headers
+        return value
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics['compression_ratio'] = (metrics['stored_bytes'] / metrics['raw_bytes']) if metrics['raw_bytes'] else 0
+        metrics['serializer'] = 'msgpack' if self.serializer == SERIALIZER_MSGPACK else 'pickle'
+        metrics['max_size'] = self.max_size
+        return metrics
+
+    def _serialize(self, value: Any) -> Tuple[int, bytes]:
+        if self.serializer == SERIALIZER_MSGPACK:
+            try:
+                return SERIALIZER_MSGPACK, _packb(value)
+            except (TypeError, ValueError, OverflowError):
+                pass  # unsupported type somewhere inside: pickle this entry
+        return SERIALIZER_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _compress(self, payload: bytes) -> bytes:
+        if self.compression == COMPRESSION_LZ4:
+            return lz4_frame.compress(payload)
+        return zlib.compress(payload, 1)
+
+
+def _packb(value) -> bytes:
+    # strict_types routes tuples (and dict/list subclasses) through _ext_default
+    return msgpack.packb(value, default=_ext_default, use_bin_type=True, strict_types=True)
+
+
+def _unpackb(data: bytes):
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def _ext_default(obj):
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(EXT_TUPLE, _packb(list(obj)))
+    if isinstance(obj, StaleEntry):
+        return msgpack.ExtType(EXT_STALE, _packb([obj.value, obj.soft_expires_at]))
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, CachedResponse):
+        return msgpack.ExtType(EXT_RESPONSE, _packb([obj.body, obj.status, [list(h) for h in obj.headers]]))
+    raise TypeError(f"Cannot msgpack {type(obj).__name__}")
+
+
+def _ext_hook(code, data):
+    if code == EXT_TUPLE:
+        return tuple(_unpackb(data))
+    if code == EXT_STALE:
+        value, soft_expires_at = _unpackb(data)
+        return StaleEntry(value, soft_expires_at)
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == EXT_RESPONSE:
+        body, status, headers = _unpackb(data)
+        return CachedResponse(body, status, [tuple(header) for header in headers])
+    return msgpack.ExtType(code, data)
+
+
+class CodecCache:
+    """Cache facade that encodes public keys with a CacheCodec"""
+
+    def __init__(self, backend, codec: CacheCodec):
+        self.backend = backend
+        self.codec = codec
+
+    @property
+    def cache(self):
+        """Underlying backend object (mirrors Flask-Caching's ``Cache.cache``)"""
+        return getattr(self.backend, 'cache', None)
+
+    def get(self, key: str) -> Any:
+        value = self.backend.get(key)
+        if value is None or self._bypass(key):
+            return value
+        try:
+            return self.codec.decode(value)
+        except Exception as e:
+            logger.warning(f"Undecodable cache entry {key}: {e}")
+            return None
+
+    def get_many(self, *keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> Any:
+        if self._bypass(key):
+            return self.backend.set(key, value, timeout=timeout)
+        data = self.codec.encode(value)
+        if data is None:
+            logger.warning(f"Refusing to cache oversized value for {key}")
+            self.backend.delete(key)
+            return False
+        return self.backend.set(key, data, timeout=timeout)
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        if self._bypass(key):
+            return self.backend.add(key, value, timeout=timeout)
+        data = self.codec.encode(value)
+        if data is None:
+            return False
+        return self.backend.add(key, data, timeout=timeout)
+
+    def delete(self, key: str) -> Any:
+        return self.backend.delete(key)
+
+    def delete_many(self, *keys) -> Any:
+        return self.backend.delete_many(*keys)
+
+    def has(self, key: str) -> bool:
+        return self.backend.has(key)
+
+    def clear(self) -> Any:
+        return self.backend.clear()
+
+    @staticmethod
+    def _bypass(key: str) -> bool:
+        return key.startswith('_')
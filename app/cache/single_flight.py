@@ -0,0 +1,122 @@
+"""
+Single-Flight Recompute
+=======================
+
+Dogpile protection for ``cached_query``/``cached_route``.
+
+When a hot key expires only one caller recomputes it:
+
+- Within a process, callers for the same key queue on a per-key lock and
+  re-read the cache once the first caller has stored the fresh value.
+- Across workers, the first caller takes a short lease key in the shared
+  backend (``cache.add`` is atomic on Redis); other workers poll the cache
+  until the value appears or the lease disappears.
+
+If waiting exceeds ``wait_timeout`` the caller recomputes itself, so a
+stuck worker can never block requests indefinitely.
+"""
+
+from typing import Any, Callable, Dict, List
+import os
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY_PREFIX = "_lease:"
+
+
+class SingleFlight:
+    """Per-key request coalescing with a cross-worker lease"""
+
+    def __init__(self, lease_timeout: int = 30, wait_timeout: float = 10.0, poll_interval: float = 0.05):
+        self.lease_timeout = lease_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._guard = threading.Lock()
+        self._slots: Dict[str, List] = {}  # key -> [lock, waiters]
+        self.metrics = {'leaders': 0, 'coalesced': 0, 'wait_timeouts': 0}
+
+    def do(self, cache, key: str, compute: Callable[[], Any], store: Callable[[Any], None]) -> Any:
+        """Return the cached value for key, computing it at most once"""
+        slot = self._acquire_slot(key)
+        lock = slot[0]
+        locked = lock.acquire(timeout=self.wait_timeout)
+        try:
+            if not locked:
+                self._count('wait_timeouts')
+                return self._compute_and_store(compute, store)
+
+            # Another thread may have filled the key while we waited
+            value = cache.get(key)
+            if value is not None:
+                self._count('coalesced')
+                return value
+
+            token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            if self._take_lease(cache, key, token):
+                try:
+                    self._count('leaders')
+                    return self._compute_and_store(compute, store)
+                finally:
+                    cache.delete(LEASE_KEY_PREFIX + key)
+
+            # Another worker holds the lease: wait for its result
+            value = self._wait_for_value(cache, key)
+            if value is not None:
+                self._count('coalesced')
+                return value
+            self._count('wait_timeouts')
+            return self._compute_and_store(compute, store)
+        finally:
+            if locked:
+                lock.release()
+            self._release_slot(key, slot)
+
+    def _compute_and_store(self, compute, store) -> Any:
+        value = compute()
+        if value is not None:
+            store(value)
+        return value
+
+    def _take_lease(self, cache, key: str, token: str) -> bool:
+        if not hasattr(cache, 'add'):
+            return True
+        try:
+            return bool(cache.add(LEASE_KEY_PREFIX + key, token, timeout=self.lease_timeout))
+        except Exception as e:
+            logger.warning(f"Lease acquisition failed for {key}: {e}")
+            return True
+
+    def _wait_for_value(self, cache, key: str) -> Any:
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.get(LEASE_KEY_PREFIX + key) is None:
+                # Leader finished (or died) without producing a value
+                return cache.get(key)
+        return None
+
+    def _acquire_slot(self, key: str) -> List:
+        with self._guard:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = [threading.Lock(), 0]
+                self._slots[key] = slot
+            slot[1] += 1
+            return slot
+
+    def _release_slot(self, key: str, slot: List) -> None:
+        with self._guard:
+            slot[1] -= 1
+            if slot[1] <= 0 and self._slots.get(key) is slot:
+                del self._slots[key]
+
+    def _count(self, name: str) -> None:
+        with self._guard:
+            self.metrics[name] += 1
@@ -0,0 +1,105 @@
+"""
+Stale-While-Revalidate
+======================
+
+Soft-TTL/hard-TTL support for ``cached_query``.
+
+Values cached with a ``soft_ttl`` are stored inside a ``StaleEntry``. The
+backend still expires the entry at the hard TTL (``timeout``); between the
+soft and hard TTL callers receive the stale value immediately and a
+background worker recomputes it. Only one refresh per key runs at a time:
+in-flight keys are tracked per process and a short ``_refresh:`` lease in
+the shared backend covers other workers.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+REFRESH_LEASE_PREFIX = "_refresh:"
+
+
+class StaleEntry:
+    """Cached value plus the wall-clock time after which it is stale"""
+
+    __slots__ = ('value', 'soft_expires_at')
+
+    def __init__(self, value: Any, soft_expires_at: float):
+        self.value = value
+        self.soft_expires_at = soft_expires_at
+
+    def __getstate__(self):
+        return (self.value, self.soft_expires_at)
+
+    def __setstate__(self, state):
+        self.value, self.soft_expires_at = state
+
+    @classmethod
+    def wrap(cls, value: Any, soft_ttl: int) -> 'StaleEntry':
+        return cls(value, time.time() + soft_ttl)
+
+    def is_stale(self) -> bool:
+        return time.time() >= self.soft_expires_at
+
+
+def unwrap(value: Any) -> Any:
+    """Return the payload of a StaleEntry, or the value itself"""
+    return value.value if isinstance(value, StaleEntry) else value
+
+
+class BackgroundRefresher:
+    """Runs cache refreshes off the request thread, one per key"""
+
+    def __init__(self, max_workers: int = 2, lease_timeout: int = 60):
+        self.lease_timeout = lease_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cache-refresh')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.metrics = {'scheduled': 0, 'skipped': 0, 'failed': 0}
+
+    def schedule(self, app, cache, key: str, refresh: Callable[[], None]) -> bool:
+        """Queue a refresh for key unless one is already running"""
+        with self._lock:
+            if key in self._in_flight:
+                self.metrics['skipped'] += 1
+                return False
+            self._in_flight.add(key)
+
+        try:
+            if hasattr(cache, 'add') and not cache.add(REFRESH_LEASE_PREFIX + key, 1, timeout=self.lease_timeout):
+                # Another worker is already refreshing this key
+                self._finish(key)
+                self._count('skipped')
+                return False
+        except Exception as e:
+            logger.warning(f"Refresh lease failed for {key}: {e}")
+
+        self._count('scheduled')
+        self._executor.submit(self._run, app, cache, key, refresh)
+        return True
+
+    def _run(self, app, cache, key: str, refresh: Callable[[], None]) -> None:
+        try:
+            with app.app_context():
+                try:
+                    refresh()
+                    logger.debug(f"Background refresh completed: {key}")
+                except Exception as e:
+                    self._count('failed')
+                    logger.error(f"Background refresh failed for {key}: {e}")
+                finally:
+                    cache.delete(REFRESH_LEASE_PREFIX + key)
+        finally:
+            self._finish(key)
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.metrics[name] += 1
@@ -0,0 +1,254 @@
+"""
+Unread Notification Counters
+============================
+
+Per-user unread counts for the notification bell, kept in the cache
+backend instead of running COUNT queries on every page.
+
+- ``ThongBao`` mapper events (insert, delete, ``da_doc`` changes) and
+  explicit ``record`` calls for Core inserts and broadcast receipts collect
+  per-user deltas in ``session.info``. They are applied with the backend's
+  ``inc`` after commit and dropped on rollback; a delta only touches a
+  counter that already exists.
+- A counter is rebuilt by the next reader with one COUNT when it is
+  missing, expired (``UNREAD_COUNTER_TIMEOUT``), or older than the broadcast
+  generation. Creating a shared broadcast or a fan-out bumps the generation
+  instead of touching every user's counter, so recipients reconcile lazily.
+- A rebuild must not lose a delta committed while its COUNT runs (the delta
+  is skipped because the counter is still missing). Every delta bumps the
+  user's change sequence first; the rebuilt value is stored with ``add``
+  and dropped again if the sequence moved meanwhile. The short timeout
+  bounds whatever slips through.
+- ``reset`` zeroes a counter (mark all as read); ``invalidate`` drops it
+  after a bulk change whose per-user delta is not known (archive).
+- Every change is pushed as ``unread_count`` to the ``user_<id>`` SocketIO
+  room (``{'count': n}``); broadcasts push ``{'delta': 1}`` to their room.
+
+Unlike notifications these pushes are emitted directly, not through the
+outbox (``notification_outbox``). They run in ``after_commit``, where
+there is no transaction left to enqueue into, and a count is only a hint:
+the next push or page load supersedes it, whereas an outbox retry could
+deliver a stale count after a newer one. A lost push costs nothing but a
+badge that is briefly behind.
+
+Keys (``_counter:`` prefix, so they bypass the per-process L1)::
+
+    _counter:unread:<user_id>        unread count
+    _counter:unread_gen:<user_id>    generation the count was built at
+    _counter:unread_seq:<user_id>    bumped by every delta/invalidation
+    _counter:unread_generation       current broadcast generation
+"""
+
+from typing import Callable, Dict, Iterable, Optional
+import threading
+import time
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.models import ThongBao
+from .cache_counters import _noop_set
+from .local_cache import raw_backend
+
+logger = logging.getLogger(__name__)
+
+UNREAD_KEY_PREFIX = "_counter:unread:"
+UNREAD_GEN_KEY_PREFIX = "_counter:unread_gen:"
+UNREAD_SEQ_KEY_PREFIX = "_counter:unread_seq:"
+UNREAD_GENERATION_KEY = "_counter:unread_generation"
+UNREAD_COUNTER_TIMEOUT = 600
+SESSION_DELTAS_KEY = 'unread_counter_deltas'
+
+
+class UnreadCounters:
+    """Event-maintained per-user unread counters stored in the cache backend"""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # makes inc atomic on per-process backends
+        self._installed = False
+        self.metrics = {'hits': 0, 'rebuilt': 0, 'applied': 0, 'skipped': 0, 'pushed': 0}
+
+    # Reads
+
+    def get(self, user_id: int, compute: Callable[[], int]) -> int:
+        """Cached unread count of user_id; compute() rebuilds it when missing or stale"""
+        backend = self._backend()
+        if backend is None:
+            return compute()
+        try:
+            count, built_at, generation = backend.get_many(
+                self._key(user_id), self._gen_key(user_id), UNREAD_GENERATION_KEY
+            )
+            generation = self._generation(backend) if generation is None else int(generation)
+            if count is not None and built_at is not None and int(built_at) == generation:
+                self.metrics['hits'] += 1
+                return max(0, int(count))
+
+            seq = backend.get(self._seq_key(user_id))
+            if count is not None:
+                # Stale generation: rebuild from scratch like a missing counter
+                backend.delete(self._key(user_id))
+            value = compute()
+            # add: a concurrent rebuild (or reset) that stored first wins
+            backend.add(self._key(user_id), value, timeout=UNREAD_COUNTER_TIMEOUT)
+            backend.set(self._gen_key(user_id), generation, timeout=UNREAD_COUNTER_TIMEOUT)
+            if backend.get(self._seq_key(user_id)) != seq:
+                # A delta committed during compute() may be missing: next reader rebuilds
+                backend.delete(self._key(user_id))
+            self.metrics['rebuilt'] += 1
+            return value
+        except Exception as e:
+            logger.warning(f"Unread counter unavailable for user {user_id}: {e}")
+            return compute()
+
+    # Writes
+
+    def record(self, session, user_ids: Iterable[int], delta: int) -> None:
+        """Queue a delta for users, applied when session commits (Core inserts, receipts)"""
+        deltas = session.info.setdefault(SESSION_DELTAS_KEY, {})
+        for user_id in user_ids:
+            deltas[user_id] = deltas.get(user_id, 0) + delta
+
+    def reset(self, user_id: int) -> None:
+        """Zero a user's counter (after mark all as read has committed)"""
+        backend = self._backend()
+        if backend is None:
+            return
+        try:
+            generation = self._generation(backend)
+            backend.set(self._key(user_id), 0, timeout=UNREAD_COUNTER_TIMEOUT)
+            backend.set(self._gen_key(user_id), generation, timeout=UNREAD_COUNTER_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Failed to reset unread counter for user {user_id}: {e}")
+        self._push(f"user_{user_id}", {'count': 0})
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop a user's counter so the next reader rebuilds it (bulk changes with unknown delta)"""
+        backend = self._backend()
+        if backend is None:
+            return
+        try:
+            backend.inc(self._seq_key(user_id), 1)
+            backend.delete(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"Failed to invalidate unread counter for user {user_id}: {e}")
+
+    def bump_generation(self, room: Optional[str] = None) -> None:
+        """Mark every counter stale (new broadcast); optionally push {'delta': 1} to room"""
+        backend = self._backend()
+        if backend is not None:
+            try:
+                with self._lock:
+                    self._generation(backend)
+                    backend.inc(UNREAD_GENERATION_KEY, 1)
+            except Exception as e:
+                logger.warning(f"Failed to bump unread generation: {e}")
+        if room:
+            self._push(room, {'delta': 1})
+
+    def install(self) -> None:
+        """Register the SQLAlchemy listeners (idempotent)"""
+        if self._installed:
+            return
+        event.listen(ThongBao, 'after_insert', self._after_insert)
+        event.listen(ThongBao, 'after_delete', self._after_delete)
+        event.listen(ThongBao, 'after_update', self._after_update)
+        # active_history loads the old value even when the attribute was expired
+        event.listen(ThongBao.da_doc, 'set', _noop_set, active_history=True)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        self._installed = True
+
+    # Event handlers
+
+    def _after_insert(self, mapper, connection, target) -> None:
+        if not target.da_doc:
+            self._collect(target, 1)
+
+    def _after_delete(self, mapper, connection, target) -> None:
+        if not target.da_doc:
+            self._collect(target, -1)
+
+    def _after_update(self, mapper, connection, target) -> None:
+        history = inspect(target).attrs.da_doc.history
+        if not history.has_changes() or not history.deleted:
+            return
+        was_read, is_read = bool(history.deleted[0]), bool(target.da_doc)
+        if was_read != is_read:
+            self._collect(target, -1 if is_read else 1)
+
+    def _after_commit(self, session) -> None:
+        deltas = session.info.pop(SESSION_DELTAS_KEY, None)
+        if deltas:
+            self._apply(deltas)
+
+    def _after_rollback(self, session) -> None:
+        session.info.pop(SESSION_DELTAS_KEY, None)
+
+    # Internals
+
+    def _collect(self, target, delta: int) -> None:
+        session = object_session(target)
+        if session is not None and target.nguoi_nhan is not None:
+            self.record(session, [target.nguoi_nhan], delta)
+
+    def _apply(self, deltas: Dict[int, int]) -> None:
+        backend = self._backend()
+        if backend is None:
+            return
+        for user_id, delta in deltas.items():
+            if not delta:
+                continue
+            try:
+                with self._lock:
+                    # Before the existence check, so a rebuild in progress notices
+                    backend.inc(self._seq_key(user_id), 1)
+                    if backend.get(self._key(user_id)) is None:
+                        # Unknown base value: let the next reader rebuild it
+                        self.metrics['skipped'] += 1
+                        continue
+                    count = backend.inc(self._key(user_id), delta)
+                self.metrics['applied'] += 1
+                if count is not None:
+                    self._push(f"user_{user_id}", {'count': max(0, int(count))})
+            except Exception as e:
+                logger.error(f"Failed to apply unread counter delta for user {user_id}: {e}")
+
+    def _generation(self, backend) -> int:
+        generation = backend.get(UNREAD_GENERATION_KEY)
+        if generation is None:
+            # Start from the clock so counters built before an eviction never look current
+            backend.add(UNREAD_GENERATION_KEY, int(time.time() * 1000), timeout=0)
+            generation = backend.get(UNREAD_GENERATION_KEY)
+        return int(generation)
+
+    def _push(self, room: str, payload: Dict) -> None:
+        try:
+            from flask import current_app
+            socketio = current_app.extensions.get('socketio')
+            if socketio is not None:
+                socketio.emit('unread_count', payload, room=room)
+                self.metrics['pushed'] += 1
+        except Exception as e:
+            logger.debug(f"Unread count push skipped: {e}")
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"{UNREAD_KEY_PREFIX}{user_id}"
+
+    @staticmethod
+    def _gen_key(user_id: int) -> str:
+        return f"{UNREAD_GEN_KEY_PREFIX}{user_id}"
+
+    @staticmethod
+    def _seq_key(user_id: int) -> str:
+        return f"{UNREAD_SEQ_KEY_PREFIX}{user_id}"
+
+    @staticmethod
+    def _backend():
+        from .cache_manager import get_cache_manager
+        return raw_backend(get_cache_manager().get_cache())
+
+
+unread_counters = UnreadCounters()
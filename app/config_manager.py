@@ -36,6 +36,9 @@ class ConfigManager:
             # Cache settings
             'cache_timeout': 300,
             'api_cache_timeout': 120,
+            'cache_adaptive_ttl': True,
+            'cache_ttl_min': 60,
+            'cache_ttl_max': 7200,
             
             # Email settings
             'mail_enabled': False,
@@ -45,9 +48,8 @@ class ConfigManager:
             'max_file_size': 16 * 1024 * 1024,  # 16MB
             'allowed_extensions': ['txt', 'pdf', 'doc', 'docx'],
             
-            # Database settings
-            'db_pool_size': 10,
-            'db_pool_timeout': 30,
+            # Database pool settings are DB_* values in config.py: the engine
+            # is created before settings can be read from the database
             
             # API settings
             'api_rate_limit': '100/hour',
@@ -193,6 +195,9 @@ class ConfigManager:
             'app_description': lambda x: isinstance(x, str),
             'enable_registration': lambda x: isinstance(x, bool),
             'enable_password_reset': lambda x: isinstance(x, bool),
+            'cache_adaptive_ttl': lambda x: isinstance(x, bool),
+            'cache_ttl_min': lambda x: isinstance(x, int) and x > 0,
+            'cache_ttl_max': lambda x: isinstance(x, int) and x > 0,
         }
         
         validator = validators.get(key)
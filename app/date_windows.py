@@ -0,0 +1,116 @@
+"""
+Date Windows
+============
+
+Half-open ``[start, end)`` datetime ranges for "today", "this week" and
+"last N hours" filters.
+
+``func.date(column) == today`` wraps the column in a function, so no index
+on it can be used and every row is scanned. ``DateWindow.filter(column)``
+compares the bare column against two constants instead (``column >= start
+AND column < end``), which any B-tree index on the column serves.
+
+Calendar boundaries (midnight, Monday) are taken in the ``TIMEZONE`` config
+value (default UTC) and returned as naive UTC datetimes, matching how the
+models store timestamps (``default=datetime.utcnow``).
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import NamedTuple, Optional, Union
+import logging
+
+from sqlalchemy import and_
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+logger = logging.getLogger(__name__)
+
+TzLike = Union[str, timezone, None]
+
+
+class DateWindow(NamedTuple):
+    """Half-open range of naive UTC datetimes"""
+    start: datetime
+    end: datetime
+
+    def filter(self, column):
+        """Sargable predicate: column >= start AND column < end"""
+        return and_(column >= self.start, column < self.end)
+
+    def contains(self, value: Optional[datetime]) -> bool:
+        return value is not None and self.start <= value < self.end
+
+
+def get_timezone(tz: TzLike = None):
+    """tzinfo for tz, or for the TIMEZONE config value when tz is None"""
+    if tz is not None and not isinstance(tz, str):
+        return tz
+    if tz is None:
+        try:
+            from flask import current_app
+            tz = current_app.config.get('TIMEZONE', 'UTC')
+        except RuntimeError:  # outside an app context
+            tz = 'UTC'
+    if tz.upper() == 'UTC' or ZoneInfo is None:
+        return timezone.utc
+    try:
+        return ZoneInfo(tz)
+    except ZoneInfoNotFoundError:
+        logger.warning(f"Unknown TIMEZONE {tz!r}, using UTC")
+        return timezone.utc
+
+
+def _to_utc(local: datetime) -> datetime:
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _local_now(tz, now: Optional[datetime]) -> datetime:
+    # now is naive UTC, like the stored timestamps
+    now = now or datetime.utcnow()
+    return now.replace(tzinfo=timezone.utc).astimezone(tz)
+
+
+def local_date(value: datetime, tz: TzLike = None) -> date:
+    """Calendar date of a naive UTC timestamp in tz"""
+    return value.replace(tzinfo=timezone.utc).astimezone(get_timezone(tz)).date()
+
+
+def local_today(tz: TzLike = None, now: Optional[datetime] = None) -> date:
+    return _local_now(get_timezone(tz), now).date()
+
+
+def day_window(day: date, tz: TzLike = None) -> DateWindow:
+    """The calendar day ``day`` in tz"""
+    tz = get_timezone(tz)
+    start = datetime.combine(day, datetime.min.time(), tzinfo=tz)
+    # Combine the next date rather than adding 24h: days are 23/25h long across DST changes
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+    return DateWindow(_to_utc(start), _to_utc(end))
+
+
+def today(tz: TzLike = None, now: Optional[datetime] = None) -> DateWindow:
+    return day_window(local_today(tz, now), tz)
+
+
+def this_week(tz: TzLike = None, now: Optional[datetime] = None) -> DateWindow:
+    """Monday 00:00 to next Monday 00:00 in tz"""
+    tz = get_timezone(tz)
+    current = _local_now(tz, now).date()
+    monday = current - timedelta(days=current.weekday())
+    start = datetime.combine(monday, datetime.min.time(), tzinfo=tz)
+    end = datetime.combine(monday + timedelta(days=7), datetime.min.time(), tzinfo=tz)
+    return DateWindow(_to_utc(start), _to_utc(end))
+
+
+def last_hours(hours: float, now: Optional[datetime] = None) -> DateWindow:
+    """The trailing ``hours`` up to now (end is exclusive, one microsecond past now)"""
+    now = now or datetime.utcnow()
+    return DateWindow(now - timedelta(hours=hours), now + timedelta(microseconds=1))
+
+
+def last_days(days: int, now: Optional[datetime] = None) -> DateWindow:
+    return last_hours(days * 24, now)
@@ -0,0 +1,121 @@
+"""
+Database Engine Profile
+=======================
+
+Builds ``SQLALCHEMY_ENGINE_OPTIONS`` from the ``DB_*`` config values before
+``db.init_app`` creates the engine, so pool sizing is not left to defaults.
+
+Server databases (PostgreSQL, MySQL):
+
+- ``pool_size``/``max_overflow``/``pool_timeout``: bounded pool per process;
+- ``pool_pre_ping``: drop connections the server closed while idle;
+- ``pool_recycle``: replace connections before proxies/servers time them out;
+- ``DB_STATEMENT_TIMEOUT_MS``: per-connection statement timeout
+  (``statement_timeout`` on PostgreSQL, ``max_execution_time`` on MySQL).
+
+SQLite keeps its default pool (one file, no server) and gets per-connection
+pragmas instead:
+
+- ``journal_mode=WAL``: readers no longer block the writer and vice versa,
+  so concurrent check-ins wait for each other instead of for every reader;
+- ``synchronous=NORMAL``: safe with WAL, one fsync per checkpoint instead
+  of per commit;
+- ``busy_timeout``: wait for the write lock instead of failing at once
+  with "database is locked";
+- ``cache_size``/``mmap_size``: keep hot pages in memory.
+
+When ``SQLALCHEMY_REPLICA_URI`` is set, the same profile is applied to a
+``replica`` bind used by ``app.db_routing``.
+"""
+
+from typing import Any, Dict, Optional
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+
+REPLICA_BIND = 'replica'
+
+
+def engine_options(config, uri: Optional[str] = None) -> Dict[str, Any]:
+    """Engine options for uri (default: config's SQLALCHEMY_DATABASE_URI)"""
+    url = make_url(uri or config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    options: Dict[str, Any] = {'connect_args': {}}
+
+    if backend == 'sqlite':
+        # The connect event sets busy_timeout; the driver timeout covers the initial open
+        options['connect_args'] = {'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000}
+        return options
+
+    options.update({
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    })
+
+    timeout_ms = config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+    if timeout_ms:
+        if backend == 'postgresql':
+            options['connect_args'] = {'options': f"-c statement_timeout={int(timeout_ms)}"}
+        elif backend == 'mysql':
+            options['connect_args'] = {'init_command': f"SET SESSION max_execution_time={int(timeout_ms)}"}
+        else:
+            logger.warning(f"DB_STATEMENT_TIMEOUT_MS is not supported for {backend}, ignoring")
+    return options
+
+
+def sqlite_pragmas(config) -> Dict[str, Any]:
+    """PRAGMA name -> value applied to every new SQLite connection"""
+    return {
+        'journal_mode': config.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'cache_size': int(config.get('SQLITE_CACHE_SIZE', -64000)),  # negative = KiB
+        'mmap_size': int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    }
+
+
+def install_sqlite_pragmas(engine, config) -> None:
+    """Run the pragmas on every connection the engine opens (no-op for other databases)"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config)
+    in_memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                if name == 'journal_mode' and in_memory:
+                    continue  # in-memory databases cannot use WAL
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def configure_engine(app) -> None:
+    """Fill SQLALCHEMY_ENGINE_OPTIONS (explicit options in the config win)"""
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    replica_uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if replica_uri:
+        # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS: give the replica its own profile
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, {'url': replica_uri, **engine_options(app.config, replica_uri)})
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_engine_events(app, db) -> None:
+    """Attach per-connection setup to the engine created by db.init_app"""
+    with app.app_context():
+        for engine in db.engines.values():
+            install_sqlite_pragmas(engine, app.config)
@@ -0,0 +1,137 @@
+"""
+Read-Replica Routing
+====================
+
+``RoutingSession`` is ``db.session``'s class. It sends reads to the
+``replica`` bind (``SQLALCHEMY_REPLICA_URI``) only inside code marked with
+``read_from_replica``. Everything else stays on the primary, as before.
+
+Inside a ``read_from_replica`` block a statement still goes to the primary
+when:
+
+- the session is flushing, has pending changes, or its current
+  transaction already wrote (autoflush runs before the bind is picked);
+- the model uses its own bind key;
+- the current request has already written (read-your-writes);
+- the user wrote within the last ``DB_REPLICA_STICKY_SECONDS``. This is
+  stored in the Flask session, so the page shown after a POST/redirect does
+  not read from a lagging replica.
+
+Do not combine it with ``cached_query``/``cached_route``: a result read
+from a lagging replica right after an invalidation would be cached as
+current. Cached recomputes stay on the primary.
+
+Without ``SQLALCHEMY_REPLICA_URI`` there is no replica bind and routing is a
+no-op. To try it locally, point the replica at a second SQLite file and copy
+the primary into it with ``python db_manager.py sync-replica``.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import time
+import logging
+
+from flask import g, has_request_context, session as flask_session, current_app
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .db_engine import REPLICA_BIND
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_UNTIL_KEY = '_db_primary_until'
+TRANSACTION_WROTE_KEY = 'db_transaction_wrote'
+
+_replica_depth: ContextVar[int] = ContextVar('replica_depth', default=0)
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """Flask-SQLAlchemy session that can route reads to a replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(mapper):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, mapper) -> bool:
+        if not _replica_depth.get() or REPLICA_BIND not in self._db.engines:
+            return False
+        if self._flushing or self.info.get(TRANSACTION_WROTE_KEY) or self.new or self.dirty or self.deleted:
+            return False
+        if mapper is not None:
+            table = inspect(mapper).local_table
+            if table.metadata.info.get('bind_key') is not None:
+                return False
+        return not stick_to_primary()
+
+
+def stick_to_primary() -> bool:
+    """True if this request (or this user, recently) wrote to the primary"""
+    if not has_request_context():
+        return False
+    if g.get('_db_wrote'):
+        return True
+    return flask_session.get(PRIMARY_UNTIL_KEY, 0) > time.time()
+
+
+@contextmanager
+def replica_reads():
+    """Allow reads in this block to go to the replica"""
+    token = _replica_depth.set(_replica_depth.get() + 1)
+    try:
+        yield
+    finally:
+        _replica_depth.reset(token)
+
+
+def read_from_replica(func):
+    """Decorator: run func inside replica_reads()"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _mark_write(session) -> None:
+    session.info[TRANSACTION_WROTE_KEY] = True
+    if has_request_context():
+        g._db_wrote = True
+
+
+def _mark_flush(session, flush_context, instances) -> None:
+    if session.new or session.dirty or session.deleted:
+        _mark_write(session)
+
+
+def _mark_bulk_write(orm_execute_state) -> None:
+    # query.update()/delete() and update()/delete() statements skip the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        _mark_write(orm_execute_state.session)
+
+
+def _end_transaction(session, *args) -> None:
+    session.info.pop(TRANSACTION_WROTE_KEY, None)
+
+
+def _remember_write(response):
+    if g.get('_db_wrote'):
+        sticky = current_app.config.get('DB_REPLICA_STICKY_SECONDS', 5)
+        if sticky:
+            flask_session[PRIMARY_UNTIL_KEY] = time.time() + sticky
+    return response
+
+
+def init_replica_routing(app) -> None:
+    """Track writes per request (only needed when a replica is configured)"""
+    if not app.config.get('SQLALCHEMY_REPLICA_URI'):
+        return
+    if not event.contains(Session, 'before_flush', _mark_flush):
+        event.listen(Session, 'before_flush', _mark_flush)
+        event.listen(Session, 'do_orm_execute', _mark_bulk_write)
+        event.listen(Session, 'after_commit', _end_transaction)
+        event.listen(Session, 'after_rollback', _end_transaction)
+    app.after_request(_remember_write)
+    logger.info("Read-replica routing enabled")
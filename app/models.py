@@ -2,7 +2,10 @@
 from datetime import datetime
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
 from sqlalchemy.sql.schema import Index
+from .db_routing import RoutingSession
 from werkzeug.security import check_password_hash, generate_password_hash
 import secrets
 import time
@@ -11,7 +14,7 @@ import time
 import json
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Chuẩn hóa: Model SinhVien thay cho Student
 class SinhVien(db.Model):
@@ -26,12 +29,20 @@ class SinhVien(db.Model):
         return f"<SinhVien {self.ten} - {self.email}>"
 
 class NguoiDung(UserMixin, db.Model):
+    __table_args__ = (
+        Index('idx_nguoi_dung_ten_nguoi_dung', 'ten_nguoi_dung'),
+        Index('idx_nguoi_dung_vai_tro', 'vai_tro'),
+        Index('idx_nguoi_dung_last_seen', 'last_seen'),
+        Index('idx_nguoi_dung_reset_token', 'reset_token'),
+        Index('idx_nguoi_dung_verification_token', 'verification_token'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     ten_nguoi_dung = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     mat_khau_hash = db.Column(db.String(256))
     vai_tro = db.Column(db.String(20), default="nguoi_dung")  # quan_tri_he_thong, quan_tri_vien, nguoi_dung
-    ngay_tao = db.Column(db.DateTime, default=datetime.utcnow)
+    ngay_tao = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
     bio = db.Column(db.Text, nullable=True)  # Thêm trường bio cho giới thiệu bản thân
     
@@ -200,13 +211,18 @@ class CaiDatHeThong(db.Model):
         return setting
 
 class NhatKyHoatDong(db.Model):
+    __table_args__ = (
+        Index('idx_nhat_ky_thoi_gian', 'thoi_gian'),
+        Index('idx_nhat_ky_nguoi_dung_thoi_gian', 'nguoi_dung_ma', 'thoi_gian'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     nguoi_dung_ma = db.Column(db.Integer, db.ForeignKey("nguoi_dung.id"), nullable=True)
     nguoi_dung = db.relationship("NguoiDung", backref="nhat_ky")
     hanh_dong = db.Column(db.String(128), nullable=False)
     chi_tiet = db.Column(db.Text, nullable=True)
     dia_chi_ip = db.Column(db.String(45), nullable=True)
-    thoi_gian = db.Column(db.DateTime, default=datetime.utcnow)
+    thoi_gian = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     # Aliases for English compatibility
     @property
@@ -253,6 +269,11 @@ class GhiDanh(db.Model):
     ngay_ghi_danh = db.Column(db.DateTime, default=datetime.utcnow)
 
 class CaThucHanh(db.Model):
+    __table_args__ = (
+        Index('idx_ca_thuc_hanh_ngay', 'ngay'),
+        Index('idx_ca_thuc_hanh_khung_gio', 'gio_bat_dau', 'gio_ket_thuc'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     tieu_de = db.Column(db.String(100), nullable=False)
     mo_ta = db.Column(db.Text, nullable=False)
@@ -277,8 +298,16 @@ class CaThucHanh(db.Model):
     thong_bao_truoc = db.Column(db.Integer, default=60)  # Notification minutes before start
     trang_thai = db.Column(db.String(20), default="scheduled")  # scheduled, ongoing, completed, cancelled
     diem_so_toi_da = db.Column(db.Integer, default=100)  # Maximum score
+    hang_doi_dang_ky = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # Queued admission for registration rushes
     thoi_gian_lam_bai = db.Column(db.Integer, nullable=True)  # Time limit in minutes
     
+    # Denormalized counters, kept in sync by the DangKyCa/VaoCa listeners below
+    so_dang_ky = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Registrations
+    so_da_vao = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Check-ins
+    so_hoan_thanh = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Check-ins with thoi_gian_ra
+    tong_diem = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Sum of diem_so
+    so_bai_cham = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Check-ins with diem_so
+    
     # Relationships
     dang_ky = db.relationship("DangKyCa", backref="ca_thuc_hanh", lazy=True, cascade="all, delete-orphan")
     vao_ca = db.relationship("VaoCa", backref="ca_thuc_hanh", lazy=True, cascade="all, delete-orphan")
@@ -301,7 +330,7 @@ class CaThucHanh(db.Model):
                 self.trang_thai == "ongoing")
 
     def da_day(self):
-        return len(self.dang_ky) >= self.so_luong_toi_da
+        return (self.so_dang_ky or 0) >= self.so_luong_toi_da
 
     def get_tags(self):
         """Get tags as list"""
@@ -331,16 +360,13 @@ class CaThucHanh(db.Model):
 
     def get_completion_rate(self):
         """Calculate completion rate"""
-        total_registered = len(self.dang_ky)
-        if total_registered == 0:
+        if not self.so_dang_ky:
             return 0
-        completed = len([entry for entry in self.vao_ca if entry.thoi_gian_ra])
-        return (completed / total_registered) * 100
+        return (self.so_hoan_thanh / self.so_dang_ky) * 100
 
     def get_average_score(self):
         """Calculate average score"""
-        scores = [entry.diem_so for entry in self.vao_ca if entry.diem_so is not None]
-        return sum(scores) / len(scores) if scores else 0
+        return self.tong_diem / self.so_bai_cham if self.so_bai_cham else 0
 
 # New models for enhanced features
 
@@ -421,6 +447,10 @@ class DanhGiaCa(db.Model):
 class ThongBao(db.Model):
     """Notification system"""
     __tablename__ = 'thong_bao'
+    __table_args__ = (
+        Index('idx_thong_bao_nguoi_nhan_da_doc_ngay_tao', 'nguoi_nhan', 'da_doc', 'ngay_tao'),
+        Index('idx_thong_bao_da_doc_ngay_tao', 'da_doc', 'ngay_tao'),  # retention sweep
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nguoi_nhan = db.Column(db.Integer, db.ForeignKey("nguoi_dung.id"), nullable=False)
@@ -429,11 +459,87 @@ class ThongBao(db.Model):
     loai = db.Column(db.String(50), default="info")  # info, warning, success, error
     lien_ket = db.Column(db.String(500), nullable=True)
     da_doc = db.Column(db.Boolean, default=False)
-    ngay_tao = db.Column(db.DateTime, default=datetime.utcnow)
+    ngay_tao = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     ngay_doc = db.Column(db.DateTime, nullable=True)
+    da_luu_tru = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # Archived: hidden from the inbox
+    ngay_luu_tru = db.Column(db.DateTime, nullable=True)
+
+class ThongBaoChung(db.Model):
+    """Broadcast notification stored once, targeted by audience"""
+    __tablename__ = 'thong_bao_chung'
+    __table_args__ = (
+        Index('idx_thong_bao_chung_doi_tuong_ngay_tao', 'doi_tuong', 'vai_tro', 'ngay_tao'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tieu_de = db.Column(db.String(200), nullable=False)
+    noi_dung = db.Column(db.Text, nullable=False)
+    loai = db.Column(db.String(50), default="info")  # info, warning, success, error
+    lien_ket = db.Column(db.String(500), nullable=True)
+    doi_tuong = db.Column(db.String(20), nullable=False, default="all")  # all, role, users
+    vai_tro = db.Column(db.String(20), nullable=True)  # audience role when doi_tuong == "role"
+    nguoi_gui_ma = db.Column(db.Integer, db.ForeignKey("nguoi_dung.id"), nullable=True)
+    ngay_tao = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ThongBaoChungNguoiNhan(db.Model):
+    """Recipients of a broadcast with doi_tuong == "users" """
+    __tablename__ = 'thong_bao_chung_nguoi_nhan'
+    __table_args__ = (
+        Index('uq_thong_bao_chung_nguoi_nhan', 'thong_bao_chung_ma', 'nguoi_dung_ma', unique=True),
+        Index('idx_thong_bao_chung_nguoi_nhan_nguoi_dung', 'nguoi_dung_ma'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    thong_bao_chung_ma = db.Column(db.Integer, db.ForeignKey("thong_bao_chung.id", ondelete="CASCADE"), nullable=False)
+    nguoi_dung_ma = db.Column(db.Integer, db.ForeignKey("nguoi_dung.id"), nullable=False)
+
+class BienNhanThongBao(db.Model):
+    """Per-user read/dismiss receipt of a broadcast (only written when the user acts)"""
+    __tablename__ = 'bien_nhan_thong_bao'
+    __table_args__ = (
+        Index('uq_bien_nhan_thong_bao', 'thong_bao_chung_ma', 'nguoi_dung_ma', unique=True),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    thong_bao_chung_ma = db.Column(db.Integer, db.ForeignKey("thong_bao_chung.id", ondelete="CASCADE"), nullable=False)
+    nguoi_dung_ma = db.Column(db.Integer, db.ForeignKey("nguoi_dung.id"), nullable=False)
+    da_doc = db.Column(db.Boolean, nullable=False, default=False)
+    ngay_doc = db.Column(db.DateTime, nullable=True)
+    da_an = db.Column(db.Boolean, nullable=False, default=False)  # dismissed
+    ngay_an = db.Column(db.DateTime, nullable=True)
+
+class HopThuThongBao(db.Model):
+    """Transactional outbox: notification deliveries committed with the business change, sent by a dispatcher"""
+    __tablename__ = 'hop_thu_thong_bao'
+    __table_args__ = (
+        Index('idx_hop_thu_thong_bao_trang_thai_lan_thu', 'trang_thai', 'lan_thu_tiep'),
+        Index('idx_hop_thu_thong_bao_ma_xu_ly', 'ma_xu_ly'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kenh = db.Column(db.String(20), nullable=False)  # socketio, email
+    dich = db.Column(db.String(255), nullable=False)  # SocketIO room or email address
+    su_kien = db.Column(db.String(100), nullable=False)  # SocketIO event or email subject
+    du_lieu = db.Column(db.Text, nullable=False)  # JSON payload
+    trang_thai = db.Column(db.String(20), nullable=False, default="cho")  # cho, da_gui, that_bai
+    so_lan_thu = db.Column(db.Integer, nullable=False, default=0)
+    lan_thu_tiep = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # next attempt (backoff)
+    ma_xu_ly = db.Column(db.String(32), nullable=True)  # claim token of the dispatcher holding the row
+    khoa_den = db.Column(db.DateTime, nullable=True)  # claim expires (dispatcher died mid-batch)
+    loi_cuoi = db.Column(db.Text, nullable=True)
+    ngay_tao = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ngay_gui = db.Column(db.DateTime, nullable=True)
+    
+    def get_du_lieu(self):
+        return json.loads(self.du_lieu) if self.du_lieu else {}
 
 # Enhanced existing models
 class DangKyCa(db.Model):
+    __table_args__ = (
+        Index('idx_dang_ky_ca_ca_thuc_hanh', 'ca_thuc_hanh_ma'),
+        Index('uq_dang_ky_ca_nguoi_dung_ca', 'nguoi_dung_ma', 'ca_thuc_hanh_ma', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     nguoi_dung_ma = db.Column(db.Integer, db.ForeignKey("nguoi_dung.id"), nullable=False)
     ca_thuc_hanh_ma = db.Column(db.Integer, db.ForeignKey("ca_thuc_hanh.id"), nullable=False)
@@ -447,6 +553,10 @@ class DangKyCa(db.Model):
     ngay_xac_nhan = db.Column(db.DateTime, nullable=True)
 
 class VaoCa(db.Model):
+    __table_args__ = (
+        Index('idx_vao_ca_nguoi_dung_ca', 'nguoi_dung_ma', 'ca_thuc_hanh_ma'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     nguoi_dung_ma = db.Column(db.Integer, db.ForeignKey("nguoi_dung.id"), nullable=False)
     ca_thuc_hanh_ma = db.Column(db.Integer, db.ForeignKey("ca_thuc_hanh.id"), nullable=False)
@@ -462,11 +572,143 @@ class VaoCa(db.Model):
     thoi_gian_nop = db.Column(db.DateTime, nullable=True)
     vi_tri_ngoi = db.Column(db.String(20), nullable=True)  # Seat assignment
 
-def tao_chi_muc():
-    Index("idx_nguoi_dung_email", NguoiDung.email)
-    Index("idx_nguoi_dung_ten_nguoi_dung", NguoiDung.ten_nguoi_dung)
+# Bộ đếm của CaThucHanh
+# Mỗi DangKyCa/VaoCa đóng góp một bộ giá trị vào ca của nó; khi thêm/sửa/xóa
+# thì cộng/trừ phần chênh lệch bằng UPDATE ... SET cot = cot + n trong cùng
+# transaction (nguyên tử ở phía database, rollback cùng dữ liệu gốc).
+BO_DEM_CA_COLUMNS = ('so_dang_ky', 'so_da_vao', 'so_hoan_thanh', 'tong_diem', 'so_bai_cham')
+
+def _dong_gop(target, lay):
+    """Phần đóng góp của một bản ghi: (ca_thuc_hanh_ma, {cot: gia_tri})"""
+    if isinstance(target, DangKyCa):
+        return lay('ca_thuc_hanh_ma'), {'so_dang_ky': 1}
+    diem_so = lay('diem_so')
+    return lay('ca_thuc_hanh_ma'), {
+        'so_da_vao': 1,
+        'so_hoan_thanh': 1 if lay('thoi_gian_ra') else 0,
+        'tong_diem': diem_so or 0,
+        'so_bai_cham': 0 if diem_so is None else 1
+    }
+
+def _gia_tri_cu(target, field):
+    history = inspect(target).attrs[field].history
+    if not history.has_changes():
+        return getattr(target, field)
+    # deleted is empty when the old value was None
+    return history.deleted[0] if history.deleted else None
+
+def _cong_bo_dem(connection, target, ca_id, deltas, sign=1):
+    values = {col: delta * sign for col, delta in deltas.items() if delta}
+    if ca_id is None or not values:
+        return
+    table = CaThucHanh.__table__
+    connection.execute(
+        table.update().where(table.c.id == ca_id).values(
+            {col: table.c[col] + delta for col, delta in values.items()}
+        )
+    )
+    # The loaded CaThucHanh (if any) is refreshed after the flush
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('ca_bo_dem_thay_doi', set()).add(ca_id)
+
+def _bo_dem_after_insert(mapper, connection, target):
+    ca_id, deltas = _dong_gop(target, lambda field: getattr(target, field))
+    _cong_bo_dem(connection, target, ca_id, deltas)
+
+def _bo_dem_after_delete(mapper, connection, target):
+    ca_id, deltas = _dong_gop(target, lambda field: _gia_tri_cu(target, field))
+    _cong_bo_dem(connection, target, ca_id, deltas, sign=-1)
+
+def _bo_dem_after_update(mapper, connection, target):
+    old_ca, old = _dong_gop(target, lambda field: _gia_tri_cu(target, field))
+    new_ca, new = _dong_gop(target, lambda field: getattr(target, field))
+    if old_ca == new_ca:
+        _cong_bo_dem(connection, target, new_ca, {col: new[col] - old[col] for col in new})
+    else:
+        _cong_bo_dem(connection, target, old_ca, old, sign=-1)
+        _cong_bo_dem(connection, target, new_ca, new)
+
+def _bo_dem_after_flush_postexec(session, flush_context):
+    ca_ids = session.info.pop('ca_bo_dem_thay_doi', None)
+    if not ca_ids:
+        return
+    for ca_id in ca_ids:
+        ca = session.identity_map.get(inspect(CaThucHanh).identity_key_from_primary_key((ca_id,)))
+        if ca is not None:
+            session.expire(ca, list(BO_DEM_CA_COLUMNS))
+
+def _giu_gia_tri_cu(target, value, oldvalue, initiator):
+    return value
+
+for _model in (DangKyCa, VaoCa):
+    event.listen(_model, 'after_insert', _bo_dem_after_insert)
+    event.listen(_model, 'after_delete', _bo_dem_after_delete)
+    event.listen(_model, 'after_update', _bo_dem_after_update)
+# active_history: load the old value on change so the old contribution is known
+for _attr in (DangKyCa.ca_thuc_hanh_ma, VaoCa.ca_thuc_hanh_ma, VaoCa.thoi_gian_ra, VaoCa.diem_so):
+    event.listen(_attr, 'set', _giu_gia_tri_cu, active_history=True)
+event.listen(Session, 'after_flush_postexec', _bo_dem_after_flush_postexec)
+
+def cap_nhat_bo_dem_ca(ca_id, **deltas):
+    """Cộng deltas vào bộ đếm của ca trong transaction hiện tại (cho insert/update hàng loạt không qua mapper)"""
+    values = {col: delta for col, delta in deltas.items() if delta}
+    if not values:
+        return
+    table = CaThucHanh.__table__
+    db.session.execute(
+        table.update().where(table.c.id == ca_id).values(
+            {col: table.c[col] + delta for col, delta in values.items()}
+        )
+    )
+    ca = db.session.identity_map.get(inspect(CaThucHanh).identity_key_from_primary_key((ca_id,)))
+    if ca is not None:
+        db.session.expire(ca, list(values))
+
+def giu_cho_ca(ca_id, so_cho=1):
+    """
+    Giữ so_cho chỗ của ca bằng một UPDATE có điều kiện (nguyên tử, không cần SELECT trước)
+
+    Trả về True nếu đã tăng so_dang_ky; False nếu ca không tồn tại, không hoạt động
+    hoặc không đủ chỗ. Người gọi tự insert DangKyCa qua Core (không qua mapper,
+    nếu không bộ đếm bị cộng hai lần) và commit/rollback cùng transaction.
+    """
+    table = CaThucHanh.__table__
+    result = db.session.execute(
+        table.update()
+        .where(
+            table.c.id == ca_id,
+            table.c.dang_hoat_dong.is_(True),
+            table.c.so_dang_ky + so_cho <= table.c.so_luong_toi_da
+        )
+        .values(so_dang_ky=table.c.so_dang_ky + so_cho)
+    )
+    if result.rowcount != 1:
+        return False
+    ca = db.session.identity_map.get(inspect(CaThucHanh).identity_key_from_primary_key((ca_id,)))
+    if ca is not None:
+        db.session.expire(ca, ['so_dang_ky'])
+    return True
+
+SQL_TINH_LAI_BO_DEM_CA = """
+UPDATE ca_thuc_hanh SET
+    so_dang_ky = (SELECT COUNT(*) FROM dang_ky_ca WHERE dang_ky_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id),
+    so_da_vao = (SELECT COUNT(*) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id),
+    so_hoan_thanh = (SELECT COUNT(*) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id
+                     AND vao_ca.thoi_gian_ra IS NOT NULL),
+    tong_diem = (SELECT COALESCE(SUM(diem_so), 0) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id),
+    so_bai_cham = (SELECT COUNT(diem_so) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id)
+"""
+
+def tinh_lai_bo_dem_ca():
+    """Tính lại toàn bộ bộ đếm của CaThucHanh từ DangKyCa/VaoCa (chưa commit)"""
+    return db.session.execute(text(SQL_TINH_LAI_BO_DEM_CA)).rowcount
 
 def khoi_tao_ung_dung(app):
     """Initialize database with the app"""
+    from .db_engine import configure_engine, init_engine_events
+    from .db_routing import init_replica_routing
+    configure_engine(app)
     db.init_app(app)
-    tao_chi_muc()
\ No newline at end of file
+    init_engine_events(app, db)
+    init_replica_routing(app)
\ No newline at end of file
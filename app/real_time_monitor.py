@@ -14,7 +14,8 @@ from datetime import datetime, timedelta
 from flask import current_app
 from flask_socketio import emit
 from .models import NguoiDung as User, CaThucHanh as LabSession, NhatKyHoatDong as ActivityLog, db
-from sqlalchemy import func
+from .date_windows import today, last_hours
+from .db_routing import read_from_replica
 
 logger = logging.getLogger(__name__)
 
@@ -156,6 +157,7 @@ class SystemMonitor:
                 'network': {'bytes_sent': 0, 'bytes_recv': 0}
             }
     
+    @read_from_replica
     def _get_user_activity_metrics(self):
         """Collect current user activity metrics"""
         try:
@@ -180,15 +182,13 @@ class SystemMonitor:
                 ).count()
                 
                 # Today's sessions
-                today = datetime.utcnow().date()
                 today_sessions = LabSession.query.filter(
-                    func.date(LabSession.gio_bat_dau) == today
+                    today().filter(LabSession.gio_bat_dau)
                 ).count()
                 
                 # Recent activities (last hour)
-                one_hour_ago = datetime.utcnow() - timedelta(hours=1)
                 recent_activities = ActivityLog.query.filter(
-                    ActivityLog.thoi_gian >= one_hour_ago
+                    last_hours(1).filter(ActivityLog.thoi_gian)
                 ).count()
                 
                 return {
@@ -14,6 +14,9 @@ from ...cache.cached_queries import (
     invalidate_user_caches, invalidate_activity_caches
 )
 from ...services.notification_service import NotificationService, notify_system_maintenance, notify_new_feature
+from ...services.lab_session_service import LabSessionService
+from ...services.base_service import BaseService, ServiceError
+from ...db_routing import read_from_replica
 from sqlalchemy import func
 import json
 
@@ -70,10 +73,23 @@ def send_notification():
             return jsonify({'success': False, 'message': 'Tiêu đề và nội dung không được để trống'})
         
         count = 0
-        if target == 'all':
-            count = NotificationService.broadcast_to_all(title, content, notification_type, link)
-        elif target == 'role':
-            count = NotificationService.broadcast_to_role(target_value, title, content, notification_type, link)
+        stats = None
+        if target in ('all', 'role'):
+            # Stored once as a shared broadcast (or fanned out, see NOTIFICATION_BROADCAST_MODE)
+            stats = NotificationService.broadcast(title, content, notification_type, link,
+                                                  role=target_value if target == 'role' else None,
+                                                  sender_id=current_user.id)
+            count = stats['count']
+        elif target == 'users':
+            # target_value: list (or comma-separated string) of usernames
+            names = target_value if isinstance(target_value, list) else str(target_value).split(',')
+            names = [name.strip() for name in names if str(name).strip()]
+            user_ids = [user_id for (user_id,) in db.session.query(NguoiDung.id).filter(
+                NguoiDung.ten_nguoi_dung.in_(names))] if names else []
+            if user_ids:
+                stats = NotificationService.create_broadcast(title, content, notification_type, link,
+                                                             user_ids=user_ids, sender_id=current_user.id)
+                count = stats['count']
         elif target == 'user':
             user = NguoiDung.query.filter_by(ten_nguoi_dung=target_value).first()
             if user:
@@ -84,7 +100,9 @@ def send_notification():
         
         return jsonify({
             'success': True,
-            'message': f'Đã gửi thông báo đến {count} người dùng'        })
+            'message': f'Đã gửi thông báo đến {count} người dùng',
+            'stats': stats
+        })
         
     except Exception as e:
         current_app.logger.error(f"Error sending notification: {str(e)}")
@@ -175,9 +193,23 @@ def get_csrf_token():
 @login_required
 @admin_required
 def admin_users():
-    """Admin user management page"""
-    users = NguoiDung.query.all()
-    return render_template("admin/admin_users.html", users=users)
+    """Admin user management page (keyset pages, newest users first)"""
+    try:
+        users_page = BaseService.keyset_paginate(
+            NguoiDung.query, NguoiDung.ngay_tao, NguoiDung.id,
+            cursor=request.args.get('cursor'), per_page=50, estimate_total=True
+        )
+    except ServiceError as e:
+        flash(e.message, "warning")
+        return redirect(url_for('admin.admin_users'))
+    # Thống kê toàn bảng lấy từ bộ đếm, không từ trang hiện tại
+    by_role = get_users_by_role()
+    user_stats = {
+        'total': get_total_users(),
+        'admins': sum(by_role.get(role, 0) for role in ('quan_tri_vien', 'quan_tri_he_thong'))
+    }
+    return render_template("admin/admin_users.html", users=users_page['items'], users_page=users_page,
+                           user_stats=user_stats)
 
 @admin_bp.route('/create-user', methods=['GET', 'POST'])
 @login_required
@@ -206,7 +238,7 @@ def create_user():
             db.session.add(nguoi_dung_moi)
             db.session.commit()
             
-            invalidate_user_cache()
+            invalidate_user_cache(nguoi_dung_moi.id)
             invalidate_model_cache('NguoiDung')
             
             # Log activity với thông tin chi tiết
@@ -255,7 +287,7 @@ def edit_user(user_id):
             
             db.session.commit()
             
-            invalidate_user_cache()
+            invalidate_user_cache(nguoi_dung.id)
             invalidate_model_cache('NguoiDung')
             
             log_activity("Cập nhật người dùng", f"Cập nhật người dùng {nguoi_dung.ten_nguoi_dung}")
@@ -337,7 +369,7 @@ def tao_quan_tri_vien(user_id):
     nguoi_dung.vai_tro = "quan_tri_vien"
     db.session.commit()
     
-    invalidate_user_cache()
+    invalidate_user_cache(nguoi_dung.id)
     log_activity("Nâng cấp quản trị viên", f"Người dùng {nguoi_dung.ten_nguoi_dung} đã được nâng cấp lên quản trị viên.")
     flash(f"Người dùng {nguoi_dung.ten_nguoi_dung} đã được nâng cấp lên quản trị viên!", "success")
     return redirect(url_for('admin.admin_users'))
@@ -356,7 +388,7 @@ def nang_cap_quan_tri_vien_cap_cao(user_id):
     nguoi_dung.vai_tro = "quan_tri_he_thong"
     db.session.commit()
     
-    invalidate_user_cache()
+    invalidate_user_cache(nguoi_dung.id)
     log_activity("Nâng cấp quản trị hệ thống", f"Người dùng {nguoi_dung.ten_nguoi_dung} đã được nâng cấp lên quản trị hệ thống.")
     flash(f"Người dùng {nguoi_dung.ten_nguoi_dung} đã được nâng cấp lên quản trị hệ thống!", "success")
     return redirect(url_for('admin.admin_users'))
@@ -375,7 +407,7 @@ def xoa_quyen_admin(user_id):
     nguoi_dung.vai_tro = "nguoi_dung"
     db.session.commit()
     
-    invalidate_user_cache()
+    invalidate_user_cache(nguoi_dung.id)
     log_activity("Hạ cấp quản trị viên", f"Người dùng {nguoi_dung.ten_nguoi_dung} đã bị hạ cấp xuống người dùng thường.")
     flash(f"Người dùng {nguoi_dung.ten_nguoi_dung} đã bị hạ cấp xuống người dùng thường!", "success")
     return redirect(url_for('admin.admin_users'))
@@ -443,7 +475,7 @@ def xoa_nguoi_dung(user_id):
     db.session.delete(nguoi_dung)
     db.session.commit()
     
-    invalidate_user_cache()
+    invalidate_user_cache(user_id)
     invalidate_model_cache('NguoiDung')
     log_activity("Xóa người dùng", f"Người dùng {username} đã bị xóa.")
     flash(f"Người dùng {username} đã bị xóa!", "success")
@@ -453,11 +485,17 @@ def xoa_nguoi_dung(user_id):
 @admin_bp.route('/activity-logs/<int:page>')
 @login_required
 @admin_required
+@read_from_replica
 def activity_logs(page=1):
-    """Admin activity logs"""
-    logs = NhatKyHoatDong.query.order_by(NhatKyHoatDong.thoi_gian.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    """Admin activity logs (keyset pages; legacy /<page> URLs start at the newest entries)"""
+    try:
+        logs = BaseService.keyset_paginate(
+            NhatKyHoatDong.query, NhatKyHoatDong.thoi_gian, NhatKyHoatDong.id,
+            cursor=request.args.get('cursor'), per_page=20, estimate_total=True
+        )
+    except ServiceError as e:
+        flash(e.message, "warning")
+        return redirect(url_for('admin.activity_logs'))
     return render_template("admin/admin_logs.html", logs=logs)
 
 @admin_bp.route('/lab-sessions')
@@ -465,11 +503,7 @@ def activity_logs(page=1):
 @admin_required
 def admin_lab_sessions():
     """Admin lab sessions management"""
-    sessions = CaThucHanh.query.order_by(CaThucHanh.ngay.desc()).all()
-    
-    for session in sessions:
-        session.so_nguoi_dang_ky = DangKyCa.query.filter_by(ca_thuc_hanh_ma=session.id).count()
-        session.so_nguoi_da_vao = VaoCa.query.filter_by(ca_thuc_hanh_ma=session.id).count()
+    sessions = LabSessionService().list_sessions_with_counts()
     
     # Get today's date for statistics
     today = datetime.now().date()
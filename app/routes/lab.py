@@ -10,7 +10,10 @@ from ..cache.cached_queries import (
     get_total_sessions, get_active_sessions_count, get_sessions_today,
     invalidate_session_caches, invalidate_activity_caches
 )
-from ..services.notification_service import NotificationService, notify_lab_registration, notify_lab_reminder
+from ..services.notification_service import NotificationService, notify_lab_reminder
+from ..services.lab_session_service import LabSessionService
+from ..services.base_service import ServiceError
+from ..services.registration_queue import registration_queue, priority_for
 import random, string
 from sqlalchemy import func
 
@@ -33,12 +36,8 @@ def csrf_token():
 def lab_sessions():
     """Show available lab sessions"""
     try:
-        # Get all available sessions
-        sessions = CaThucHanh.query.order_by(CaThucHanh.ngay.desc()).all()
-        
-        # Add registration count for each session
-        for session in sessions:
-            session.so_nguoi_dang_ky = DangKyCa.query.filter_by(ca_thuc_hanh_ma=session.id).count()
+        # Get all available sessions with registration counts (one query)
+        sessions = LabSessionService().list_sessions_with_counts()
         
         # Get user's registrations
         user_registrations = DangKyCa.query.filter_by(
@@ -75,20 +74,27 @@ def register_lab_session(session_id):
     form = SessionRegistrationForm()
     form.session_id.data = session_id
     
-    if form.validate_on_submit():        # Traditional form submission - create registration directly
-        registration = DangKyCa(nguoi_dung_ma=current_user.id, ca_thuc_hanh_ma=session_id, ghi_chu=form.notes.data)
-        db.session.add(registration)
-        db.session.commit()
-        
-        # Send notification
-        notify_lab_registration(current_user.id, ca_thuc_hanh.tieu_de)
+    if form.validate_on_submit():        # Traditional form submission - atomic seat reservation
+        try:
+            if ca_thuc_hanh.hang_doi_dang_ky:
+                # Registration rush: answer with a ticket, the queue worker admits it
+                ticket = registration_queue.enqueue(current_user.id, session_id, form.notes.data or "",
+                                                    priority_for(current_user))
+                flash("Yêu cầu đăng ký đã được xếp hàng, kết quả sẽ được thông báo.", "info")
+                return redirect(url_for("lab.lab_sessions", ticket=ticket['ticket']))
+            result, code = LabSessionService().register_for_session(current_user.id, session_id, form.notes.data or "")
+            if code != 200:
+                flash(result.get('message', "Có lỗi xảy ra khi đăng ký ca thực hành."), "danger")
+                return redirect(url_for("lab.lab_sessions"))
+        except ServiceError as e:
+            flash(e.message, "warning" if e.code == 409 else "danger")
+            return redirect(url_for("lab.lab_sessions"))
         
         # Invalidate related caches after lab registration
         invalidate_user_cache(current_user.id)
         invalidate_session_caches()
         invalidate_activity_caches()
         
-        log_activity("Lab registration", f"Registered for lab session {ca_thuc_hanh.tieu_de}")
         flash("Đăng ký ca thực hành thành công!", "success")
         return redirect(url_for("lab.lab_sessions"))
     
@@ -96,6 +102,34 @@ def register_lab_session(session_id):
     # Template will handle API-based registration via JavaScript
     return render_template("lab/register_session.html", form=form, session=ca_thuc_hanh)
 
+@lab_bp.route('/api/register/<int:session_id>', methods=['POST'])
+@login_required
+def api_register_lab_session(session_id):
+    """JSON registration: 202 + ticket when the session uses the admission queue, else registers directly"""
+    data = request.get_json(silent=True) or {}
+    notes = str(data.get('notes') or '')[:500]
+    try:
+        if db.session.query(CaThucHanh.hang_doi_dang_ky).filter_by(id=session_id).scalar():
+            ticket = registration_queue.enqueue(current_user.id, session_id, notes, priority_for(current_user))
+            return jsonify({'success': True, 'queued': True, 'ticket': ticket}), 202
+        result, code = LabSessionService().register_for_session(current_user.id, session_id, notes)
+        if code == 200:
+            invalidate_user_cache(current_user.id)
+            invalidate_session_caches()
+            invalidate_activity_caches()
+        return jsonify(result), code
+    except ServiceError as e:
+        return jsonify({'success': False, 'message': e.message}), e.code
+
+@lab_bp.route('/register/ticket/<ticket_id>')
+@login_required
+def registration_ticket(ticket_id):
+    """Polling: trạng thái vé đăng ký (queued, succeeded, failed)"""
+    ticket = registration_queue.get_ticket(ticket_id)
+    if not ticket or (ticket['user_id'] != current_user.id and not current_user.is_admin()):
+        return jsonify({'success': False, 'message': 'Không tìm thấy vé đăng ký'}), 404
+    return jsonify({'success': True, 'ticket': ticket})
+
 @lab_bp.route('/verify/<int:session_id>', methods=['GET', 'POST'])
 @login_required
 def verify_lab_session(session_id):
@@ -208,16 +242,10 @@ from ..decorators import admin_required, admin_manager_required
 def admin_lab_sessions():
     """Admin lab sessions list"""
     try:
-        # Get all sessions with registration counts
-        sessions = CaThucHanh.query.order_by(
-            CaThucHanh.ngay.desc(), 
-            CaThucHanh.gio_bat_dau.desc()
-        ).all()
-        
-        # Add registration and attendance counts directly to session objects
-        for session in sessions:
-            session.so_nguoi_dang_ky = DangKyCa.query.filter_by(ca_thuc_hanh_ma=session.id).count()
-            session.so_nguoi_da_vao = VaoCa.query.filter_by(ca_thuc_hanh_ma=session.id).count()
+        # Get all sessions with registration and attendance counts (one query)
+        sessions = LabSessionService().list_sessions_with_counts(
+            order_by=[CaThucHanh.ngay.desc(), CaThucHanh.gio_bat_dau.desc()]
+        )
         
         # Get today's date for statistics
         from datetime import datetime
@@ -349,6 +377,67 @@ def lab_session_attendees(session_id):
     ca_thuc_hanh = CaThucHanhModel.query.get_or_404(session_id)
     return render_template("admin/admin_session_attendees.html", session=ca_thuc_hanh)
 
+@lab_bp.route('/admin/sessions/<int:session_id>/bulk-register', methods=['POST'])
+@login_required
+@admin_required
+def bulk_register_session(session_id):
+    """Đăng ký hàng loạt (CSV upload, text/csv hoặc JSON)"""
+    return _run_bulk_operation(LabSessionService().bulk_register, session_id)
+
+@lab_bp.route('/admin/sessions/<int:session_id>/bulk-check-in', methods=['POST'])
+@login_required
+@admin_required
+def bulk_check_in_session(session_id):
+    """Điểm danh hàng loạt (CSV upload, text/csv hoặc JSON)"""
+    return _run_bulk_operation(LabSessionService().bulk_check_in, session_id)
+
+@lab_bp.route('/admin/sessions/<int:session_id>/queue', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def session_registration_queue(session_id):
+    """Bật/tắt hàng đợi đăng ký của ca ({"enabled": true}) và xem trạng thái hàng đợi"""
+    ca_thuc_hanh = CaThucHanhModel.query.get_or_404(session_id)
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        ca_thuc_hanh.hang_doi_dang_ky = bool(data.get('enabled', not ca_thuc_hanh.hang_doi_dang_ky))
+        db.session.commit()
+        invalidate_session_caches()
+        log_activity("Hàng đợi đăng ký",
+                     f"{'Bật' if ca_thuc_hanh.hang_doi_dang_ky else 'Tắt'} hàng đợi đăng ký ca {ca_thuc_hanh.tieu_de}")
+    return jsonify({
+        'success': True,
+        'enabled': ca_thuc_hanh.hang_doi_dang_ky,
+        'queue': registration_queue.stats(session_id)
+    })
+
+def _run_bulk_operation(operation, session_id):
+    try:
+        rows = _read_bulk_rows()
+        result, code = operation(session_id, rows, actor_id=current_user.id)
+        return jsonify(result), code
+    except ServiceError as e:
+        return jsonify({'success': False, 'message': e.message}), e.code
+    except Exception as e:
+        current_app.logger.error(f"Bulk operation failed for session {session_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Có lỗi xảy ra khi xử lý danh sách'}), 500
+
+def _read_bulk_rows():
+    """Danh sách dòng từ file CSV, body text/csv hoặc JSON (list hoặc {"users": [...]})"""
+    upload = request.files.get('file')
+    if upload:
+        try:
+            return LabSessionService.parse_bulk_csv(upload.read().decode('utf-8-sig'))
+        except UnicodeDecodeError:
+            raise ServiceError("File CSV phải dùng mã hóa UTF-8", 400)
+    if request.mimetype in ('text/csv', 'text/plain'):
+        return LabSessionService.parse_bulk_csv(request.get_data(as_text=True))
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('users')
+    if not isinstance(data, list):
+        raise ServiceError("Cần file CSV hoặc JSON danh sách người dùng", 400)
+    return data
+
 @lab_bp.route('/admin/schedule-sessions')
 @login_required
 @admin_manager_required
@@ -3,12 +3,14 @@ from flask_login import login_required, current_user
 from sqlalchemy import or_, text
 from ..models import NguoiDung
 from ..cache.cache_manager import cached_route
+from ..cache.cache_tags import model_tag
 
 search_bp = Blueprint('search', __name__)
 
 @search_bp.route('/search', methods=['GET'])
 @login_required
-@cached_route(timeout=300, key_prefix='search_results')
+@cached_route(timeout=300, key_prefix='search_results', cache_control='private, max-age=60',
+              tags=[model_tag('NguoiDung')])
 def search():
     query = request.args.get('q', '')
     if not query or len(query) < 2:
@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, Response
 from flask_login import login_required, current_user
 from ...decorators import system_admin_required
 from ...models import NguoiDung, CaiDatHeThong, db
 from ...utils import log_activity
+from ...cache.cache_manager import get_cache_manager
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+import hmac
 import json
 
 system_admin_bp = Blueprint('system_admin', __name__, url_prefix='/system-admin')
@@ -133,3 +135,35 @@ def clear_logs():
         current_app.logger.error(f"Error in clear logs: {str(e)}")
         flash("Có lỗi xảy ra khi xóa nhật ký.", "danger")
         return redirect(url_for('system_admin.operations'))
+
+@system_admin_bp.route('/cache/stats')
+@login_required
+@system_admin_required
+def cache_stats():
+    """Thống kê cache theo key prefix (JSON, gộp mọi worker)"""
+    try:
+        return jsonify(get_cache_manager().get_prefix_stats())
+    except Exception as e:
+        current_app.logger.error(f"Error in cache stats: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Cache stats unavailable'}), 500
+
+@system_admin_bp.route('/cache/metrics')
+def cache_metrics():
+    """Thống kê cache dạng Prometheus text
+
+    Cho phép Prometheus scrape bằng header ``Authorization: Bearer <CACHE_METRICS_TOKEN>``;
+    nếu không có token thì yêu cầu đăng nhập quản trị hệ thống.
+    """
+    token = current_app.config.get('CACHE_METRICS_TOKEN')
+    authorized = bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    )
+    if not authorized and not (current_user.is_authenticated and current_user.is_system_admin()):
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+
+    try:
+        return Response(get_cache_manager().get_prometheus_metrics(),
+                        mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        current_app.logger.error(f"Error in cache metrics: {str(e)}")
+        return Response('Cache metrics unavailable\n', status=500, mimetype='text/plain')
@@ -6,27 +6,34 @@ from ...models import db, NguoiDung, CaiDatHeThong, ThongBao
 from ...utils import log_activity
 from ...forms import ProfileForm, AccountSettingsForm
 from ...cache.cache_manager import cached_route, invalidate_user_cache, invalidate_model_cache
+from ...cache.cache_tags import model_tag
 from ...cache.cached_queries import (
     get_dashboard_statistics, get_recent_activities, get_total_users,
     invalidate_user_caches, invalidate_activity_caches
 )
 from ...services.notification_service import NotificationService
+from ...services.base_service import ServiceError
 from sqlalchemy.exc import NoResultFound
 from ..base_routes import UserRouteMixin
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
+NOTIFICATION_BULK_LIMIT = 500  # ids accepted per bulk request
+
 # Notification routes
 @user_bp.route('/notifications')
 @login_required
 def notifications():
     """User notifications page"""
     try:
-        notifications = NotificationService.get_user_notifications(current_user.id)
+        page = NotificationService.get_user_notifications_page(
+            current_user.id, cursor=request.args.get('cursor'), per_page=20
+        )
         unread_count = NotificationService.get_unread_count(current_user.id)
         
         return render_template('user/notifications.html',
-                             notifications=notifications,
+                             notifications=page['items'],
+                             next_cursor=page['next_cursor'],
                              unread_count=unread_count)
     except Exception as e:
         current_app.logger.error(f"Error loading user notifications: {str(e)}")
@@ -34,6 +41,63 @@ def notifications():
         return render_template('user/notifications.html',
                              notifications=[], unread_count=0)
 
+@user_bp.route('/notifications/mark-read/<notification_id>', methods=['POST'])
+@login_required
+def mark_notification_read(notification_id):
+    """Đánh dấu đã đọc (id thông báo riêng hoặc "b<id>" cho thông báo chung)"""
+    try:
+        updated = NotificationService.mark_as_read(notification_id, current_user.id)
+    except ServiceError as e:
+        return jsonify({'success': False, 'message': e.message}), e.code
+    return jsonify({'success': updated, 'unread_count': NotificationService.get_unread_count(current_user.id)})
+
+@user_bp.route('/notifications/mark-all-read', methods=['POST'])
+@login_required
+def mark_all_notifications_read():
+    """Đánh dấu tất cả thông báo là đã đọc"""
+    count = NotificationService.mark_all_as_read(current_user.id)
+    return jsonify({'success': True, 'count': count, 'unread_count': 0})
+
+def _selected_notification_ids():
+    """Id được chọn từ JSON {"ids": [...]} hoặc form ids=..."""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids') if isinstance(data.get('ids'), list) else request.form.getlist('ids')
+    return ids[:NOTIFICATION_BULK_LIMIT]
+
+@user_bp.route('/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_selected_notifications_read():
+    """Đánh dấu đã đọc các thông báo được chọn"""
+    try:
+        count = NotificationService.mark_many_as_read(_selected_notification_ids(), current_user.id)
+    except ServiceError as e:
+        return jsonify({'success': False, 'message': e.message}), e.code
+    return jsonify({'success': True, 'count': count,
+                    'unread_count': NotificationService.get_unread_count(current_user.id)})
+
+@user_bp.route('/notifications/archive', methods=['POST'])
+@login_required
+def archive_notifications():
+    """Lưu trữ các thông báo được chọn, hoặc tất cả thông báo cũ hơn older_than_days ngày"""
+    older_than_days = request.args.get('older_than_days', type=int)
+    try:
+        ids = None if older_than_days is not None else _selected_notification_ids()
+        count = NotificationService.archive_notifications(current_user.id, ids, older_than_days)
+    except ServiceError as e:
+        return jsonify({'success': False, 'message': e.message}), e.code
+    return jsonify({'success': True, 'count': count,
+                    'unread_count': NotificationService.get_unread_count(current_user.id)})
+
+@user_bp.route('/notifications/delete/<notification_id>', methods=['POST'])
+@login_required
+def delete_notification(notification_id):
+    """Xóa thông báo riêng, hoặc ẩn thông báo chung với người dùng này"""
+    try:
+        deleted = NotificationService.delete_notification(notification_id, current_user.id)
+    except ServiceError as e:
+        return jsonify({'success': False, 'message': e.message}), e.code
+    return jsonify({'success': deleted, 'unread_count': NotificationService.get_unread_count(current_user.id)})
+
 
 
 
@@ -64,7 +128,7 @@ def get_csrf_token():
 # Dashboard route
 @user_bp.route('/dashboard-old')
 @login_required
-@cached_route(timeout=180, key_prefix='user_dashboard')
+@cached_route(timeout=180, key_prefix='user_dashboard', tags=[model_tag('NguoiDung')])
 def dashboard_old():
     """User dashboard with caching - Uses API for data fetching"""
     session_data = {
@@ -79,7 +143,7 @@ def dashboard_old():
 # Session manager  
 @user_bp.route('/session-manager')
 @login_required
-@cached_route(timeout=300, key_prefix='user_session_manager')
+@cached_route(timeout=300, key_prefix='user_session_manager', tags=[model_tag('NguoiDung')])
 def session_manager():
     return render_template("session_manager.html", session=session)
 
@@ -91,6 +155,7 @@ def set_session():
     value = request.form.get("value")
     if key and value:
         session[key] = value
+        invalidate_user_cache(current_user.id)  # session manager page renders the session
         flash(f'Khóa session "{key}" đã được thiết lập thành công!', "success")
     else:
         flash("Cả khóa và giá trị đều là bắt buộc", "danger")
@@ -102,6 +167,7 @@ def set_session():
 def delete_session(key):
     if key in session:
         session.pop(key, None)
+        invalidate_user_cache(current_user.id)
         flash(f'Khóa session "{key}" đã được xóa', "success")
     else:
         flash(f'Không tìm thấy khóa session "{key}"', "danger")
@@ -118,12 +184,15 @@ def clear_session():
         session["user_email"] = user_email
     if login_time:
         session["login_time"] = login_time
+    invalidate_user_cache(current_user.id)
     flash("Tất cả dữ liệu phiên đã được xóa", "success")
     return redirect(url_for("user.session_manager"))
 
 @user_bp.route('/profile', methods=['GET', 'POST'])
 @login_required
-@cached_route(timeout=300, key_prefix='user_profile', unless=lambda: request.method == 'POST')
+@cached_route(timeout=300, key_prefix='user_profile', unless=lambda: request.method == 'POST',
+              tags=[model_tag('NguoiDung'), model_tag('CaThucHanh'), model_tag('DangKyCa'),
+                    model_tag('NhatKyHoatDong')])
 def profile():
     """User profile page"""
     form = ProfileForm(original_ten_nguoi_dung=current_user.ten_nguoi_dung, original_email=current_user.email)
@@ -8,6 +8,7 @@ Service để xử lý logic quản trị hệ thống.
 from .base_service import BaseService, ServiceError
 from ..models import NguoiDung, CaThucHanh, DangKyCa, NhatKyHoatDong, CaiDatHeThong, db
 from ..cache.cached_queries import invalidate_user_caches, invalidate_session_caches, invalidate_activity_caches
+from ..db_routing import read_from_replica
 from sqlalchemy import func, desc
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
@@ -18,6 +19,7 @@ class AdminService(BaseService):
     def __init__(self):
         super().__init__()
     
+    @read_from_replica
     def get_dashboard_stats(self) -> Tuple[Dict, int]:
         """Lấy thống kê cho dashboard admin"""
         try:
@@ -6,11 +6,16 @@ Base class cho tất cả services, cung cấp common functionality.
 """
 
 from flask import current_app, jsonify
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from ..models import db
 from ..utils import log_activity
 from ..cache.cache_manager import invalidate_model_cache, invalidate_user_cache
 from typing import Dict, Any, Optional, List, Union, Tuple
+from datetime import datetime
+import base64
+import binascii
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -139,6 +144,76 @@ class BaseService:
             self.logger.error(f"Pagination error: {str(e)}")
             raise ServiceError("Lỗi phân trang dữ liệu", 500)
     
+    @staticmethod
+    def keyset_paginate(query, sort_column, id_column, cursor: Optional[str] = None, per_page: int = 20,
+                        descending: bool = True, estimate_total: bool = False,
+                        total_cap: int = 10000) -> Dict:
+        """
+        Phân trang keyset (cursor) theo (sort_column, id_column)
+        
+        Thay OFFSET bằng điều kiện "sau bản ghi cuối của trang trước", nên chi phí
+        mỗi trang không tăng theo số trang và không bị lệch khi có bản ghi mới.
+        sort_column phải NOT NULL (so sánh với NULL luôn sai, các dòng NULL sẽ
+        bị bỏ qua); nên có chỉ mục trên (sort_column, id).
+        
+        Returns:
+            {'items': [...], 'next_cursor': str|None, 'has_next': bool, 'per_page': int,
+             'estimated_total': int|None, 'total_is_exact': bool}
+        """
+        estimated_total = None
+        total_is_exact = False
+        if estimate_total:
+            # Bounded count of the whole result (before the cursor), so every
+            # page shows the same total; at most total_cap index entries are read
+            limited = query.order_by(None).with_entities(id_column).limit(total_cap).subquery()
+            estimated_total = db.session.execute(select(func.count()).select_from(limited)).scalar()
+            total_is_exact = estimated_total < total_cap
+        
+        if cursor:
+            last_value, last_id = decode_cursor(cursor)
+            if descending:
+                query = query.filter(or_(sort_column < last_value,
+                                         and_(sort_column == last_value, id_column < last_id)))
+            else:
+                query = query.filter(or_(sort_column > last_value,
+                                         and_(sort_column == last_value, id_column > last_id)))
+        
+        order = (sort_column.desc(), id_column.desc()) if descending else (sort_column.asc(), id_column.asc())
+        rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        
+        next_cursor = None
+        if has_next:
+            last = items[-1]
+            next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+        
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'has_next': has_next,
+            'per_page': per_page,
+            'estimated_total': estimated_total,
+            'total_is_exact': total_is_exact
+        }
+    
+    def keyset_paginate_query(self, query, sort_column, id_column, cursor: Optional[str] = None,
+                              per_page: int = 20, descending: bool = True, estimate_total: bool = False) -> Dict:
+        """Phân trang keyset, trả về cùng dạng với paginate_query"""
+        page = self.keyset_paginate(query, sort_column, id_column, cursor, per_page, descending, estimate_total)
+        return {
+            'items': [item.to_dict() if hasattr(item, 'to_dict') else str(item)
+                     for item in page['items']],
+            'pagination': {
+                'per_page': page['per_page'],
+                'cursor': cursor,
+                'next_cursor': page['next_cursor'],
+                'has_next': page['has_next'],
+                'estimated_total': page['estimated_total'],
+                'total_is_exact': page['total_is_exact']
+            }
+        }
+    
     def _get_timestamp(self) -> str:
         """Get current timestamp"""
         from datetime import datetime
@@ -176,3 +251,21 @@ class BaseService:
                 setattr(instance, key, value)
         
         return instance
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Cursor mờ (base64url) cho vị trí (sort_value, row_id)"""
+    if isinstance(sort_value, datetime):
+        sort_value = {'dt': sort_value.isoformat()}
+    payload = json.dumps([sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Giải mã cursor từ encode_cursor; cursor sai định dạng -> ServiceError 400"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value['dt'])
+        return sort_value, int(row_id)
+    except (ValueError, TypeError, KeyError, binascii.Error, UnicodeError):
+        raise ServiceError("Cursor phân trang không hợp lệ", 400)
@@ -6,14 +6,32 @@ Service để xử lý logic liên quan đến phòng thực hành.
 """
 
 from .base_service import BaseService, ServiceError
-from ..models import CaThucHanh, DangKyCa, VaoCa, NguoiDung, db
-from ..cache.cached_queries import invalidate_session_caches
-from sqlalchemy import or_, and_
+from .notification_service import NotificationService, notify_lab_registration
+from ..models import CaThucHanh, DangKyCa, VaoCa, NguoiDung, NhatKyHoatDong, db, cap_nhat_bo_dem_ca, giu_cho_ca
+from ..cache.cache_manager import get_cache_manager
+from ..cache.cached_queries import invalidate_session_caches, invalidate_activity_caches
+from flask import current_app, has_request_context, request
+from sqlalchemy import or_, and_, func, event, inspect
+from sqlalchemy.exc import IntegrityError
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, date
+import csv
+import io
 import secrets
 import string
 
+# Upper bound for one bulk registration/check-in request
+MAX_BULK_ROWS = 1000
+
+# Cache hint "session is full": lets a registration rush be rejected without a transaction
+FULL_HINT_KEY_PREFIX = "_lab_session_full:"
+
+# Accepted column names for bulk user lists (JSON keys or CSV headers)
+BULK_ID_FIELDS = ('id', 'user_id', 'nguoi_dung_ma')
+BULK_EMAIL_FIELDS = ('email',)
+BULK_USERNAME_FIELDS = ('ten_nguoi_dung', 'username')
+BULK_NOTE_FIELDS = ('ghi_chu', 'notes')
+
 class LabSessionService(BaseService):
     """Service xử lý logic phòng thực hành"""
     
@@ -113,18 +131,50 @@ class LabSessionService(BaseService):
             self.logger.error(f"Error getting active sessions: {str(e)}")
             return self.error_response("Lỗi lấy danh sách ca thực hành", 500)
     
-    def register_for_session(self, user_id: int, session_id: int, notes: str = "") -> Tuple[Dict, int]:
-        """Đăng ký tham gia ca thực hành"""
+    def list_sessions_with_counts(self, order_by: Optional[List] = None, filters: Optional[List] = None) -> List[CaThucHanh]:
+        """
+        Lấy danh sách ca thực hành kèm số đăng ký và số đã vào ca
+        
+        Chỉ một câu truy vấn: đếm DangKyCa/VaoCa bằng subquery GROUP BY rồi
+        outer join vào CaThucHanh, thay vì COUNT riêng cho từng ca (N+1).
+        Kết quả được gán vào ``so_nguoi_dang_ky`` và ``so_nguoi_da_vao``
+        của từng đối tượng để template dùng trực tiếp.
+        """
+        registrations = self.db.session.query(
+            DangKyCa.ca_thuc_hanh_ma.label('ca_id'),
+            func.count(DangKyCa.id).label('so_dang_ky')
+        ).group_by(DangKyCa.ca_thuc_hanh_ma).subquery()
+        
+        attendances = self.db.session.query(
+            VaoCa.ca_thuc_hanh_ma.label('ca_id'),
+            func.count(VaoCa.id).label('so_da_vao')
+        ).group_by(VaoCa.ca_thuc_hanh_ma).subquery()
+        
+        query = self.db.session.query(
+            self.model,
+            func.coalesce(registrations.c.so_dang_ky, 0),
+            func.coalesce(attendances.c.so_da_vao, 0)
+        ).outerjoin(
+            registrations, registrations.c.ca_id == self.model.id
+        ).outerjoin(
+            attendances, attendances.c.ca_id == self.model.id
+        )
+        
+        if filters:
+            query = query.filter(*filters)
+        query = query.order_by(*(order_by or [self.model.ngay.desc()]))
+        
+        sessions = []
+        for session, so_dang_ky, so_da_vao in query.all():
+            session.so_nguoi_dang_ky = so_dang_ky
+            session.so_nguoi_da_vao = so_da_vao
+            sessions.append(session)
+        return sessions
+    
+    def register_for_session(self, user_id: int, session_id: int, notes: str = "", uu_tien: int = 0) -> Tuple[Dict, int]:
+        """Đăng ký tham gia ca thực hành (uu_tien: độ ưu tiên khi đăng ký qua hàng đợi)"""
         try:
-            # Check if session exists and is active
-            session = self.get_session_by_id(session_id)
-            if not session:
-                raise ServiceError("Ca thực hành không tồn tại", 404)
-            
-            if not session.dang_hoat_dong:
-                raise ServiceError("Ca thực hành không còn hoạt động", 400)
-            
-            # Check if user already registered
+            # Check if user already registered (the unique index still guards the race)
             existing_registration = DangKyCa.query.filter_by(
                 nguoi_dung_ma=user_id,
                 ca_thuc_hanh_ma=session_id
@@ -133,19 +183,32 @@ class LabSessionService(BaseService):
             if existing_registration:
                 raise ServiceError("Bạn đã đăng ký ca thực hành này", 409)
             
-            # Check capacity
-            current_registrations = DangKyCa.query.filter_by(ca_thuc_hanh_ma=session_id).count()
-            if current_registrations >= session.so_luong_toi_da:
-                raise ServiceError("Ca thực hành đã đầy", 400)
+            # Fast path: session recently seen full, reject without the seat UPDATE
+            reject_if_known_full(user_id, session_id)
+            
+            # Reserve a seat atomically: UPDATE ... SET so_dang_ky = so_dang_ky + 1
+            # WHERE so_dang_ky < so_luong_toi_da, so concurrent requests cannot oversubscribe
+            if not giu_cho_ca(session_id):
+                self.db.session.rollback()
+                session = self.get_session_by_id(session_id)
+                if not session:
+                    raise ServiceError("Ca thực hành không tồn tại", 404)
+                if not session.dang_hoat_dong:
+                    raise ServiceError("Ca thực hành không còn hoạt động", 400)
+                mark_session_full(session_id)
+                raise_session_full(user_id, session_id)
             
-            # Create registration
-            registration = DangKyCa(
+            # Core insert: the seat is already counted, skip the mapper counter listeners
+            self.db.session.execute(DangKyCa.__table__.insert().values(
                 nguoi_dung_ma=user_id,
                 ca_thuc_hanh_ma=session_id,
-                ghi_chu=notes
-            )
-            
-            self.db.session.add(registration)
+                ghi_chu=notes,
+                uu_tien=uu_tien,
+                ngay_dang_ky=datetime.utcnow()
+            ))
+            session = self.get_session_by_id(session_id)
+            # Notification and its outbox delivery commit with the registration
+            notify_lab_registration(user_id, session.tieu_de, commit=False)
             self.safe_commit()
             
             # Log activity
@@ -155,9 +218,334 @@ class LabSessionService(BaseService):
             
         except ServiceError:
             raise
+        except IntegrityError:
+            # Concurrent duplicate registration hit uq_dang_ky_ca_nguoi_dung_ca
+            self.db.session.rollback()
+            raise ServiceError("Bạn đã đăng ký ca thực hành này", 409)
         except Exception as e:
             return self.handle_database_error(e, "đăng ký ca thực hành")
     
+    # Bulk operations
+    
+    def bulk_register(self, session_id: int, rows: List[Any], actor_id: Optional[int] = None) -> Tuple[Dict, int]:
+        """
+        Đăng ký hàng loạt người dùng vào một ca trong một transaction
+        
+        rows: id (số JSON), email, tên đăng nhập hoặc dict {id|email|ten_nguoi_dung, ghi_chu}.
+        Chuỗi toàn chữ số là tên đăng nhập; id dạng chuỗi phải nằm trong cột/trường id.
+        Mỗi dòng được báo succeeded/failed; các dòng vượt số chỗ còn lại bị từ chối
+        theo thứ tự trong danh sách.
+        """
+        try:
+            session = self._get_session_for_update(session_id)
+            results = self._resolve_bulk_users(rows)
+            candidates = [r for r in results if r['status'] == 'pending']
+            
+            registered = self._existing_user_ids(DangKyCa, session_id, [r['user_id'] for r in candidates])
+            remaining = max(0, session.so_luong_toi_da - (session.so_dang_ky or 0))
+            accepted = []
+            for result in candidates:
+                if result['user_id'] in registered:
+                    self._fail_row(result, 'already_registered', "Đã đăng ký ca thực hành này")
+                elif len(accepted) >= remaining:
+                    self._fail_row(result, 'session_full', "Ca thực hành đã đầy")
+                else:
+                    result['status'] = 'succeeded'
+                    accepted.append(result)
+            
+            if accepted:
+                now = datetime.utcnow()
+                self.db.session.execute(DangKyCa.__table__.insert(), [{
+                    'nguoi_dung_ma': result['user_id'],
+                    'ca_thuc_hanh_ma': session_id,
+                    'ghi_chu': result['notes'],
+                    'ngay_dang_ky': now
+                } for result in accepted])
+                # executemany bypasses the DangKyCa mapper listeners
+                cap_nhat_bo_dem_ca(session_id, so_dang_ky=len(accepted))
+                
+                NotificationService.add_notifications_bulk(
+                    [result['user_id'] for result in accepted],
+                    "Đăng ký ca thực hành thành công",
+                    f"Bạn đã được đăng ký vào ca thực hành '{session.tieu_de}'.",
+                    "success"
+                )
+                self._add_bulk_log(actor_id, "Đăng ký hàng loạt",
+                                   f"Đăng ký {len(accepted)}/{len(results)} người dùng vào ca {session.tieu_de}")
+            
+            self.safe_commit()
+            if accepted:
+                invalidate_session_caches()
+                invalidate_activity_caches()
+            if len(accepted) >= remaining:
+                mark_session_full(session_id)
+            
+            return self.success_response(
+                f"Đã đăng ký {len(accepted)}/{len(results)} người dùng",
+                self._bulk_summary(results)
+            )
+            
+        except ServiceError:
+            self.db.session.rollback()
+            raise
+        except Exception as e:
+            return self.handle_database_error(e, "đăng ký hàng loạt")
+    
+    def bulk_check_in(self, session_id: int, rows: List[Any], actor_id: Optional[int] = None) -> Tuple[Dict, int]:
+        """Điểm danh hàng loạt (tạo VaoCa) cho người dùng đã đăng ký ca, trong một transaction"""
+        try:
+            session = self._get_session_for_update(session_id)
+            results = self._resolve_bulk_users(rows)
+            candidates = [r for r in results if r['status'] == 'pending']
+            user_ids = [r['user_id'] for r in candidates]
+            
+            registered = self._existing_user_ids(DangKyCa, session_id, user_ids)
+            checked_in = self._existing_user_ids(VaoCa, session_id, user_ids)
+            accepted = []
+            for result in candidates:
+                if result['user_id'] not in registered:
+                    self._fail_row(result, 'not_registered', "Chưa đăng ký ca thực hành này")
+                elif result['user_id'] in checked_in:
+                    self._fail_row(result, 'already_checked_in', "Đã vào ca")
+                else:
+                    result['status'] = 'succeeded'
+                    accepted.append(result)
+            
+            if accepted:
+                accepted_ids = [result['user_id'] for result in accepted]
+                self.db.session.execute(VaoCa.__table__.insert(), [{
+                    'nguoi_dung_ma': user_id,
+                    'ca_thuc_hanh_ma': session_id,
+                    'thoi_gian_vao': datetime.utcnow()
+                } for user_id in accepted_ids])
+                self.db.session.execute(
+                    DangKyCa.__table__.update()
+                    .where(DangKyCa.ca_thuc_hanh_ma == session_id, DangKyCa.nguoi_dung_ma.in_(accepted_ids))
+                    .values(trang_thai_tham_gia="da_tham_gia")
+                )
+                cap_nhat_bo_dem_ca(session_id, so_da_vao=len(accepted))
+                self._add_bulk_log(actor_id, "Điểm danh hàng loạt",
+                                   f"Điểm danh {len(accepted)}/{len(results)} người dùng vào ca {session.tieu_de}")
+            
+            self.safe_commit()
+            if accepted:
+                invalidate_session_caches()
+                invalidate_activity_caches()
+            
+            return self.success_response(
+                f"Đã điểm danh {len(accepted)}/{len(results)} người dùng",
+                self._bulk_summary(results)
+            )
+            
+        except ServiceError:
+            self.db.session.rollback()
+            raise
+        except Exception as e:
+            return self.handle_database_error(e, "điểm danh hàng loạt")
+    
+    @staticmethod
+    def parse_bulk_csv(text: str) -> List[Any]:
+        """Đọc danh sách người dùng từ CSV (có header id/email/ten_nguoi_dung/ghi_chu, hoặc một cột email/tên đăng nhập)"""
+        lines = [line for line in text.splitlines() if line.strip()]
+        if not lines:
+            return []
+        known = set(BULK_ID_FIELDS + BULK_EMAIL_FIELDS + BULK_USERNAME_FIELDS + BULK_NOTE_FIELDS)
+        header = [column.strip().lower() for column in next(csv.reader([lines[0]]))]
+        if known & set(header):
+            reader = csv.DictReader(io.StringIO("\n".join(lines[1:])), fieldnames=header)
+            return [{key: (value or '').strip() for key, value in row.items() if key} for row in reader]
+        return [row[0].strip() for row in csv.reader(lines) if row]
+    
+    def _get_session_for_update(self, session_id: int) -> CaThucHanh:
+        # FOR UPDATE serialises concurrent bulk operations on the same session (ignored by SQLite)
+        session = self.model.query.filter_by(id=session_id).with_for_update().first()
+        if not session:
+            raise ServiceError("Ca thực hành không tồn tại", 404)
+        if not session.dang_hoat_dong:
+            raise ServiceError("Ca thực hành không còn hoạt động", 400)
+        return session
+    
+    def _resolve_bulk_users(self, rows: List[Any]) -> List[Dict]:
+        """Map every row to a user id with at most three IN queries"""
+        if not isinstance(rows, list) or not rows:
+            raise ServiceError("Danh sách người dùng trống", 400)
+        if len(rows) > MAX_BULK_ROWS:
+            raise ServiceError(f"Tối đa {MAX_BULK_ROWS} dòng mỗi lần", 400)
+        
+        results = []
+        lookups = {'id': set(), 'email': set(), 'ten_nguoi_dung': set()}
+        for index, row in enumerate(rows, start=1):
+            field, value, notes = self._parse_bulk_row(row)
+            result = {'row': index, 'input': row, 'user_id': None, 'status': 'pending', 'notes': notes}
+            if field is None:
+                self._fail_row(result, 'invalid_row', "Dòng không hợp lệ")
+            else:
+                result['lookup'] = (field, value)
+                lookups[field].add(value)
+            results.append(result)
+        
+        found = {}
+        for field, values in lookups.items():
+            if not values:
+                continue
+            column = getattr(NguoiDung, field)
+            # Emails are matched case-insensitively: values are already lowercased
+            match = func.lower(column) if field == 'email' else column
+            for user_id, key in self.db.session.query(NguoiDung.id, column).filter(match.in_(values)):
+                found[(field, key.lower() if field == 'email' else key)] = user_id
+        
+        seen = set()
+        for result in results:
+            lookup = result.pop('lookup', None)
+            if lookup is None:
+                continue
+            user_id = found.get(lookup)
+            if user_id is None:
+                self._fail_row(result, 'user_not_found', "Không tìm thấy người dùng")
+            elif user_id in seen:
+                result['user_id'] = user_id
+                self._fail_row(result, 'duplicate_row', "Người dùng lặp lại trong danh sách")
+            else:
+                result['user_id'] = user_id
+                seen.add(user_id)
+        return results
+    
+    @staticmethod
+    def _parse_bulk_row(row: Any) -> Tuple[Optional[str], Any, Optional[str]]:
+        """
+        (lookup field, value, notes) for one input row
+        
+        A row is an id only when it says so: an id/ma column or field, or a
+        JSON number. A bare string of digits is a username, not an id.
+        """
+        notes = None
+        if isinstance(row, dict):
+            notes = next((row[key] for key in BULK_NOTE_FIELDS if row.get(key)), None)
+            for fields, target in ((BULK_ID_FIELDS, 'id'), (BULK_EMAIL_FIELDS, 'email'),
+                                   (BULK_USERNAME_FIELDS, 'ten_nguoi_dung')):
+                value = next((row[key] for key in fields if row.get(key) not in (None, '')), None)
+                if value is not None:
+                    break
+            else:
+                return None, None, notes
+            if target == 'id':
+                if isinstance(value, int) and not isinstance(value, bool):
+                    return 'id', value, notes
+                value = str(value).strip()
+                return ('id', int(value), notes) if value.isdigit() else (None, None, notes)
+            if not isinstance(value, str) or not value.strip():
+                return None, None, notes
+            value = value.strip()
+            return (target, value.lower() if target == 'email' else value, notes)
+        if isinstance(row, bool):
+            return None, None, notes
+        if isinstance(row, int):
+            return 'id', row, notes
+        if not isinstance(row, str) or not row.strip():
+            return None, None, notes
+        value = row.strip()
+        if '@' in value:
+            return 'email', value.lower(), notes
+        return 'ten_nguoi_dung', value, notes
+    
+    def _existing_user_ids(self, model, session_id: int, user_ids: List[int]) -> set:
+        if not user_ids:
+            return set()
+        rows = self.db.session.query(model.nguoi_dung_ma).filter(
+            model.ca_thuc_hanh_ma == session_id, model.nguoi_dung_ma.in_(user_ids)
+        )
+        return {user_id for (user_id,) in rows}
+    
+    def _add_bulk_log(self, actor_id: Optional[int], action: str, details: str) -> None:
+        # One summary entry in the same transaction instead of one commit per user
+        self.db.session.add(NhatKyHoatDong(
+            nguoi_dung_ma=actor_id,
+            hanh_dong=action,
+            chi_tiet=details,
+            dia_chi_ip=request.remote_addr if has_request_context() else None
+        ))
+    
+    @staticmethod
+    def _fail_row(result: Dict, error: str, message: str) -> None:
+        result['status'] = 'failed'
+        result['error'] = error
+        result['message'] = message
+    
+    @staticmethod
+    def _bulk_summary(results: List[Dict]) -> Dict:
+        rows = [{key: value for key, value in result.items() if key != 'notes'} for result in results]
+        succeeded = sum(1 for result in results if result['status'] == 'succeeded')
+        return {
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'rows': rows
+        }
+    
     def _generate_verification_code(self) -> str:
         """Tạo mã xác thực ngẫu nhiên"""
         return ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(6))
+
+
+# "Session full" hint
+
+def is_session_known_full(session_id: int) -> bool:
+    """True if a recent reservation found the session full (cache hint, may be slightly stale)"""
+    cache = get_cache_manager().get_cache()
+    if cache is None:
+        return False
+    try:
+        return bool(cache.get(f"{FULL_HINT_KEY_PREFIX}{session_id}"))
+    except Exception:
+        return False
+
+
+def reject_if_known_full(user_id: int, session_id: int) -> None:
+    """ServiceError 400 if the session was recently seen full; 409 if the user is already registered"""
+    if is_session_known_full(session_id):
+        raise_session_full(user_id, session_id)
+
+
+def raise_session_full(user_id: int, session_id: int) -> None:
+    """ServiceError for a full session: 409 if the user holds one of the seats, 400 otherwise"""
+    # Looked up again: a concurrent request by the same user may have taken
+    # the last seat after this request's duplicate check
+    if DangKyCa.query.filter_by(nguoi_dung_ma=user_id, ca_thuc_hanh_ma=session_id).first():
+        raise ServiceError("Bạn đã đăng ký ca thực hành này", 409)
+    raise ServiceError("Ca thực hành đã đầy", 400)
+
+
+def mark_session_full(session_id: int) -> None:
+    seconds = current_app.config.get('LAB_FULL_HINT_SECONDS', 10)
+    cache = get_cache_manager().get_cache()
+    if cache is None or not seconds:
+        return
+    try:
+        cache.set(f"{FULL_HINT_KEY_PREFIX}{session_id}", True, timeout=seconds)
+    except Exception:
+        pass
+
+
+def clear_session_full(session_id: int) -> None:
+    cache = get_cache_manager().get_cache()
+    if cache is None:
+        return
+    try:
+        cache.delete(f"{FULL_HINT_KEY_PREFIX}{session_id}")
+    except Exception:
+        pass
+
+
+def _clear_full_hint_on_cancel(mapper, connection, target) -> None:
+    # A freed seat must be visible before the hint expires
+    clear_session_full(target.ca_thuc_hanh_ma)
+
+
+def _clear_full_hint_on_update(mapper, connection, target) -> None:
+    state = inspect(target)
+    if state.attrs.so_luong_toi_da.history.has_changes() or state.attrs.dang_hoat_dong.history.has_changes():
+        clear_session_full(target.id)
+
+
+event.listen(DangKyCa, 'after_delete', _clear_full_hint_on_cancel)
+event.listen(CaThucHanh, 'after_update', _clear_full_hint_on_update)
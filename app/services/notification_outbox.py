@@ -0,0 +1,283 @@
+"""
+Notification Delivery Outbox
+============================
+
+Transactional outbox for notification delivery (SocketIO pushes and email).
+
+- ``enqueue_socketio`` / ``enqueue_email`` add a ``HopThuThongBao`` row to
+  the current session (``enqueue_socketio_many`` for bulk inserts). The row
+  is committed (or rolled back) together with the notification and the
+  business change that produced it; the request never talks to SocketIO or
+  SMTP.
+- One dispatcher thread per serving process drains due rows in batches of
+  ``NOTIFICATION_OUTBOX_BATCH``. It wakes up right after a commit that
+  enqueued rows, and every ``NOTIFICATION_OUTBOX_POLL_SECONDS`` otherwise.
+  The thread starts with the first request, only when
+  ``NOTIFICATION_OUTBOX_DISPATCHER`` is on, so ``flask db upgrade`` and
+  db_manager commands never start it. With the flag off, run a dedicated
+  worker: ``python db_manager.py drain-outbox --watch``.
+- Rows are claimed with a conditional UPDATE (``ma_xu_ly`` token plus a
+  ``khoa_den`` lease), so several processes can drain the same table without
+  sending a row twice; a claim left by a dead process expires.
+- A failed delivery is retried with exponential backoff
+  (``NOTIFICATION_OUTBOX_BACKOFF_SECONDS`` * 2^(attempt-1), with jitter) up to
+  ``NOTIFICATION_OUTBOX_MAX_ATTEMPTS``, then marked ``that_bai``.
+
+Delivery is at-least-once: a process that dies after emitting but before
+marking the row sent will have it re-sent once the lease expires.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import random
+import secrets
+import threading
+import logging
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+
+from ..models import db, HopThuThongBao
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_SOCKETIO = 'socketio'
+CHANNEL_EMAIL = 'email'
+
+STATUS_PENDING = 'cho'
+STATUS_SENT = 'da_gui'
+STATUS_FAILED = 'that_bai'
+
+LEASE_SECONDS = 60  # a claimed batch must be delivered within this window
+MAX_BACKOFF_SECONDS = 3600
+SESSION_ENQUEUED_KEY = 'outbox_enqueued'
+
+
+def enqueue_socketio(room: str, event_name: str, payload: Dict[str, Any], session=None) -> HopThuThongBao:
+    """Queue a SocketIO emit to room; delivered after the surrounding transaction commits"""
+    return _enqueue(session, CHANNEL_SOCKETIO, room, event_name, payload)
+
+
+def enqueue_socketio_many(emits: List[Tuple[str, str, Dict[str, Any]]], session=None) -> int:
+    """Queue (room, event, payload) emits with one executemany INSERT; same delivery as enqueue_socketio"""
+    if not emits:
+        return 0
+    session = session or db.session
+    now = datetime.utcnow()
+    session.execute(HopThuThongBao.__table__.insert(), [{
+        'kenh': CHANNEL_SOCKETIO,
+        'dich': room,
+        'su_kien': event_name,
+        'du_lieu': json.dumps(payload, default=str),
+        'trang_thai': STATUS_PENDING,
+        'so_lan_thu': 0,
+        'lan_thu_tiep': now,
+        'ngay_tao': now
+    } for room, event_name, payload in emits])
+    session.info[SESSION_ENQUEUED_KEY] = True
+    return len(emits)
+
+
+def enqueue_email(recipient: str, subject: str, text_body: str, html_body: Optional[str] = None,
+                  session=None) -> HopThuThongBao:
+    """Queue an email; delivered after the surrounding transaction commits"""
+    return _enqueue(session, CHANNEL_EMAIL, recipient, subject[:100], {'text': text_body, 'html': html_body})
+
+
+def _enqueue(session, channel: str, target: str, event_name: str, payload: Dict[str, Any]) -> HopThuThongBao:
+    session = session or db.session
+    now = datetime.utcnow()
+    row = HopThuThongBao(
+        kenh=channel,
+        dich=target,
+        su_kien=event_name,
+        du_lieu=json.dumps(payload, default=str),
+        trang_thai=STATUS_PENDING,
+        so_lan_thu=0,
+        lan_thu_tiep=now,
+        ngay_tao=now
+    )
+    session.add(row)
+    session.info[SESSION_ENQUEUED_KEY] = True
+    return row
+
+
+class OutboxDispatcher:
+    """Background drainer of HopThuThongBao rows"""
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._installed = False
+        self.metrics = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+
+    def init_app(self, app, socketio=None) -> None:
+        self.app = app
+        self.socketio = socketio
+        if not self._installed:
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+            self._installed = True
+        if app.config.get('NOTIFICATION_OUTBOX_DISPATCHER', True):
+            # Only processes that serve requests get a worker (not the CLI or migrations)
+            app.before_request(self._ensure_worker)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def run(self) -> None:
+        """Drain in the foreground until interrupted (dedicated worker process)"""
+        self._run()
+
+    # Draining
+
+    def drain(self, batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict[str, int]:
+        """Deliver due rows until none are left (or max_batches); needs an app context"""
+        batch_size = batch_size or self._config('NOTIFICATION_OUTBOX_BATCH', 100)
+        result = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+        while max_batches is None or result['batches'] < max_batches:
+            rows = self._claim(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                self._deliver(row, result)
+            db.session.commit()
+            result['batches'] += 1
+            if len(rows) < batch_size:
+                break
+        for key, value in result.items():
+            self.metrics[key] += value
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(db.session.query(HopThuThongBao.trang_thai, db.func.count(HopThuThongBao.id))
+                      .group_by(HopThuThongBao.trang_thai).all())
+        return dict(self.metrics, pending=counts.get(STATUS_PENDING, 0), sent_rows=counts.get(STATUS_SENT, 0),
+                    failed_rows=counts.get(STATUS_FAILED, 0),
+                    worker_alive=bool(self._thread and self._thread.is_alive()))
+
+    def purge(self, older_than: datetime) -> int:
+        """Delete delivered rows created before older_than (caller commits)"""
+        return HopThuThongBao.query.filter(
+            HopThuThongBao.trang_thai == STATUS_SENT,
+            HopThuThongBao.ngay_tao < older_than
+        ).delete(synchronize_session=False)
+
+    def _claim(self, batch_size: int) -> List[HopThuThongBao]:
+        now = datetime.utcnow()
+        ids = [row.id for row in db.session.query(HopThuThongBao.id).filter(
+            HopThuThongBao.trang_thai == STATUS_PENDING,
+            HopThuThongBao.lan_thu_tiep <= now,
+            or_(HopThuThongBao.khoa_den.is_(None), HopThuThongBao.khoa_den < now)
+        ).order_by(HopThuThongBao.id).limit(batch_size)]
+        if not ids:
+            db.session.rollback()
+            return []
+
+        token = secrets.token_hex(16)
+        # Conditional UPDATE: rows another dispatcher claimed in the meantime are skipped
+        HopThuThongBao.query.filter(
+            HopThuThongBao.id.in_(ids),
+            HopThuThongBao.trang_thai == STATUS_PENDING,
+            or_(HopThuThongBao.khoa_den.is_(None), HopThuThongBao.khoa_den < now)
+        ).update({'ma_xu_ly': token, 'khoa_den': now + timedelta(seconds=LEASE_SECONDS)},
+                 synchronize_session=False)
+        db.session.commit()
+        return HopThuThongBao.query.filter_by(ma_xu_ly=token).order_by(HopThuThongBao.id).all()
+
+    def _deliver(self, row: HopThuThongBao, result: Dict[str, int]) -> None:
+        row.so_lan_thu += 1
+        row.ma_xu_ly = row.khoa_den = None
+        try:
+            if row.kenh == CHANNEL_SOCKETIO:
+                self._emit(row)
+            elif row.kenh == CHANNEL_EMAIL:
+                self._send_email(row)
+            else:
+                raise ValueError(f"Unknown outbox channel {row.kenh}")
+        except Exception as e:
+            row.loi_cuoi = str(e)[:2000]
+            if row.so_lan_thu >= self._config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 6):
+                row.trang_thai = STATUS_FAILED
+                result['failed'] += 1
+                logger.error(f"Outbox row {row.id} ({row.kenh} -> {row.dich}) failed permanently: {e}")
+            else:
+                row.lan_thu_tiep = datetime.utcnow() + timedelta(seconds=self._backoff(row.so_lan_thu))
+                result['retried'] += 1
+                logger.warning(f"Outbox row {row.id} ({row.kenh} -> {row.dich}) failed, retrying: {e}")
+            return
+        row.trang_thai = STATUS_SENT
+        row.ngay_gui = datetime.utcnow()
+        row.loi_cuoi = None
+        result['sent'] += 1
+
+    def _emit(self, row: HopThuThongBao) -> None:
+        socketio = self.socketio or (self.app.extensions.get('socketio') if self.app else None)
+        if socketio is None:
+            raise RuntimeError("SocketIO is not initialized")
+        socketio.emit(row.su_kien, row.get_du_lieu(), room=row.dich)
+
+    def _send_email(self, row: HopThuThongBao) -> None:
+        from flask_mail import Mail, Message
+
+        body = row.get_du_lieu()
+        message = Message(
+            subject=row.su_kien,
+            recipients=[row.dich],
+            body=body.get('text'),
+            html=body.get('html'),
+            sender=self.app.config.get('MAIL_DEFAULT_SENDER')
+        )
+        mail = self.app.extensions.get('mail') or Mail(self.app)
+        mail.send(message)
+
+    def _backoff(self, attempt: int) -> float:
+        base = self._config('NOTIFICATION_OUTBOX_BACKOFF_SECONDS', 5)
+        delay = min(base * 2 ** (attempt - 1), MAX_BACKOFF_SECONDS)
+        return delay * random.uniform(0.8, 1.2)
+
+    # Worker
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:  # concurrent first requests start one thread
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notification-outbox", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        poll = self._config('NOTIFICATION_OUTBOX_POLL_SECONDS', 2)
+        while True:
+            self._wake.wait(poll)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.drain()
+                except Exception as e:
+                    logger.error(f"Outbox dispatcher error: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _after_commit(self, session) -> None:
+        if session.info.pop(SESSION_ENQUEUED_KEY, None):
+            self.wake()
+
+    def _after_rollback(self, session) -> None:
+        session.info.pop(SESSION_ENQUEUED_KEY, None)
+
+    def _config(self, key: str, default):
+        return self.app.config.get(key, default) if self.app else default
+
+
+outbox_dispatcher = OutboxDispatcher()
+
+
+def init_outbox_dispatcher(app, socketio=None) -> OutboxDispatcher:
+    outbox_dispatcher.init_app(app, socketio)
+    return outbox_dispatcher
@@ -6,9 +6,75 @@ Service for handling user notifications and real-time alerts.
 """
 
 from flask import current_app
-from datetime import datetime
-from typing import List, Optional
-from ..models import db, ThongBao, NguoiDung
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import and_, exists, false, func, literal, or_, select, true
+import time
+from ..models import db, ThongBao, ThongBaoChung, ThongBaoChungNguoiNhan, BienNhanThongBao, NguoiDung
+from .base_service import BaseService, ServiceError, encode_cursor, decode_cursor
+from ..cache.unread_counters import unread_counters
+from .notification_outbox import enqueue_socketio, enqueue_socketio_many, enqueue_email, outbox_dispatcher
+
+# SocketIO room every logged-in user joins; role rooms are f"role_{vai_tro}"
+ALL_USERS_ROOM = 'all_users'
+
+# ThongBaoChung audiences
+AUDIENCE_ALL = 'all'
+AUDIENCE_ROLE = 'role'
+AUDIENCE_USERS = 'users'
+
+# Public ids: direct notifications keep their integer id, broadcasts are "b<id>"
+DIRECT = 'direct'
+BROADCAST = 'broadcast'
+BROADCAST_ID_PREFIX = 'b'
+
+
+def parse_notification_id(value) -> tuple:
+    """12 / "12" -> ('direct', 12); "b12" -> ('broadcast', 12)"""
+    text = str(value).strip()
+    if text.startswith(BROADCAST_ID_PREFIX) and text[1:].isdigit():
+        return BROADCAST, int(text[1:])
+    if text.isdigit():
+        return DIRECT, int(text)
+    raise ServiceError("Mã thông báo không hợp lệ", 400)
+
+
+class NotificationItem:
+    """A direct ThongBao or a broadcast as seen by one user"""
+    
+    __slots__ = ('id', 'key', 'kind', 'tieu_de', 'noi_dung', 'loai', 'lien_ket', 'da_doc', 'ngay_tao', 'ngay_doc')
+    
+    def __init__(self, kind: str, row_id: int, row):
+        self.kind = kind
+        self.id = f"{BROADCAST_ID_PREFIX}{row_id}" if kind == BROADCAST else row_id
+        self.key = row_id * 2 + (1 if kind == BROADCAST else 0)  # merged keyset tie-breaker
+        self.tieu_de = row.tieu_de
+        self.noi_dung = row.noi_dung
+        self.loai = row.loai
+        self.lien_ket = row.lien_ket
+        self.da_doc = bool(row.da_doc)
+        self.ngay_tao = row.ngay_tao
+        self.ngay_doc = row.ngay_doc
+    
+    @classmethod
+    def from_direct(cls, notification: ThongBao) -> 'NotificationItem':
+        return cls(DIRECT, notification.id, notification)
+    
+    @classmethod
+    def from_broadcast(cls, row) -> 'NotificationItem':
+        return cls(BROADCAST, row.id, row)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'title': self.tieu_de,
+            'content': self.noi_dung,
+            'type': self.loai,
+            'link': self.lien_ket,
+            'read': self.da_doc,
+            'created_at': self.ngay_tao.isoformat() if self.ngay_tao else None
+        }
 
 
 class NotificationService:
@@ -20,9 +86,18 @@ class NotificationService:
         title: str,
         content: str,
         notification_type: str = "info",
-        link: Optional[str] = None
+        link: Optional[str] = None,
+        commit: bool = True,
+        email: bool = False
     ) -> ThongBao:
-        """Create a new notification"""
+        """
+        Create a new notification
+        
+        The real-time push (and the email when email=True and
+        NOTIFICATION_EMAIL_ENABLED) is queued in the outbox in the same
+        transaction and delivered by the dispatcher. With commit=False the
+        caller commits it together with its own change.
+        """
         try:
             notification = ThongBao(
                 nguoi_nhan=user_id,
@@ -34,22 +109,23 @@ class NotificationService:
             )
             
             db.session.add(notification)
-            db.session.commit()
+            db.session.flush()
             
-            # Emit real-time notification if SocketIO is available
-            try:
-                from flask_socketio import emit
-                emit('new_notification', {
-                    'id': notification.id,
-                    'title': title,
-                    'content': content,
-                    'type': notification_type,
-                    'link': link,
-                    'timestamp': notification.ngay_tao.isoformat()
-                }, room=f'user_{user_id}')
-            except:
-                pass  # SocketIO not available
+            enqueue_socketio(f'user_{user_id}', 'new_notification', {
+                'id': notification.id,
+                'title': title,
+                'content': content,
+                'type': notification_type,
+                'link': link,
+                'timestamp': notification.ngay_tao.isoformat()
+            })
+            if email and current_app.config.get('NOTIFICATION_EMAIL_ENABLED'):
+                user = db.session.get(NguoiDung, user_id)
+                if user is not None and user.email:
+                    enqueue_email(user.email, title, f"{content}\n\n{link or ''}".strip())
             
+            if commit:
+                db.session.commit()
             return notification
             
         except Exception as e:
@@ -58,21 +134,115 @@ class NotificationService:
             raise
     
     @staticmethod
-    def get_user_notifications(user_id: int, unread_only: bool = False, limit: int = 50) -> List[ThongBao]:
-        """Get notifications for a user"""
-        query = ThongBao.query.filter_by(nguoi_nhan=user_id)
+    def add_notifications_bulk(
+        user_ids: List[int],
+        title: str,
+        content: str,
+        notification_type: str = "info",
+        link: Optional[str] = None
+    ) -> int:
+        """
+        Insert one notification per user in a single executemany (caller commits)
         
+        The new_notification pushes are queued in the outbox in the same
+        transaction, like create_notification.
+        """
+        if not user_ids:
+            return 0
+        now = datetime.utcnow()
+        # executemany returns no ids (no RETURNING here): remember where this
+        # insert starts so the read-back below cannot pick up another bulk
+        # send with the same title and timestamp
+        max_id = db.session.query(func.max(ThongBao.id)).scalar() or 0
+        db.session.execute(ThongBao.__table__.insert(), [{
+            'nguoi_nhan': user_id,
+            'tieu_de': title,
+            'noi_dung': content,
+            'loai': notification_type,
+            'lien_ket': link,
+            'da_doc': False,
+            'ngay_tao': now
+        } for user_id in user_ids])
+        # Core insert skips the ThongBao mapper events
+        unread_counters.record(db.session, user_ids, 1)
+        
+        inserted = db.session.query(ThongBao.id, ThongBao.nguoi_nhan).filter(
+            ThongBao.id > max_id,
+            ThongBao.nguoi_nhan.in_(user_ids),
+            ThongBao.ngay_tao == now,
+            ThongBao.tieu_de == title
+        )
+        enqueue_socketio_many([(f'user_{user_id}', 'new_notification', {
+            'id': notification_id,
+            'title': title,
+            'content': content,
+            'type': notification_type,
+            'link': link,
+            'timestamp': now.isoformat()
+        }) for notification_id, user_id in inserted])
+        return len(user_ids)
+    
+    @staticmethod
+    def get_user_notifications(user_id: int, unread_only: bool = False, limit: int = 50) -> List['NotificationItem']:
+        """Get a user's direct and broadcast notifications, newest first"""
+        return NotificationService.get_user_notifications_page(user_id, per_page=limit, unread_only=unread_only)['items']
+    
+    @staticmethod
+    def get_user_notifications_page(user_id: int, cursor: Optional[str] = None, per_page: int = 20,
+                                    unread_only: bool = False) -> Dict:
+        """
+        Get one keyset page of a user's notifications, newest first
+        
+        Direct ThongBao rows and visible ThongBaoChung broadcasts are paged
+        separately on (ngay_tao, id) and merged. The cursor carries the merged
+        position as (ngay_tao, key) with key = 2 * id (+1 for broadcasts).
+        """
+        direct_cursor = broadcast_cursor = None
+        if cursor:
+            last_value, last_key = decode_cursor(cursor)
+            direct_cursor = encode_cursor(last_value, (last_key + 1) // 2)
+            broadcast_cursor = encode_cursor(last_value, last_key // 2)
+        
+        query = ThongBao.query.filter_by(nguoi_nhan=user_id, da_luu_tru=False)
         if unread_only:
             query = query.filter_by(da_doc=False)
-            
-        return query.order_by(ThongBao.ngay_tao.desc()).limit(limit).all()
+        direct = BaseService.keyset_paginate(query, ThongBao.ngay_tao, ThongBao.id, direct_cursor, per_page)
+        
+        user = db.session.get(NguoiDung, user_id)
+        broadcasts = {'items': [], 'has_next': False}
+        if user is not None:
+            broadcasts = BaseService.keyset_paginate(
+                NotificationService._broadcast_query(user, unread_only),
+                ThongBaoChung.ngay_tao, ThongBaoChung.id, broadcast_cursor, per_page
+            )
+        
+        items = [NotificationItem.from_direct(row) for row in direct['items']]
+        items += [NotificationItem.from_broadcast(row) for row in broadcasts['items']]
+        items.sort(key=lambda item: (item.ngay_tao, item.key), reverse=True)
+        
+        has_next = len(items) > per_page or direct['has_next'] or broadcasts['has_next']
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1].ngay_tao, items[-1].key) if has_next and items else None
+        
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'has_next': has_next,
+            'per_page': per_page,
+            'estimated_total': None,
+            'total_is_exact': False
+        }
     
     @staticmethod
-    def mark_as_read(notification_id: int, user_id: int) -> bool:
-        """Mark a notification as read"""
+    def mark_as_read(notification_id, user_id: int) -> bool:
+        """Mark a notification as read (broadcast ids are "b<id>")"""
+        kind, row_id = parse_notification_id(notification_id)
         try:
+            if kind == BROADCAST:
+                return NotificationService._write_receipt(row_id, user_id, read=True)
+            
             notification = ThongBao.query.filter_by(
-                id=notification_id, 
+                id=row_id, 
                 nguoi_nhan=user_id
             ).first()
             
@@ -91,20 +261,16 @@ class NotificationService:
     
     @staticmethod
     def mark_all_as_read(user_id: int) -> int:
-        """Mark all notifications as read for a user"""
+        """Mark all notifications as read for a user (one UPDATE, plus broadcast receipts)"""
         try:
-            unread_notifications = ThongBao.query.filter_by(
+            count = ThongBao.query.filter_by(
                 nguoi_nhan=user_id,
                 da_doc=False
-            ).all()
-            
-            count = 0
-            for notification in unread_notifications:
-                notification.da_doc = True
-                notification.ngay_doc = datetime.utcnow()
-                count += 1
+            ).update({'da_doc': True, 'ngay_doc': datetime.utcnow()}, synchronize_session=False)
             
+            count += NotificationService._read_all_broadcasts(user_id)
             db.session.commit()
+            unread_counters.reset(user_id)
             return count
             
         except Exception as e:
@@ -112,23 +278,203 @@ class NotificationService:
             db.session.rollback()
             return 0
     
+    @staticmethod
+    def mark_many_as_read(notification_ids: List, user_id: int) -> int:
+        """Mark the selected notifications as read (one UPDATE for direct ids, receipts for "b<id>")"""
+        direct_ids, broadcast_ids = NotificationService._split_ids(notification_ids)
+        try:
+            count = 0
+            if direct_ids:
+                count = ThongBao.query.filter(
+                    ThongBao.nguoi_nhan == user_id,
+                    ThongBao.id.in_(direct_ids),
+                    ThongBao.da_doc == false(),
+                    ThongBao.da_luu_tru == false()
+                ).update({'da_doc': True, 'ngay_doc': datetime.utcnow()}, synchronize_session=False)
+            if broadcast_ids:
+                count += NotificationService._read_all_broadcasts(user_id, broadcast_ids)
+            # Bulk UPDATEs skip the ThongBao mapper events
+            unread_counters.record(db.session, [user_id], -count)
+            db.session.commit()
+            return count
+        except Exception as e:
+            current_app.logger.error(f"Error marking notifications as read: {str(e)}")
+            db.session.rollback()
+            return 0
+    
+    @staticmethod
+    def archive_notifications(user_id: int, notification_ids: Optional[List] = None,
+                              older_than_days: Optional[int] = None) -> int:
+        """
+        Archive a user's direct notifications in one UPDATE
+        
+        Archived rows leave the inbox and the unread count but are kept until
+        the retention sweep. Selects notification_ids, or everything older
+        than older_than_days; broadcast ids are ignored (use delete to dismiss).
+        """
+        query = ThongBao.query.filter(ThongBao.nguoi_nhan == user_id, ThongBao.da_luu_tru == false())
+        if notification_ids is not None:
+            direct_ids, _ = NotificationService._split_ids(notification_ids)
+            if not direct_ids:
+                return 0
+            query = query.filter(ThongBao.id.in_(direct_ids))
+        if older_than_days is not None:
+            query = query.filter(ThongBao.ngay_tao < datetime.utcnow() - timedelta(days=older_than_days))
+        try:
+            count = query.update({'da_luu_tru': True, 'ngay_luu_tru': datetime.utcnow()},
+                                 synchronize_session=False)
+            db.session.commit()
+            if count:
+                unread_counters.invalidate(user_id)
+            return count
+        except Exception as e:
+            current_app.logger.error(f"Error archiving notifications: {str(e)}")
+            db.session.rollback()
+            return 0
+    
+    @staticmethod
+    def delete_read_notifications(older_than_days: int, user_id: Optional[int] = None) -> int:
+        """Delete read (or archived) direct notifications older than N days in one DELETE"""
+        query = ThongBao.query.filter(
+            ThongBao.ngay_tao < datetime.utcnow() - timedelta(days=older_than_days),
+            or_(ThongBao.da_doc == true(), ThongBao.da_luu_tru == true())
+        )
+        if user_id is not None:
+            query = query.filter(ThongBao.nguoi_nhan == user_id)
+        try:
+            count = query.delete(synchronize_session=False)
+            db.session.commit()
+            return count
+        except Exception as e:
+            current_app.logger.error(f"Error deleting read notifications: {str(e)}")
+            db.session.rollback()
+            return 0
+    
+    @staticmethod
+    def sweep_retention(read_days: Optional[int] = None, unread_days: Optional[int] = None,
+                        broadcast_days: Optional[int] = None, batch_size: Optional[int] = None) -> Dict[str, int]:
+        """
+        Keep thong_bao bounded: delete old read/archived rows, very old unread
+        ones, and old broadcasts with their receipts
+        
+        Defaults come from NOTIFICATION_RETENTION_DAYS,
+        NOTIFICATION_UNREAD_RETENTION_DAYS and
+        NOTIFICATION_BROADCAST_RETENTION_DAYS (0 keeps the rows forever).
+        Rows are deleted by primary key in batches of NOTIFICATION_SWEEP_BATCH,
+        one commit per batch, so the sweep never holds long locks. Delivered
+        outbox rows are dropped after NOTIFICATION_OUTBOX_RETENTION_HOURS.
+        
+        Run it from one place (``python db_manager.py sweep-notifications``
+        from cron), not from every application process.
+        """
+        config = current_app.config
+        read_days = config.get('NOTIFICATION_RETENTION_DAYS', 90) if read_days is None else read_days
+        unread_days = config.get('NOTIFICATION_UNREAD_RETENTION_DAYS', 0) if unread_days is None else unread_days
+        if broadcast_days is None:
+            broadcast_days = config.get('NOTIFICATION_BROADCAST_RETENTION_DAYS', 180)
+        batch_size = batch_size or config.get('NOTIFICATION_SWEEP_BATCH', 5000)
+        now = datetime.utcnow()
+        
+        result = {'read_deleted': 0, 'unread_deleted': 0, 'broadcasts_deleted': 0, 'receipts_deleted': 0,
+                  'batches': 0, 'outbox_deleted': 0}
+        if read_days:
+            result['read_deleted'] = NotificationService._delete_in_batches(
+                and_(ThongBao.ngay_tao < now - timedelta(days=read_days),
+                     or_(ThongBao.da_doc == true(), ThongBao.da_luu_tru == true())),
+                batch_size, result
+            )
+        if unread_days:
+            result['unread_deleted'] = NotificationService._delete_in_batches(
+                ThongBao.ngay_tao < now - timedelta(days=unread_days), batch_size, result
+            )
+        if broadcast_days:
+            NotificationService._delete_broadcasts_in_batches(
+                now - timedelta(days=broadcast_days), batch_size, result
+            )
+        if result['unread_deleted'] or result['broadcasts_deleted']:
+            # Many users' counts changed: rebuild on next read
+            unread_counters.bump_generation()
+        
+        outbox_hours = config.get('NOTIFICATION_OUTBOX_RETENTION_HOURS', 24)
+        if outbox_hours:
+            result['outbox_deleted'] = outbox_dispatcher.purge(now - timedelta(hours=outbox_hours))
+            db.session.commit()
+        return result
+    
+    @staticmethod
+    def _delete_in_batches(condition, batch_size: int, result: Dict[str, int]) -> int:
+        deleted = 0
+        while True:
+            ids = [row.id for row in db.session.query(ThongBao.id).filter(condition)
+                   .order_by(ThongBao.id).limit(batch_size)]
+            if not ids:
+                return deleted
+            deleted += ThongBao.query.filter(ThongBao.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            result['batches'] += 1
+            if len(ids) < batch_size:
+                return deleted
+    
+    @staticmethod
+    def _delete_broadcasts_in_batches(cutoff: datetime, batch_size: int, result: Dict[str, int]) -> None:
+        """Delete broadcasts created before cutoff together with their receipts and recipient rows"""
+        while True:
+            ids = [row.id for row in db.session.query(ThongBaoChung.id).filter(ThongBaoChung.ngay_tao < cutoff)
+                   .order_by(ThongBaoChung.id).limit(batch_size)]
+            if not ids:
+                return
+            # Children first: SQLite does not enforce ON DELETE CASCADE by default
+            result['receipts_deleted'] += BienNhanThongBao.query.filter(
+                BienNhanThongBao.thong_bao_chung_ma.in_(ids)).delete(synchronize_session=False)
+            ThongBaoChungNguoiNhan.query.filter(
+                ThongBaoChungNguoiNhan.thong_bao_chung_ma.in_(ids)).delete(synchronize_session=False)
+            result['broadcasts_deleted'] += ThongBaoChung.query.filter(
+                ThongBaoChung.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            result['batches'] += 1
+            if len(ids) < batch_size:
+                return
+    
+    @staticmethod
+    def _split_ids(notification_ids: List) -> tuple:
+        """Mixed ids ("12", 12, "b3") -> (direct ids, broadcast ids)"""
+        direct_ids, broadcast_ids = [], []
+        for value in notification_ids or []:
+            kind, row_id = parse_notification_id(value)
+            (broadcast_ids if kind == BROADCAST else direct_ids).append(row_id)
+        return direct_ids, broadcast_ids
+    
     @staticmethod
     def get_unread_count(user_id: int) -> int:
-        """Get count of unread notifications"""
+        """Get count of unread notifications (cached counter, rebuilt lazily)"""
         try:
-            return ThongBao.query.filter_by(
-                nguoi_nhan=user_id,
-                da_doc=False
-            ).count()
+            return unread_counters.get(user_id, lambda: NotificationService.count_unread(user_id))
         except:
             return 0
     
     @staticmethod
-    def delete_notification(notification_id: int, user_id: int) -> bool:
-        """Delete a notification"""
+    def count_unread(user_id: int) -> int:
+        """Count unread direct + broadcast notifications in the database"""
+        count = ThongBao.query.filter_by(
+            nguoi_nhan=user_id,
+            da_doc=False,
+            da_luu_tru=False
+        ).count()
+        user = db.session.get(NguoiDung, user_id)
+        if user is not None:
+            count += NotificationService._broadcast_query(user, unread_only=True).order_by(None).count()
+        return count
+    
+    @staticmethod
+    def delete_notification(notification_id, user_id: int) -> bool:
+        """Delete a notification (a broadcast is only dismissed for this user)"""
+        kind, row_id = parse_notification_id(notification_id)
         try:
+            if kind == BROADCAST:
+                return NotificationService._write_receipt(row_id, user_id, dismiss=True)
+            
             notification = ThongBao.query.filter_by(
-                id=notification_id,
+                id=row_id,
                 nguoi_nhan=user_id
             ).first()
             
@@ -144,6 +490,268 @@ class NotificationService:
             db.session.rollback()
             return False
     
+    # Shared broadcasts
+    
+    @staticmethod
+    def create_broadcast(
+        title: str,
+        content: str,
+        notification_type: str = "info",
+        link: Optional[str] = None,
+        role: Optional[str] = None,
+        user_ids: Optional[List[int]] = None,
+        sender_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Store a broadcast once for an audience: everyone, one role, or a user list
+        
+        Recipients see it through get_user_notifications; per-user state is a
+        BienNhanThongBao receipt written only when they read or dismiss it.
+        """
+        started = time.perf_counter()
+        if user_ids is not None:
+            audience = AUDIENCE_USERS
+            user_ids = sorted({int(user_id) for user_id in user_ids})
+        else:
+            audience = AUDIENCE_ROLE if role else AUDIENCE_ALL
+        
+        try:
+            broadcast = ThongBaoChung(
+                tieu_de=title,
+                noi_dung=content,
+                loai=notification_type,
+                lien_ket=link,
+                doi_tuong=audience,
+                vai_tro=role if audience == AUDIENCE_ROLE else None,
+                nguoi_gui_ma=sender_id,
+                ngay_tao=datetime.utcnow()
+            )
+            db.session.add(broadcast)
+            db.session.flush()
+            payload = {
+                'id': f"{BROADCAST_ID_PREFIX}{broadcast.id}",
+                'title': title,
+                'content': content,
+                'type': notification_type,
+                'link': link,
+                'timestamp': broadcast.ngay_tao.isoformat(),
+                'broadcast': True
+            }
+            if audience == AUDIENCE_USERS:
+                if user_ids:
+                    db.session.execute(ThongBaoChungNguoiNhan.__table__.insert(), [
+                        {'thong_bao_chung_ma': broadcast.id, 'nguoi_dung_ma': user_id} for user_id in user_ids
+                    ])
+                    unread_counters.record(db.session, user_ids, 1)
+                for user_id in user_ids:
+                    NotificationService._emit_to_room(f'user_{user_id}', payload)
+            else:
+                NotificationService._emit_broadcast(role, payload)
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(f"Error creating broadcast '{title}': {str(e)}")
+            db.session.rollback()
+            raise
+        
+        if audience == AUDIENCE_USERS:
+            count = len(user_ids)
+        else:
+            recipients = NguoiDung.query
+            if audience == AUDIENCE_ROLE:
+                recipients = recipients.filter_by(vai_tro=role)
+            count = recipients.count()
+        
+        if audience != AUDIENCE_USERS:
+            # Recipients' unread counters are rebuilt on their next read
+            unread_counters.bump_generation(f'role_{role}' if role else ALL_USERS_ROOM)
+        
+        return {
+            'broadcast_id': broadcast.id,
+            'audience': audience,
+            'count': count,
+            'rows_written': 1 + (len(user_ids) if audience == AUDIENCE_USERS else 0),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+    
+    @staticmethod
+    def broadcast(
+        title: str,
+        content: str,
+        notification_type: str = "info",
+        link: Optional[str] = None,
+        role: Optional[str] = None,
+        sender_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Broadcast to everyone or one role: shared row, or per-user rows when NOTIFICATION_BROADCAST_MODE=fanout"""
+        if current_app.config.get('NOTIFICATION_BROADCAST_MODE', 'shared') == 'fanout':
+            return NotificationService.fan_out(title, content, notification_type, link, role=role)
+        return NotificationService.create_broadcast(title, content, notification_type, link,
+                                                    role=role, sender_id=sender_id)
+    
+    @staticmethod
+    def _broadcast_query(user: NguoiDung, unread_only: bool = False):
+        """Broadcasts visible to user (not dismissed), with the user's read state"""
+        audience = or_(
+            ThongBaoChung.doi_tuong == AUDIENCE_ALL,
+            and_(ThongBaoChung.doi_tuong == AUDIENCE_ROLE, ThongBaoChung.vai_tro == user.vai_tro),
+            and_(ThongBaoChung.doi_tuong == AUDIENCE_USERS, exists().where(
+                ThongBaoChungNguoiNhan.thong_bao_chung_ma == ThongBaoChung.id,
+                ThongBaoChungNguoiNhan.nguoi_dung_ma == user.id
+            ))
+        )
+        query = db.session.query(
+            ThongBaoChung.id, ThongBaoChung.tieu_de, ThongBaoChung.noi_dung, ThongBaoChung.loai,
+            ThongBaoChung.lien_ket, ThongBaoChung.ngay_tao,
+            func.coalesce(BienNhanThongBao.da_doc, false()).label('da_doc'),
+            BienNhanThongBao.ngay_doc.label('ngay_doc')
+        ).outerjoin(BienNhanThongBao, and_(
+            BienNhanThongBao.thong_bao_chung_ma == ThongBaoChung.id,
+            BienNhanThongBao.nguoi_dung_ma == user.id
+        )).filter(audience, or_(BienNhanThongBao.id.is_(None), BienNhanThongBao.da_an == false()))
+        
+        if user.ngay_tao is not None:
+            # Like per-user rows, a broadcast only reaches users that existed when it was sent
+            query = query.filter(ThongBaoChung.ngay_tao >= user.ngay_tao)
+        if unread_only:
+            query = query.filter(or_(BienNhanThongBao.id.is_(None), BienNhanThongBao.da_doc == false()))
+        return query
+    
+    @staticmethod
+    def _write_receipt(broadcast_id: int, user_id: int, read: bool = False, dismiss: bool = False) -> bool:
+        """Create or update the user's receipt for a visible broadcast"""
+        user = db.session.get(NguoiDung, user_id)
+        if user is None or NotificationService._broadcast_query(user).filter(
+                ThongBaoChung.id == broadcast_id).first() is None:
+            return False
+        
+        now = datetime.utcnow()
+        receipt = BienNhanThongBao.query.filter_by(thong_bao_chung_ma=broadcast_id, nguoi_dung_ma=user_id).first()
+        if receipt is None:
+            receipt = BienNhanThongBao(thong_bao_chung_ma=broadcast_id, nguoi_dung_ma=user_id, da_doc=False)
+            db.session.add(receipt)
+        if not receipt.da_doc and (read or dismiss):
+            unread_counters.record(db.session, [user_id], -1)
+        if read and not receipt.da_doc:
+            receipt.da_doc, receipt.ngay_doc = True, now
+        if dismiss:
+            receipt.da_an, receipt.ngay_an = True, now
+        db.session.commit()
+        return True
+    
+    @staticmethod
+    def _read_all_broadcasts(user_id: int, broadcast_ids: Optional[List[int]] = None) -> int:
+        """Receipts for unread visible broadcasts (all, or broadcast_ids): one UPDATE + one INSERT ... SELECT (caller commits)"""
+        user = db.session.get(NguoiDung, user_id)
+        if user is None:
+            return 0
+        unread = NotificationService._broadcast_query(user, unread_only=True).order_by(None)
+        now = datetime.utcnow()
+        
+        update = (BienNhanThongBao.__table__.update()
+                  .where(BienNhanThongBao.nguoi_dung_ma == user_id,
+                         BienNhanThongBao.da_doc == false(),
+                         BienNhanThongBao.da_an == false())
+                  .values(da_doc=True, ngay_doc=now))
+        if broadcast_ids is not None:
+            update = update.where(BienNhanThongBao.thong_bao_chung_ma.in_(broadcast_ids))
+            unread = unread.filter(ThongBaoChung.id.in_(broadcast_ids))
+        updated = db.session.execute(update).rowcount
+        
+        missing = unread.filter(BienNhanThongBao.id.is_(None)).with_entities(
+            ThongBaoChung.id, literal(user_id), true(), literal(now), false()
+        )
+        inserted = db.session.execute(BienNhanThongBao.__table__.insert().from_select(
+            ['thong_bao_chung_ma', 'nguoi_dung_ma', 'da_doc', 'ngay_doc', 'da_an'], missing
+        )).rowcount
+        return max(updated, 0) + max(inserted, 0)
+    
+    @staticmethod
+    def fan_out(
+        title: str,
+        content: str,
+        notification_type: str = "info",
+        link: Optional[str] = None,
+        role: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Create one notification per user (optionally only one role) with set-based inserts
+        
+        Rows are written with INSERT ... SELECT over id-ordered chunks of
+        NOTIFICATION_FANOUT_CHUNK users, committing once per chunk; the last chunk
+        also queues a single room-level push in the outbox. Returns row counts and timing.
+        """
+        started = time.perf_counter()
+        chunk_size = max(1, current_app.config.get('NOTIFICATION_FANOUT_CHUNK', 5000))
+        now = datetime.utcnow()
+        
+        recipients = select(NguoiDung.id)
+        if role is not None:
+            recipients = recipients.where(NguoiDung.vai_tro == role)
+        
+        count = chunks = 0
+        last_id = 0
+        try:
+            while True:
+                window = recipients.where(NguoiDung.id > last_id)
+                # Upper id of this chunk; None means the rest fits in one chunk
+                upper_id = db.session.execute(
+                    window.order_by(NguoiDung.id).offset(chunk_size - 1).limit(1)
+                ).scalar()
+                if upper_id is not None:
+                    window = window.where(NguoiDung.id <= upper_id)
+                
+                rows = window.with_only_columns(
+                    NguoiDung.id,
+                    literal(title), literal(content), literal(notification_type), literal(link),
+                    false(), literal(now)
+                )
+                result = db.session.execute(ThongBao.__table__.insert().from_select(
+                    ['nguoi_nhan', 'tieu_de', 'noi_dung', 'loai', 'lien_ket', 'da_doc', 'ngay_tao'], rows
+                ))
+                count += max(result.rowcount, 0)
+                chunks += 1
+                if upper_id is None and count:
+                    # The room-level push commits with the last chunk
+                    NotificationService._emit_broadcast(role, {
+                        'title': title,
+                        'content': content,
+                        'type': notification_type,
+                        'link': link,
+                        'timestamp': now.isoformat(),
+                        'broadcast': True
+                    })
+                db.session.commit()
+                
+                if upper_id is None:
+                    break
+                last_id = upper_id
+        except Exception as e:
+            current_app.logger.error(f"Error fanning out notification '{title}': {str(e)}")
+            db.session.rollback()
+            raise
+        
+        insert_ms = (time.perf_counter() - started) * 1000
+        if count:
+            unread_counters.bump_generation(f'role_{role}' if role else ALL_USERS_ROOM)
+        
+        return {
+            'count': count,
+            'chunks': chunks,
+            'chunk_size': chunk_size,
+            'insert_ms': round(insert_ms, 2),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+    
+    @staticmethod
+    def _emit_broadcast(role: Optional[str], payload: Dict[str, Any]) -> None:
+        """One push to the role room (or every logged-in user) instead of one per recipient"""
+        NotificationService._emit_to_room(f'role_{role}' if role else ALL_USERS_ROOM, payload)
+    
+    @staticmethod
+    def _emit_to_room(room: str, payload: Dict[str, Any]) -> None:
+        """Queue a new_notification push to room in the outbox (sent once the caller commits)"""
+        enqueue_socketio(room, 'new_notification', payload)
+    
     @staticmethod
     def broadcast_to_role(
         role: str,
@@ -154,21 +762,7 @@ class NotificationService:
     ) -> int:
         """Broadcast notification to all users with a specific role"""
         try:
-            users = NguoiDung.query.filter_by(vai_tro=role).all()
-            count = 0
-            
-            for user in users:
-                NotificationService.create_notification(
-                    user_id=user.id,
-                    title=title,
-                    content=content,
-                    notification_type=notification_type,
-                    link=link
-                )
-                count += 1
-            
-            return count
-            
+            return NotificationService.broadcast(title, content, notification_type, link, role=role)['count']
         except Exception as e:
             current_app.logger.error(f"Error broadcasting to role {role}: {str(e)}")
             return 0
@@ -182,35 +776,22 @@ class NotificationService:
     ) -> int:
         """Broadcast notification to all users"""
         try:
-            users = NguoiDung.query.all()
-            count = 0
-            
-            for user in users:
-                NotificationService.create_notification(
-                    user_id=user.id,
-                    title=title,
-                    content=content,
-                    notification_type=notification_type,
-                    link=link
-                )
-                count += 1
-            
-            return count
-            
+            return NotificationService.broadcast(title, content, notification_type, link)['count']
         except Exception as e:
             current_app.logger.error(f"Error broadcasting to all users: {str(e)}")
             return 0
 
 
 # Convenience functions for common notification types
-def notify_lab_registration(user_id: int, session_title: str):
-    """Notify user about successful lab registration"""
+def notify_lab_registration(user_id: int, session_title: str, commit: bool = True):
+    """Notify user about successful lab registration (commit=False: part of the caller's transaction)"""
     return NotificationService.create_notification(
         user_id=user_id,
         title="Đăng ký ca thực hành thành công",
         content=f"Bạn đã đăng ký thành công ca thực hành: {session_title}",
         notification_type="success",
-        link="/lab/my-sessions"
+        link="/lab/my-sessions",
+        commit=commit
     )
 
 def notify_lab_reminder(user_id: int, session_title: str, start_time: str):
@@ -220,12 +801,13 @@ def notify_lab_reminder(user_id: int, session_title: str, start_time: str):
         title="Nhắc nhở ca thực hành",
         content=f"Ca thực hành '{session_title}' sẽ bắt đầu lúc {start_time}",
         notification_type="warning",
-        link="/lab/my-sessions"
+        link="/lab/my-sessions",
+        email=True
     )
 
 def notify_system_maintenance(message: str):
-    """Notify all users about system maintenance"""
-    return NotificationService.broadcast_to_all(
+    """Notify all users about system maintenance (returns broadcast counts and timing)"""
+    return NotificationService.broadcast(
         title="Bảo trì hệ thống",
         content=message,
         notification_type="warning",
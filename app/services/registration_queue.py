@@ -0,0 +1,244 @@
+"""
+Registration Admission Queue
+============================
+
+Optional per-session queue for registration rushes, enabled with
+``CaThucHanh.hang_doi_dang_ky``.
+
+- ``enqueue`` answers immediately with a ticket; the request itself does no
+  database write.
+- One drainer thread per process admits tickets one at a time through
+  ``LabSessionService.register_for_session`` (atomic seat reservation), in
+  FIFO or ``uu_tien`` order (``LAB_QUEUE_ORDER``). The database sees a steady
+  stream of single-row writes instead of every request contending for the
+  same session row. The ticket priority is stored in ``DangKyCa.uu_tien``.
+- Once a session is full, the remaining tickets are rejected from the
+  "session full" hint without touching the database.
+- Results are stored under ``_reg_ticket:<id>`` in the cache backend for
+  polling (``GET /lab/register/ticket/<id>``) and pushed as
+  ``registration_result`` to the ``user_<id>`` SocketIO room through the
+  notification outbox, so a push survives a SocketIO hiccup like every
+  other notification.
+
+The queue is per process. With several workers each drains its own
+tickets; capacity stays correct because admission still goes through the
+conditional UPDATE. Polling from another worker needs a shared cache
+backend.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import heapq
+import itertools
+import secrets
+import threading
+import logging
+
+from .base_service import ServiceError
+from ..cache.cache_manager import get_cache_manager
+
+logger = logging.getLogger(__name__)
+
+TICKET_KEY_PREFIX = "_reg_ticket:"
+LOCAL_TICKET_LIMIT = 10000  # tickets kept in memory when no cache backend is configured
+
+
+def parse_role_priority(value: Any) -> Dict[str, int]:
+    """'quan_tri_he_thong:2,quan_tri_vien:1' -> {'quan_tri_he_thong': 2, 'quan_tri_vien': 1}"""
+    if isinstance(value, dict):
+        return {role: int(priority) for role, priority in value.items()}
+    priorities = {}
+    for item in (value or '').split(','):
+        role, _, priority = item.partition(':')
+        if role.strip() and priority.strip().lstrip('-').isdigit():
+            priorities[role.strip()] = int(priority)
+    return priorities
+
+
+class RegistrationQueue:
+    """In-process admission queue drained by a single background thread"""
+
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self._heap = []  # [(order, ticket_id)]
+        self._queued: Dict[str, Tuple[Dict[str, Any], str]] = {}  # ticket_id -> (ticket, notes)
+        self._pending: Dict[Tuple[int, int], str] = {}  # (session_id, user_id) -> ticket_id
+        self._local_tickets: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.metrics = {'enqueued': 0, 'admitted': 0, 'rejected': 0}
+
+    def init_app(self, app, socketio=None) -> None:
+        self.app = app
+        self.socketio = socketio
+
+    # Producer side
+
+    def enqueue(self, user_id: int, session_id: int, notes: str = "", uu_tien: int = 0) -> Dict[str, Any]:
+        """Queue a registration and return its ticket (the existing one if already queued)"""
+        from .lab_session_service import reject_if_known_full
+
+        reject_if_known_full(user_id, session_id)
+
+        config = self.app.config if self.app else {}
+        by_priority = config.get('LAB_QUEUE_ORDER', 'priority') == 'priority'
+        max_pending = config.get('LAB_QUEUE_MAX_PENDING', 5000)
+
+        with self._cond:
+            existing = self._pending.get((session_id, user_id))
+            if existing and existing in self._queued:
+                return dict(self._queued[existing][0])
+            if max_pending and len(self._heap) >= max_pending:
+                raise ServiceError("Hàng đợi đăng ký đang quá tải, vui lòng thử lại sau", 503)
+
+            seq = next(self._seq)
+            ticket = {
+                'ticket': secrets.token_urlsafe(12),
+                'user_id': user_id,
+                'session_id': session_id,
+                'uu_tien': uu_tien,
+                'status': 'queued',
+                'code': 202,
+                'message': "Yêu cầu đăng ký đang chờ xử lý",
+                'queued_at': datetime.utcnow().isoformat(),
+                'processed_at': None
+            }
+            order = (-uu_tien, seq) if by_priority else (seq,)
+            heapq.heappush(self._heap, (order, ticket['ticket']))
+            self._queued[ticket['ticket']] = (ticket, notes or "")
+            self._pending[(session_id, user_id)] = ticket['ticket']
+            self.metrics['enqueued'] += 1
+            self._ensure_worker()
+            self._cond.notify()
+
+        self._save(ticket)
+        return dict(ticket)
+
+    def get_ticket(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            queued = self._queued.get(ticket_id)
+            if queued:
+                return dict(queued[0])
+        cache = get_cache_manager().get_cache()
+        if cache is not None:
+            try:
+                return cache.get(f"{TICKET_KEY_PREFIX}{ticket_id}")
+            except Exception as e:
+                logger.warning(f"Failed to read registration ticket {ticket_id}: {e}")
+        return self._local_tickets.get(ticket_id)
+
+    def stats(self, session_id: Optional[int] = None) -> Dict[str, Any]:
+        with self._cond:
+            queued = len(self._queued) if session_id is None else sum(
+                1 for ticket, _ in self._queued.values() if ticket['session_id'] == session_id
+            )
+            return dict(self.metrics, queued=queued, worker_alive=bool(self._thread and self._thread.is_alive()))
+
+    # Consumer side
+
+    def _ensure_worker(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="registration-queue", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, ticket_id = heapq.heappop(self._heap)
+                ticket, notes = self._queued[ticket_id]
+            try:
+                with self.app.app_context():
+                    self._admit(ticket, notes)
+            except Exception as e:
+                logger.error(f"Registration queue failed on ticket {ticket_id}: {e}")
+            finally:
+                with self._cond:
+                    self._queued.pop(ticket_id, None)
+                    if self._pending.get((ticket['session_id'], ticket['user_id'])) == ticket_id:
+                        del self._pending[(ticket['session_id'], ticket['user_id'])]
+
+    def _admit(self, ticket: Dict[str, Any], notes: str) -> None:
+        from ..models import db
+        from .lab_session_service import LabSessionService
+
+        try:
+            result, code = LabSessionService().register_for_session(
+                ticket['user_id'], ticket['session_id'], notes, uu_tien=ticket['uu_tien']
+            )
+            message = result.get('message', '')
+        except ServiceError as e:
+            code, message = e.code, e.message
+        except Exception as e:
+            logger.error(f"Queued registration failed: {e}")
+            code, message = 500, "Có lỗi xảy ra khi đăng ký ca thực hành"
+
+        succeeded = code == 200
+        if succeeded:
+            self._after_admission(ticket)
+        db.session.remove()
+
+        ticket.update({
+            'status': 'succeeded' if succeeded else 'failed',
+            'code': code,
+            'message': message,
+            'processed_at': datetime.utcnow().isoformat()
+        })
+        self.metrics['admitted' if succeeded else 'rejected'] += 1
+        self._save(ticket)
+        self._push(ticket)
+
+    @staticmethod
+    def _after_admission(ticket: Dict[str, Any]) -> None:
+        from ..cache.cache_manager import invalidate_user_cache
+        from ..cache.cached_queries import invalidate_session_caches, invalidate_activity_caches
+
+        # The registration notification was committed with the registration
+        invalidate_user_cache(ticket['user_id'])
+        invalidate_session_caches()
+        invalidate_activity_caches()
+
+    def _save(self, ticket: Dict[str, Any]) -> None:
+        timeout = self.app.config.get('LAB_QUEUE_TICKET_TTL', 3600) if self.app else 3600
+        cache = get_cache_manager().get_cache()
+        if cache is not None:
+            try:
+                cache.set(f"{TICKET_KEY_PREFIX}{ticket['ticket']}", dict(ticket), timeout=timeout)
+                return
+            except Exception as e:
+                logger.warning(f"Failed to store registration ticket: {e}")
+        self._local_tickets[ticket['ticket']] = dict(ticket)
+        while len(self._local_tickets) > LOCAL_TICKET_LIMIT:
+            self._local_tickets.popitem(last=False)
+
+    def _push(self, ticket: Dict[str, Any]) -> None:
+        from ..models import db
+        from .notification_outbox import enqueue_socketio
+
+        try:
+            enqueue_socketio(f"user_{ticket['user_id']}", 'registration_result', dict(ticket))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Failed to queue registration result push: {e}")
+        finally:
+            db.session.remove()
+
+
+registration_queue = RegistrationQueue()
+
+
+def priority_for(user) -> int:
+    """uu_tien of a user's queued registration, from LAB_QUEUE_ROLE_PRIORITY"""
+    from flask import current_app
+    priorities = parse_role_priority(current_app.config.get('LAB_QUEUE_ROLE_PRIORITY', ''))
+    return priorities.get(getattr(user, 'vai_tro', None), 0)
+
+
+def init_registration_queue(app, socketio=None) -> RegistrationQueue:
+    registration_queue.init_app(app, socketio)
+    return registration_queue
@@ -240,8 +240,9 @@ class UserService(BaseService):
             self.logger.error(f"Error getting user statistics: {str(e)}")
             return self.error_response("Lỗi lấy thống kê người dùng", 500)
     
-    def get_users_list(self, page: int = 1, per_page: int = 20, filters: Optional[Dict] = None) -> Tuple[Dict, int]:
-        """Lấy danh sách users với pagination"""
+    def get_users_list(self, cursor: Optional[str] = None, per_page: int = 20, filters: Optional[Dict] = None,
+                       estimate_total: bool = False) -> Tuple[Dict, int]:
+        """Lấy danh sách users với phân trang keyset (cursor)"""
         try:
             query = NguoiDung.query
             
@@ -259,17 +260,18 @@ class UserService(BaseService):
                         )
                     )
             
-            # Order by creation date
-            query = query.order_by(NguoiDung.ngay_tao.desc())
-            
-            # Paginate
-            result = self.paginate_query(query, page, per_page)
+            # Newest first, by (ngay_tao, id)
+            result = self.keyset_paginate_query(
+                query, NguoiDung.ngay_tao, NguoiDung.id, cursor, per_page, estimate_total=estimate_total
+            )
             
             return self.success_response(
                 "Lấy danh sách người dùng thành công",
                 result
             )
             
+        except ServiceError:
+            raise
         except Exception as e:
             self.logger.error(f"Error getting users list: {str(e)}")
             return self.error_response("Lỗi lấy danh sách người dùng", 500)
@@ -1,7 +1,7 @@
 # Utility functions for Lab Manager Flask app
 
 import datetime
-from flask import current_app, request, session, url_for
+from flask import current_app, has_request_context, request, session, url_for
 from flask_login import current_user
 from .models import NhatKyHoatDong, db
 from flask_mail import Message, Mail
@@ -10,8 +10,10 @@ import threading
 def log_activity(action, details, user=None):
     if user is None:
         user = current_user if current_user.is_authenticated else None
-    # Sử dụng user.id để đồng bộ với model mới
-    log = NhatKyHoatDong(nguoi_dung_ma=user.id if user else None, hanh_dong=action, chi_tiet=details, dia_chi_ip=request.remote_addr)
+    # Sử dụng user.id để đồng bộ với model mới (services truyền thẳng id)
+    user_id = user if isinstance(user, int) else (user.id if user else None)
+    log = NhatKyHoatDong(nguoi_dung_ma=user_id, hanh_dong=action, chi_tiet=details,
+                         dia_chi_ip=request.remote_addr if has_request_context() else None)
     db.session.add(log)
     db.session.commit()
 
@@ -5,6 +5,44 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "lab-manager-development-secret-key-change-in-production-2025")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Engine profile (see app/db_engine.py); pool settings apply to server databases
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ['true', '1', 'yes', 'on']
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))  # 0 = no limit
+    # Optional read replica for reporting/dashboard reads (see app/db_routing.py)
+    SQLALCHEMY_REPLICA_URI = os.getenv("DATABASE_REPLICA_URL")
+    DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", 5))  # primary-only after a user's write
+    # SQLite pragmas set on every connection
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))  # negative = KiB (64MB)
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+    # Lab registration
+    LAB_FULL_HINT_SECONDS = int(os.getenv("LAB_FULL_HINT_SECONDS", 10))  # reject a full session without a DB round trip
+    LAB_QUEUE_ORDER = os.getenv("LAB_QUEUE_ORDER", "priority")  # priority (uu_tien, then FIFO) or fifo
+    LAB_QUEUE_ROLE_PRIORITY = os.getenv("LAB_QUEUE_ROLE_PRIORITY", "quan_tri_he_thong:2,quan_tri_vien:1")
+    LAB_QUEUE_MAX_PENDING = int(os.getenv("LAB_QUEUE_MAX_PENDING", 5000))  # per process
+    LAB_QUEUE_TICKET_TTL = int(os.getenv("LAB_QUEUE_TICKET_TTL", 3600))  # seconds a ticket result can be polled
+
+    # Notifications
+    NOTIFICATION_FANOUT_CHUNK = int(os.getenv("NOTIFICATION_FANOUT_CHUNK", 5000))  # recipients per INSERT ... SELECT
+    NOTIFICATION_BROADCAST_MODE = os.getenv("NOTIFICATION_BROADCAST_MODE", "shared")  # shared (one row + receipts) or fanout
+    NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 90))  # read/archived rows kept this long
+    NOTIFICATION_UNREAD_RETENTION_DAYS = int(os.getenv("NOTIFICATION_UNREAD_RETENTION_DAYS", 0))  # 0 keeps unread rows forever
+    NOTIFICATION_BROADCAST_RETENTION_DAYS = int(os.getenv("NOTIFICATION_BROADCAST_RETENTION_DAYS", 180))  # broadcasts + receipts, 0 keeps them
+    NOTIFICATION_SWEEP_BATCH = int(os.getenv("NOTIFICATION_SWEEP_BATCH", 5000))  # rows deleted per statement/commit (sweep-notifications, run from cron)
+    NOTIFICATION_OUTBOX_DISPATCHER = os.getenv("NOTIFICATION_OUTBOX_DISPATCHER", "true").lower() in ['true', '1', 'yes', 'on']  # drain the outbox in serving processes (thread started on the first request)
+    NOTIFICATION_OUTBOX_BATCH = int(os.getenv("NOTIFICATION_OUTBOX_BATCH", 100))  # deliveries claimed per batch
+    NOTIFICATION_OUTBOX_POLL_SECONDS = float(os.getenv("NOTIFICATION_OUTBOX_POLL_SECONDS", 2))  # idle poll; commits wake the dispatcher
+    NOTIFICATION_OUTBOX_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_OUTBOX_MAX_ATTEMPTS", 6))
+    NOTIFICATION_OUTBOX_BACKOFF_SECONDS = float(os.getenv("NOTIFICATION_OUTBOX_BACKOFF_SECONDS", 5))  # doubled per failed attempt
+    NOTIFICATION_OUTBOX_RETENTION_HOURS = int(os.getenv("NOTIFICATION_OUTBOX_RETENTION_HOURS", 24))  # delivered rows kept this long
+    NOTIFICATION_EMAIL_ENABLED = os.getenv("NOTIFICATION_EMAIL_ENABLED", "false").lower() in ['true', '1', 'yes', 'on']  # email copies of important notifications
     
     # CSRF Configuration
     WTF_CSRF_ENABLED = os.getenv("WTF_CSRF_ENABLED", "true").lower() in ['true', '1', 'yes', 'on']
@@ -27,6 +65,27 @@ class Config:
     PERMANENT_SESSION_LIFETIME = int(os.getenv("PERMANENT_SESSION_LIFETIME", 1800))    # Caching
     CACHE_TYPE = os.getenv("CACHE_TYPE", "simple")
     CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", 300))
+    CACHE_THRESHOLD = int(os.getenv("CACHE_THRESHOLD", 10000))  # simple backend: entries before pruning (tag index uses a key per member)
+    CACHE_IGNORE_ERRORS = True  # simple backend: delete_many keeps going past already-expired keys
+    # Per-process L1 cache in front of the shared backend
+    CACHE_L1_ENABLED = os.getenv("CACHE_L1_ENABLED", "true").lower() in ['true', '1', 'yes', 'on']
+    CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", 1000))
+    CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", 16 * 1024 * 1024))
+    CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", 30))  # seconds, caps staleness across workers
+    # Encoding of cached values: pickle or msgpack (if installed); zlib, lz4 (if installed) or none
+    CACHE_CODEC_ENABLED = os.getenv("CACHE_CODEC_ENABLED", "true").lower() in ['true', '1', 'yes', 'on']
+    CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "pickle")
+    CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib")
+    CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", 1024))  # bytes
+    CACHE_MAX_VALUE_BYTES = int(os.getenv("CACHE_MAX_VALUE_BYTES", 1024 * 1024))  # larger entries are not cached
+    # Proactively refresh dashboard queries before they expire (background thread)
+    CACHE_BACKGROUND_REFRESH = os.getenv("CACHE_BACKGROUND_REFRESH", "false").lower() in ['true', '1', 'yes', 'on']
+    # Recompute event-maintained dashboard counters (seconds, 0 = never)
+    CACHE_COUNTER_RECONCILE_INTERVAL = int(os.getenv("CACHE_COUNTER_RECONCILE_INTERVAL", 900))
+    # Event-maintained counters expire and are rebuilt from the database (seconds)
+    CACHE_COUNTER_TTL = int(os.getenv("CACHE_COUNTER_TTL", 3600))
+    # Bearer token for scraping /system-admin/cache/metrics without a login session
+    CACHE_METRICS_TOKEN = os.getenv("CACHE_METRICS_TOKEN")
 
     # Thông tin tài khoản mẫu (dùng cho khởi tạo ban đầu, tiếng Việt)
     QUAN_TRI_HE_THONG_TEN = os.getenv("QUAN_TRI_HE_THONG_TEN", "HUYVIESEA")
@@ -48,6 +107,9 @@ class Config:
     REALTIME_UPDATE_INTERVAL = int(os.getenv("REALTIME_UPDATE_INTERVAL", "2"))  # seconds
     REALTIME_MAX_HISTORY = int(os.getenv("REALTIME_MAX_HISTORY", "50"))  # data points
     
+    # Calendar used for "today"/"this week" windows; timestamps are stored as naive UTC
+    TIMEZONE = os.getenv("TIMEZONE", "UTC")
+    
     # Optional: Other config (add as needed)
 
 class DevelopmentConfig(Config):
@@ -31,7 +31,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app import create_app
 from app.models import db, NguoiDung, CaiDatHeThong, CaThucHanh, DangKyCa, VaoCa, NhatKyHoatDong
 from app.models import KhoaHoc, BaiHoc, GhiDanh, ThietBi, DatThietBi, TaiLieuCa, MauCaThucHanh
-from app.models import DanhGiaCa, ThongBao, SinhVien
+from app.models import DanhGiaCa, ThongBao, SinhVien, HopThuThongBao
 from werkzeug.security import generate_password_hash
 import secrets
 import random
@@ -440,6 +440,320 @@ def migrate():
     except Exception as e:
         print(f"Lỗi migration: {str(e)}")
 
+@cli.command()
+@with_appcontext
+def reconcile_counters():
+    """Tính lại bộ đếm dashboard trong cache từ database"""
+    from app.cache.cache_counters import dashboard_counters
+    dashboard_counters.reconcile()
+    print("✅ Đã đối soát bộ đếm dashboard")
+    for name in dashboard_counters.specs:
+        print(f"  {name}: {dashboard_counters.total(name)}")
+
+@cli.command()
+@with_appcontext
+def repair_session_counters():
+    """Tính lại bộ đếm đăng ký/vào ca của CaThucHanh từ DangKyCa/VaoCa"""
+    from app.models import tinh_lai_bo_dem_ca
+    try:
+        updated = tinh_lai_bo_dem_ca()
+        db.session.commit()
+        print(f"✅ Đã tính lại bộ đếm cho {updated} ca thực hành")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Lỗi khi tính lại bộ đếm: {e}")
+
+@cli.command()
+@click.option('--yes', is_flag=True, help='Xóa thật; mặc định chỉ liệt kê các đăng ký trùng')
+@with_appcontext
+def dedup_registrations(yes):
+    """Xóa đăng ký ca trùng lặp, giữ bản ghi cũ nhất (cần trước migration 7d4e2b9a1f60)"""
+    from sqlalchemy import text
+    duplicates = db.session.execute(text("""
+        SELECT nguoi_dung_ma, ca_thuc_hanh_ma, COUNT(*) FROM dang_ky_ca
+        GROUP BY nguoi_dung_ma, ca_thuc_hanh_ma HAVING COUNT(*) > 1
+    """)).fetchall()
+    if not duplicates:
+        print("✅ Không có đăng ký trùng lặp")
+        return
+    for user_id, session_id, count in duplicates:
+        print(f"  Người dùng {user_id} - ca {session_id}: {count} đăng ký")
+    if not yes:
+        print(f"⚠️  {len(duplicates)} cặp trùng lặp. Chạy lại với --yes để xóa (giữ đăng ký cũ nhất)")
+        return
+    try:
+        # Chỉ dùng SQL thô: lệnh này chạy trên schema chưa nâng cấp
+        deleted = db.session.execute(text("""
+            DELETE FROM dang_ky_ca WHERE id NOT IN (
+                SELECT keep_id FROM (
+                    SELECT MIN(id) AS keep_id FROM dang_ky_ca GROUP BY nguoi_dung_ma, ca_thuc_hanh_ma
+                ) AS giu_lai
+            )
+        """)).rowcount
+        db.session.execute(text("""
+            UPDATE ca_thuc_hanh SET
+                so_dang_ky = (SELECT COUNT(*) FROM dang_ky_ca WHERE dang_ky_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id)
+        """))
+        db.session.commit()
+        print(f"✅ Đã xóa {deleted} đăng ký trùng lặp và tính lại so_dang_ky")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Lỗi khi xóa đăng ký trùng lặp: {e}")
+
+# Truy vấn tiêu biểu cho các chỉ mục của migration 7d4e2b9a1f60
+INDEX_BENCHMARK_QUERIES = [
+    ('Số đăng ký của một ca',
+     "SELECT COUNT(*) FROM dang_ky_ca WHERE ca_thuc_hanh_ma = :ca"),
+    ('Kiểm tra đã đăng ký',
+     "SELECT id FROM dang_ky_ca WHERE nguoi_dung_ma = :nguoi_dung AND ca_thuc_hanh_ma = :ca"),
+    ('Kiểm tra đã vào ca',
+     "SELECT id FROM vao_ca WHERE nguoi_dung_ma = :nguoi_dung AND ca_thuc_hanh_ma = :ca"),
+    ('Thông báo chưa đọc',
+     "SELECT id FROM thong_bao WHERE nguoi_nhan = :nguoi_dung AND da_doc = :chua_doc "
+     "ORDER BY ngay_tao DESC LIMIT 20"),
+    ('Hoạt động gần đây',
+     "SELECT id FROM nhat_ky_hoat_dong ORDER BY thoi_gian DESC LIMIT 10"),
+    ('Hoạt động hôm nay',
+     "SELECT COUNT(*) FROM nhat_ky_hoat_dong WHERE thoi_gian >= :dau_ngay AND thoi_gian < :cuoi_ngay"),
+    ('Hoạt động của người dùng',
+     "SELECT id FROM nhat_ky_hoat_dong WHERE nguoi_dung_ma = :nguoi_dung ORDER BY thoi_gian DESC LIMIT 20"),
+    ('Ca đang diễn ra',
+     "SELECT id FROM ca_thuc_hanh WHERE gio_bat_dau <= :bay_gio AND gio_ket_thuc >= :bay_gio"),
+    ('Ca trong ngày',
+     "SELECT id FROM ca_thuc_hanh WHERE ngay = :hom_nay"),
+    ('Ca bắt đầu hôm nay',
+     "SELECT id FROM ca_thuc_hanh WHERE gio_bat_dau >= :dau_ngay AND gio_bat_dau < :cuoi_ngay"),
+    ('Người dùng trực tuyến',
+     "SELECT COUNT(*) FROM nguoi_dung WHERE last_seen >= :truc_tuyen"),
+    ('Tra cứu reset token',
+     "SELECT id FROM nguoi_dung WHERE reset_token = :token"),
+    ('Tra cứu verification token',
+     "SELECT id FROM nguoi_dung WHERE verification_token = :token"),
+]
+
+INDEX_BENCHMARK_INDEXES = [
+    'idx_dang_ky_ca_ca_thuc_hanh', 'uq_dang_ky_ca_nguoi_dung_ca', 'idx_vao_ca_nguoi_dung_ca',
+    'idx_thong_bao_nguoi_nhan_da_doc_ngay_tao', 'idx_nhat_ky_thoi_gian', 'idx_nhat_ky_nguoi_dung_thoi_gian',
+    'idx_ca_thuc_hanh_ngay', 'idx_ca_thuc_hanh_khung_gio', 'idx_nguoi_dung_vai_tro',
+    'idx_nguoi_dung_last_seen', 'idx_nguoi_dung_reset_token', 'idx_nguoi_dung_verification_token',
+]
+
+def _do_truy_van(conn, repeat):
+    """Kế hoạch thực thi và thời gian trung vị (ms) của từng truy vấn mẫu"""
+    from sqlalchemy import text
+    from app.date_windows import today
+    import statistics
+    import time
+
+    now = datetime.utcnow()
+    window = today()
+    params = {
+        'ca': 1, 'nguoi_dung': 1, 'chua_doc': False, 'token': 'benchmark',
+        'bay_gio': now, 'hom_nay': now.date(), 'truc_tuyen': now - timedelta(minutes=5),
+        'dau_ngay': window.start, 'cuoi_ngay': window.end,
+    }
+    explain = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+
+    results = []
+    for name, sql in INDEX_BENCHMARK_QUERIES:
+        plan = [str(row[-1]) for row in conn.execute(text(explain + sql), params)]
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results.append((name, plan, statistics.median(timings)))
+    return results
+
+def _do_khong_chi_muc(repeat):
+    """Đo lại trên bản sao trong bộ nhớ không có các chỉ mục mới (chỉ SQLite)"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.pool import StaticPool
+
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        # pysqlite tự commit DDL, nên làm trên bản sao trong bộ nhớ
+        source = engine.raw_connection()
+        copy = sqlite3.connect(':memory:', check_same_thread=False)
+        try:
+            source.driver_connection.backup(copy)
+        finally:
+            source.close()
+        copy_engine = create_engine('sqlite://', creator=lambda: copy, poolclass=StaticPool)
+        with copy_engine.connect() as conn:
+            for index in INDEX_BENCHMARK_INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+            return _do_truy_van(conn, repeat)
+    # Không DROP INDEX trên database thật (PostgreSQL): DROP INDEX giữ khóa
+    # ACCESS EXCLUSIVE tới khi rollback, chặn mọi truy vấn vào bảng
+    return None
+
+@cli.command()
+@with_appcontext
+def sync_replica():
+    """Sao chép database chính sang replica SQLite (thử nghiệm định tuyến đọc trên máy local)"""
+    from app.db_engine import REPLICA_BIND
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is None:
+        print("❌ Chưa cấu hình DATABASE_REPLICA_URL")
+        return
+    if db.engine.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        print("❌ Chỉ hỗ trợ sao chép giữa hai file SQLite; PostgreSQL dùng streaming replication")
+        return
+    source = db.engine.raw_connection()
+    target = replica.raw_connection()
+    try:
+        source.driver_connection.backup(target.driver_connection)
+        print(f"✅ Đã sao chép {db.engine.url.database} -> {replica.url.database}")
+    finally:
+        target.close()
+        source.close()
+
+@cli.command()
+@click.option('--repeat', default=50, show_default=True, help='Số lần chạy mỗi truy vấn')
+@with_appcontext
+def benchmark_indexes(repeat):
+    """So sánh kế hoạch truy vấn trước/sau khi có các chỉ mục (trước: chỉ SQLite, trên bản sao)"""
+    with db.engine.connect() as conn:
+        after = _do_truy_van(conn, repeat)
+    before = _do_khong_chi_muc(repeat)
+    if before is None:
+        print(f"⚠️  {db.engine.dialect.name}: chỉ đo được trạng thái chưa có chỉ mục trên SQLite, "
+              "chỉ hiển thị hiện tại")
+
+    print("=== KẾ HOẠCH TRUY VẤN ===")
+    for i, (name, plan, elapsed) in enumerate(after):
+        print(f"\n🔎 {name}")
+        if before is not None:
+            _, old_plan, old_elapsed = before[i]
+            print(f"  Trước ({old_elapsed:.3f} ms):")
+            for line in old_plan:
+                print(f"    {line}")
+        print(f"  Sau ({elapsed:.3f} ms):")
+        for line in plan:
+            print(f"    {line}")
+
+def _dang_ky_dong_thoi(app, user_ids, session_id, attempts):
+    """Mỗi luồng đăng ký một người dùng; trả về danh sách (user_id, mã kết quả)"""
+    import threading
+    from app.services.base_service import ServiceError
+    from app.services.lab_session_service import LabSessionService
+
+    barrier = threading.Barrier(len(user_ids) * attempts)
+    results = []
+    lock = threading.Lock()
+
+    def worker(user_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                _, code = LabSessionService().register_for_session(user_id, session_id)
+            except ServiceError as e:
+                code = e.code
+            except Exception:
+                code = 'error'
+            finally:
+                db.session.remove()
+            with lock:
+                results.append((user_id, code))
+
+    threads = [threading.Thread(target=worker, args=(user_id,))
+               for user_id in user_ids for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+@cli.command()
+@click.option('--threads', default=50, show_default=True, help='Số người dùng đăng ký đồng thời')
+@click.option('--seats', default=10, show_default=True, help='Số chỗ của ca thử nghiệm')
+@click.option('--attempts', default=2, show_default=True, help='Số lần mỗi người dùng gửi đăng ký')
+@with_appcontext
+def stress_registration(threads, seats, attempts):
+    """Kiểm tra đăng ký đồng thời: không vượt số chỗ, không trùng đăng ký (dùng trên dev/staging)"""
+    from collections import Counter
+    from flask import current_app
+    from sqlalchemy import func
+    from app.services.lab_session_service import clear_session_full
+
+    tag = secrets.token_hex(4)
+    now = datetime.utcnow()
+    users = [NguoiDung(ten_nguoi_dung=f"stress_{tag}_{i}", email=f"stress_{tag}_{i}@example.invalid")
+             for i in range(threads)]
+    for user in users:
+        user.mat_khau_hash = '!'
+    db.session.add_all(users)
+    db.session.flush()
+    session = CaThucHanh(
+        tieu_de=f"Stress test {tag}", mo_ta="Ca tạm cho stress_registration", ngay=now.date(),
+        gio_bat_dau=now + timedelta(days=1), gio_ket_thuc=now + timedelta(days=1, hours=2),
+        dia_diem="-", so_luong_toi_da=seats, dang_hoat_dong=True, ma_xac_thuc=tag[:6].upper(),
+        nguoi_tao_ma=users[0].id
+    )
+    db.session.add(session)
+    db.session.commit()
+    user_ids = [user.id for user in users]
+    session_id = session.id
+
+    try:
+        results = _dang_ky_dong_thoi(current_app._get_current_object(), user_ids, session_id, attempts)
+        db.session.expire_all()
+        rows = DangKyCa.query.filter_by(ca_thuc_hanh_ma=session_id).count()
+        distinct_users = db.session.query(func.count(func.distinct(DangKyCa.nguoi_dung_ma))).filter(
+            DangKyCa.ca_thuc_hanh_ma == session_id).scalar()
+        counter = db.session.get(CaThucHanh, session_id).so_dang_ky
+
+        print(f"Kết quả ({len(results)} yêu cầu): {dict(Counter(code for _, code in results))}")
+        print(f"Số chỗ: {seats} | Đăng ký: {rows} | Người dùng khác nhau: {distinct_users} | so_dang_ky: {counter}")
+        expected = min(seats, threads)
+        ok = rows == distinct_users == counter == expected
+        print("✅ Không vượt số chỗ, không trùng đăng ký" if ok else "❌ Phát hiện đăng ký vượt chỗ/trùng lặp hoặc bộ đếm sai")
+    finally:
+        DangKyCa.query.filter_by(ca_thuc_hanh_ma=session_id).delete(synchronize_session=False)
+        NhatKyHoatDong.query.filter(NhatKyHoatDong.nguoi_dung_ma.in_(user_ids)).delete(synchronize_session=False)
+        ThongBao.query.filter(ThongBao.nguoi_nhan.in_(user_ids)).delete(synchronize_session=False)
+        HopThuThongBao.query.filter(HopThuThongBao.dich.in_([f"user_{user_id}" for user_id in user_ids])).delete(
+            synchronize_session=False)
+        CaThucHanh.query.filter_by(id=session_id).delete(synchronize_session=False)
+        NguoiDung.query.filter(NguoiDung.id.in_(user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        clear_session_full(session_id)
+
+@cli.command()
+@click.option('--read-days', type=int, default=None, help='Xóa thông báo đã đọc/lưu trữ cũ hơn số ngày này (mặc định NOTIFICATION_RETENTION_DAYS)')
+@click.option('--unread-days', type=int, default=None, help='Xóa cả thông báo chưa đọc cũ hơn số ngày này, 0 = giữ lại (mặc định NOTIFICATION_UNREAD_RETENTION_DAYS)')
+@click.option('--broadcast-days', type=int, default=None, help='Xóa thông báo chung và biên nhận cũ hơn số ngày này, 0 = giữ lại (mặc định NOTIFICATION_BROADCAST_RETENTION_DAYS)')
+@with_appcontext
+def sweep_notifications(read_days, unread_days, broadcast_days):
+    """Dọn thông báo theo chính sách lưu giữ (chạy định kỳ từ cron, một nơi duy nhất)"""
+    from app.services.notification_service import NotificationService
+
+    result = NotificationService.sweep_retention(read_days=read_days, unread_days=unread_days,
+                                                 broadcast_days=broadcast_days)
+    print(f"✅ Đã xóa {result['read_deleted']} thông báo đã đọc/lưu trữ, "
+          f"{result['unread_deleted']} thông báo chưa đọc, {result['broadcasts_deleted']} thông báo chung "
+          f"({result['receipts_deleted']} biên nhận), {result['outbox_deleted']} bản ghi outbox ({result['batches']} lô)")
+
+@cli.command()
+@click.option('--batch-size', type=int, default=None, help='Số bản ghi mỗi lô (mặc định NOTIFICATION_OUTBOX_BATCH)')
+@click.option('--watch', is_flag=True, help='Chạy liên tục như tiến trình gửi riêng (khi tắt NOTIFICATION_OUTBOX_DISPATCHER)')
+@with_appcontext
+def drain_outbox(batch_size, watch):
+    """Gửi ngay các thông báo đang chờ trong hộp thư đi (outbox)"""
+    from app.services.notification_outbox import outbox_dispatcher
+
+    if watch:
+        print("📮 Đang gửi outbox liên tục (Ctrl+C để dừng)...")
+        outbox_dispatcher.run()
+        return
+
+    result = outbox_dispatcher.drain(batch_size=batch_size)
+    print(f"✅ Đã gửi {result['sent']}, thử lại sau {result['retried']}, thất bại {result['failed']} "
+          f"({result['batches']} lô)")
+    stats = outbox_dispatcher.stats()
+    print(f"  Đang chờ: {stats['pending']} | Thất bại: {stats['failed_rows']}")
+
 @cli.command() 
 @with_appcontext
 def create_admin():
@@ -477,6 +791,6 @@ def create_admin():
     print(f"✅ Đã tạo tài khoản admin: {username} ({email})")
 
 if __name__ == '__main__':
-    app = create_app()
+    app, _ = create_app()
     with app.app_context():
         cli()
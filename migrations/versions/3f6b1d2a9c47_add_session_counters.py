@@ -0,0 +1,41 @@
+"""Add denormalized registration/attendance counters to ca_thuc_hanh
+
+Revision ID: 3f6b1d2a9c47
+Revises: 0c09e8fa5431
+Create Date: 2026-10-18 09:12:41.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6b1d2a9c47'
+down_revision = '0c09e8fa5431'
+branch_labels = None
+depends_on = None
+
+COUNTER_COLUMNS = ('so_dang_ky', 'so_da_vao', 'so_hoan_thanh', 'tong_diem', 'so_bai_cham')
+
+
+def upgrade():
+    with op.batch_alter_table('ca_thuc_hanh', schema=None) as batch_op:
+        for column in COUNTER_COLUMNS:
+            batch_op.add_column(sa.Column(column, sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from the existing rows
+    op.execute("""
+        UPDATE ca_thuc_hanh SET
+            so_dang_ky = (SELECT COUNT(*) FROM dang_ky_ca WHERE dang_ky_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id),
+            so_da_vao = (SELECT COUNT(*) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id),
+            so_hoan_thanh = (SELECT COUNT(*) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id
+                             AND vao_ca.thoi_gian_ra IS NOT NULL),
+            tong_diem = (SELECT COALESCE(SUM(diem_so), 0) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id),
+            so_bai_cham = (SELECT COUNT(diem_so) FROM vao_ca WHERE vao_ca.ca_thuc_hanh_ma = ca_thuc_hanh.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('ca_thuc_hanh', schema=None) as batch_op:
+        for column in reversed(COUNTER_COLUMNS):
+            batch_op.drop_column(column)
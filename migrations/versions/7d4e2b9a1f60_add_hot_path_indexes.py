@@ -0,0 +1,82 @@
+"""Add indexes for hot query paths
+
+Revision ID: 7d4e2b9a1f60
+Revises: 3f6b1d2a9c47
+Create Date: 2026-10-18 11:03:27.914556
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d4e2b9a1f60'
+down_revision = '3f6b1d2a9c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The unique index below would fail on duplicate registrations. Removing
+    # them is irreversible, so stop here and leave it to an explicit command.
+    duplicates = op.get_bind().execute(sa.text("""
+        SELECT COUNT(*) FROM (
+            SELECT nguoi_dung_ma, ca_thuc_hanh_ma FROM dang_ky_ca
+            GROUP BY nguoi_dung_ma, ca_thuc_hanh_ma HAVING COUNT(*) > 1
+        ) AS trung_lap
+    """)).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"dang_ky_ca has {duplicates} duplicated (nguoi_dung_ma, ca_thuc_hanh_ma) pairs; "
+            "run `python db_manager.py dedup-registrations` before upgrading"
+        )
+
+    with op.batch_alter_table('dang_ky_ca', schema=None) as batch_op:
+        batch_op.create_index('idx_dang_ky_ca_ca_thuc_hanh', ['ca_thuc_hanh_ma'], unique=False)
+        batch_op.create_index('uq_dang_ky_ca_nguoi_dung_ca', ['nguoi_dung_ma', 'ca_thuc_hanh_ma'], unique=True)
+
+    with op.batch_alter_table('vao_ca', schema=None) as batch_op:
+        batch_op.create_index('idx_vao_ca_nguoi_dung_ca', ['nguoi_dung_ma', 'ca_thuc_hanh_ma'], unique=False)
+
+    with op.batch_alter_table('thong_bao', schema=None) as batch_op:
+        batch_op.create_index('idx_thong_bao_nguoi_nhan_da_doc_ngay_tao', ['nguoi_nhan', 'da_doc', 'ngay_tao'], unique=False)
+
+    with op.batch_alter_table('nhat_ky_hoat_dong', schema=None) as batch_op:
+        batch_op.create_index('idx_nhat_ky_thoi_gian', ['thoi_gian'], unique=False)
+        batch_op.create_index('idx_nhat_ky_nguoi_dung_thoi_gian', ['nguoi_dung_ma', 'thoi_gian'], unique=False)
+
+    with op.batch_alter_table('ca_thuc_hanh', schema=None) as batch_op:
+        batch_op.create_index('idx_ca_thuc_hanh_ngay', ['ngay'], unique=False)
+        batch_op.create_index('idx_ca_thuc_hanh_khung_gio', ['gio_bat_dau', 'gio_ket_thuc'], unique=False)
+
+    with op.batch_alter_table('nguoi_dung', schema=None) as batch_op:
+        batch_op.create_index('idx_nguoi_dung_vai_tro', ['vai_tro'], unique=False)
+        batch_op.create_index('idx_nguoi_dung_last_seen', ['last_seen'], unique=False)
+        batch_op.create_index('idx_nguoi_dung_reset_token', ['reset_token'], unique=False)
+        batch_op.create_index('idx_nguoi_dung_verification_token', ['verification_token'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('nguoi_dung', schema=None) as batch_op:
+        batch_op.drop_index('idx_nguoi_dung_verification_token')
+        batch_op.drop_index('idx_nguoi_dung_reset_token')
+        batch_op.drop_index('idx_nguoi_dung_last_seen')
+        batch_op.drop_index('idx_nguoi_dung_vai_tro')
+
+    with op.batch_alter_table('ca_thuc_hanh', schema=None) as batch_op:
+        batch_op.drop_index('idx_ca_thuc_hanh_khung_gio')
+        batch_op.drop_index('idx_ca_thuc_hanh_ngay')
+
+    with op.batch_alter_table('nhat_ky_hoat_dong', schema=None) as batch_op:
+        batch_op.drop_index('idx_nhat_ky_nguoi_dung_thoi_gian')
+        batch_op.drop_index('idx_nhat_ky_thoi_gian')
+
+    with op.batch_alter_table('thong_bao', schema=None) as batch_op:
+        batch_op.drop_index('idx_thong_bao_nguoi_nhan_da_doc_ngay_tao')
+
+    with op.batch_alter_table('vao_ca', schema=None) as batch_op:
+        batch_op.drop_index('idx_vao_ca_nguoi_dung_ca')
+
+    with op.batch_alter_table('dang_ky_ca', schema=None) as batch_op:
+        batch_op.drop_index('uq_dang_ky_ca_nguoi_dung_ca')
+        batch_op.drop_index('idx_dang_ky_ca_ca_thuc_hanh')
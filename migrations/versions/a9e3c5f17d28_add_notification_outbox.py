@@ -0,0 +1,45 @@
+"""Add notification delivery outbox
+
+Revision ID: a9e3c5f17d28
+Revises: f8c21d9e4b07
+Create Date: 2026-10-18 20:34:17.903215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e3c5f17d28'
+down_revision = 'f8c21d9e4b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'hop_thu_thong_bao',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kenh', sa.String(length=20), nullable=False),
+        sa.Column('dich', sa.String(length=255), nullable=False),
+        sa.Column('su_kien', sa.String(length=100), nullable=False),
+        sa.Column('du_lieu', sa.Text(), nullable=False),
+        sa.Column('trang_thai', sa.String(length=20), nullable=False),
+        sa.Column('so_lan_thu', sa.Integer(), nullable=False),
+        sa.Column('lan_thu_tiep', sa.DateTime(), nullable=False),
+        sa.Column('ma_xu_ly', sa.String(length=32), nullable=True),
+        sa.Column('khoa_den', sa.DateTime(), nullable=True),
+        sa.Column('loi_cuoi', sa.Text(), nullable=True),
+        sa.Column('ngay_tao', sa.DateTime(), nullable=False),
+        sa.Column('ngay_gui', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_hop_thu_thong_bao_trang_thai_lan_thu', 'hop_thu_thong_bao',
+                    ['trang_thai', 'lan_thu_tiep'], unique=False)
+    op.create_index('idx_hop_thu_thong_bao_ma_xu_ly', 'hop_thu_thong_bao', ['ma_xu_ly'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_hop_thu_thong_bao_ma_xu_ly', table_name='hop_thu_thong_bao')
+    op.drop_index('idx_hop_thu_thong_bao_trang_thai_lan_thu', table_name='hop_thu_thong_bao')
+    op.drop_table('hop_thu_thong_bao')
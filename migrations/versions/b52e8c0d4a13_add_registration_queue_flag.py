@@ -0,0 +1,26 @@
+"""Add queued-admission flag to ca_thuc_hanh
+
+Revision ID: b52e8c0d4a13
+Revises: 7d4e2b9a1f60
+Create Date: 2026-10-18 14:21:08.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52e8c0d4a13'
+down_revision = '7d4e2b9a1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ca_thuc_hanh', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hang_doi_dang_ky', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('ca_thuc_hanh', schema=None) as batch_op:
+        batch_op.drop_column('hang_doi_dang_ky')
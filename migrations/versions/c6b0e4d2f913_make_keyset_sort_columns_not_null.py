@@ -0,0 +1,51 @@
+"""Make keyset pagination sort columns NOT NULL
+
+Revision ID: c6b0e4d2f913
+Revises: a9e3c5f17d28
+Create Date: 2026-10-18 22:15:42.318604
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6b0e4d2f913'
+down_revision = 'a9e3c5f17d28'
+branch_labels = None
+depends_on = None
+
+# Rows without a timestamp sort last (oldest), where NULLs used to be listed
+EPOCH = datetime(1970, 1, 1)
+
+
+def _backfill(sql):
+    op.get_bind().execute(sa.text(sql).bindparams(sa.bindparam('epoch', EPOCH, type_=sa.DateTime())))
+
+
+def upgrade():
+    _backfill("UPDATE nguoi_dung SET ngay_tao = COALESCE(last_seen, :epoch) WHERE ngay_tao IS NULL")
+    _backfill("UPDATE nhat_ky_hoat_dong SET thoi_gian = :epoch WHERE thoi_gian IS NULL")
+    _backfill("UPDATE thong_bao SET ngay_tao = :epoch WHERE ngay_tao IS NULL")
+
+    with op.batch_alter_table('nguoi_dung', schema=None) as batch_op:
+        batch_op.alter_column('ngay_tao', existing_type=sa.DateTime(), nullable=False)
+
+    with op.batch_alter_table('nhat_ky_hoat_dong', schema=None) as batch_op:
+        batch_op.alter_column('thoi_gian', existing_type=sa.DateTime(), nullable=False)
+
+    with op.batch_alter_table('thong_bao', schema=None) as batch_op:
+        batch_op.alter_column('ngay_tao', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('thong_bao', schema=None) as batch_op:
+        batch_op.alter_column('ngay_tao', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('nhat_ky_hoat_dong', schema=None) as batch_op:
+        batch_op.alter_column('thoi_gian', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('nguoi_dung', schema=None) as batch_op:
+        batch_op.alter_column('ngay_tao', existing_type=sa.DateTime(), nullable=True)
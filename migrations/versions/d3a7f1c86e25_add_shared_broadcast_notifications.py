@@ -0,0 +1,75 @@
+"""Add shared broadcast notifications with per-user receipts
+
+Revision ID: d3a7f1c86e25
+Revises: b52e8c0d4a13
+Create Date: 2026-10-18 16:05:52.118340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7f1c86e25'
+down_revision = 'b52e8c0d4a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'thong_bao_chung',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tieu_de', sa.String(length=200), nullable=False),
+        sa.Column('noi_dung', sa.Text(), nullable=False),
+        sa.Column('loai', sa.String(length=50), nullable=True),
+        sa.Column('lien_ket', sa.String(length=500), nullable=True),
+        sa.Column('doi_tuong', sa.String(length=20), nullable=False),
+        sa.Column('vai_tro', sa.String(length=20), nullable=True),
+        sa.Column('nguoi_gui_ma', sa.Integer(), nullable=True),
+        sa.Column('ngay_tao', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['nguoi_gui_ma'], ['nguoi_dung.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_thong_bao_chung_doi_tuong_ngay_tao', 'thong_bao_chung',
+                    ['doi_tuong', 'vai_tro', 'ngay_tao'], unique=False)
+
+    op.create_table(
+        'thong_bao_chung_nguoi_nhan',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('thong_bao_chung_ma', sa.Integer(), nullable=False),
+        sa.Column('nguoi_dung_ma', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['thong_bao_chung_ma'], ['thong_bao_chung.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['nguoi_dung_ma'], ['nguoi_dung.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_thong_bao_chung_nguoi_nhan', 'thong_bao_chung_nguoi_nhan',
+                    ['thong_bao_chung_ma', 'nguoi_dung_ma'], unique=True)
+    op.create_index('idx_thong_bao_chung_nguoi_nhan_nguoi_dung', 'thong_bao_chung_nguoi_nhan',
+                    ['nguoi_dung_ma'], unique=False)
+
+    op.create_table(
+        'bien_nhan_thong_bao',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('thong_bao_chung_ma', sa.Integer(), nullable=False),
+        sa.Column('nguoi_dung_ma', sa.Integer(), nullable=False),
+        sa.Column('da_doc', sa.Boolean(), nullable=False),
+        sa.Column('ngay_doc', sa.DateTime(), nullable=True),
+        sa.Column('da_an', sa.Boolean(), nullable=False),
+        sa.Column('ngay_an', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['thong_bao_chung_ma'], ['thong_bao_chung.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['nguoi_dung_ma'], ['nguoi_dung.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_bien_nhan_thong_bao', 'bien_nhan_thong_bao',
+                    ['thong_bao_chung_ma', 'nguoi_dung_ma'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_bien_nhan_thong_bao', table_name='bien_nhan_thong_bao')
+    op.drop_table('bien_nhan_thong_bao')
+    op.drop_index('idx_thong_bao_chung_nguoi_nhan_nguoi_dung', table_name='thong_bao_chung_nguoi_nhan')
+    op.drop_index('uq_thong_bao_chung_nguoi_nhan', table_name='thong_bao_chung_nguoi_nhan')
+    op.drop_table('thong_bao_chung_nguoi_nhan')
+    op.drop_index('idx_thong_bao_chung_doi_tuong_ngay_tao', table_name='thong_bao_chung')
+    op.drop_table('thong_bao_chung')
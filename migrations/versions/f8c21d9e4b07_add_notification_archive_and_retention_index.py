@@ -0,0 +1,30 @@
+"""Add notification archive flag and retention index
+
+Revision ID: f8c21d9e4b07
+Revises: d3a7f1c86e25
+Create Date: 2026-10-18 18:12:40.551893
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8c21d9e4b07'
+down_revision = 'd3a7f1c86e25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('thong_bao', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('da_luu_tru', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.add_column(sa.Column('ngay_luu_tru', sa.DateTime(), nullable=True))
+        batch_op.create_index('idx_thong_bao_da_doc_ngay_tao', ['da_doc', 'ngay_tao'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('thong_bao', schema=None) as batch_op:
+        batch_op.drop_index('idx_thong_bao_da_doc_ngay_tao')
+        batch_op.drop_column('ngay_luu_tru')
+        batch_op.drop_column('da_luu_tru')
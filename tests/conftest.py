@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Cấu hình phải có trước khi import app: config.py đọc biến môi trường lúc import
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.close(_db_fd)
+os.environ['DATABASE_URL'] = f"sqlite:///{_db_path}"
+os.environ.setdefault('FLASK_DEBUG', '1')
+os.environ.setdefault('NOTIFICATION_OUTBOX_DISPATCHER', 'false')
+
+from app import create_app  # noqa: E402
+from app.models import db, NguoiDung  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    app, _ = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield app
+    os.unlink(_db_path)
+
+
+@pytest.fixture
+def db_session(app):
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+
+
+@pytest.fixture
+def user(app, db_session):
+    """Người dùng thường, tạo mới cho mỗi test"""
+    count = NguoiDung.query.count()
+    user = NguoiDung(ten_nguoi_dung=f"user{count}", email=f"user{count}@example.com")
+    user.dat_mat_khau('password123')
+    user.is_verified = True
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def login(app):
+    def _login(client, user):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return client
+    return _login
@@ -0,0 +1,42 @@
+import cachelib.simple
+import pytest
+from cachelib import SimpleCache
+
+from app.cache.cache_tags import CacheTagIndex
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(cachelib.simple, 'time', lambda: now[0])
+    return now
+
+
+def test_restored_key_keeps_its_tag_past_first_timeout(clock):
+    cache = SimpleCache(threshold=1000, ignore_delete_many_errors=True)
+    index = CacheTagIndex()
+
+    cache.set('dashboard', 'v1', timeout=60)
+    index.register(cache, 'dashboard', ['model:nguoidung'], timeout=60)
+
+    # Làm mới (SWR/cache warmer) trước khi hết hạn: giá trị có TTL mới
+    clock[0] += 50
+    cache.set('dashboard', 'v2', timeout=60)
+    index.register(cache, 'dashboard', ['model:nguoidung'], timeout=60)
+
+    # Qua timeout đầu tiên: giá trị vẫn sống, mục chỉ mục cũng phải còn
+    clock[0] += 30
+    assert cache.get('dashboard') == 'v2'
+    assert index.keys_for_tag(cache, 'model:nguoidung') == ['dashboard']
+
+    assert index.invalidate_tags(cache, ['model:nguoidung']) == 1
+    assert cache.get('dashboard') is None
+
+
+def test_register_is_idempotent(clock):
+    cache = SimpleCache(threshold=1000, ignore_delete_many_errors=True)
+    index = CacheTagIndex()
+    for _ in range(3):
+        index.register(cache, 'k', ['t'], timeout=60)
+    assert index.keys_for_tag(cache, 't') == ['k']
+    assert list(index.known_tags(cache)) == ['t']
@@ -0,0 +1,35 @@
+from app.cache.cache_manager import get_cache_manager
+
+
+def _search(client, **headers):
+    return client.get('/search?q=user', headers=headers)
+
+
+def test_l2_hit_keeps_validators_and_headers(app, user, login):
+    client = login(app.test_client(), user)
+
+    first = _search(client)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    # Bỏ L1 để lần đọc sau phải đi qua codec của L2
+    with app.app_context():
+        cache = get_cache_manager().get_cache()
+        cache.local.clear()
+        l2_hits = cache.metrics['l2_hits']
+
+    second = _search(client)
+    with app.app_context():
+        assert get_cache_manager().get_cache().metrics['l2_hits'] > l2_hits
+
+    assert second.status_code == 200
+    assert second.headers['ETag'] == etag
+    assert second.headers['Cache-Control'] == 'private, max-age=60'
+    assert 'Cookie' in second.headers['Vary']
+    assert second.get_data() == first.get_data()
+
+    with app.app_context():
+        get_cache_manager().get_cache().local.clear()
+    revalidated = _search(client, **{'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['Cache-Control'] == 'private, max-age=60'
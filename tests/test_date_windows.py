@@ -0,0 +1,43 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func
+
+from app.date_windows import day_window, last_days, last_hours, today
+from app.models import db, CaThucHanh, NguoiDung, NhatKyHoatDong
+
+
+def _query_plan(query):
+    """EXPLAIN QUERY PLAN của một truy vấn ORM trên SQLite"""
+    compiled = query.statement.compile(db.engine)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+    return ' | '.join(str(row[-1]) for row in rows)
+
+
+@pytest.mark.parametrize('query, index', [
+    (lambda: CaThucHanh.query.filter(today().filter(CaThucHanh.gio_bat_dau)),
+     'idx_ca_thuc_hanh_khung_gio'),
+    (lambda: NhatKyHoatDong.query.filter(last_days(7).filter(NhatKyHoatDong.thoi_gian)),
+     'idx_nhat_ky_thoi_gian'),
+    (lambda: NguoiDung.query.filter(last_hours(24).filter(NguoiDung.last_seen)),
+     'idx_nguoi_dung_last_seen'),
+])
+def test_window_filter_uses_index(db_session, query, index):
+    plan = _query_plan(query())
+    assert f'INDEX {index}' in plan, plan
+    assert 'SCAN' not in plan, plan
+
+
+def test_date_function_filter_scans(db_session):
+    # Đối chứng: func.date() bọc cột nên không dùng được chỉ mục
+    query = CaThucHanh.query.filter(func.date(CaThucHanh.gio_bat_dau) == datetime.utcnow().date())
+    assert 'SCAN' in _query_plan(query)
+
+
+def test_day_window_follows_dst():
+    # Ngày chuyển sang giờ mùa hè ở châu Âu chỉ dài 23 giờ
+    window = day_window(date(2026, 3, 29), 'Europe/Berlin')
+    assert window.start == datetime(2026, 3, 28, 23, 0)
+    assert window.end - window.start == timedelta(hours=23)
+    assert window.contains(window.start) and not window.contains(window.end)
@@ -0,0 +1,73 @@
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, CaThucHanh, DangKyCa, NguoiDung
+from app.services.base_service import ServiceError
+from app.services.lab_session_service import LabSessionService, clear_session_full
+
+SEATS = 5
+
+
+@pytest.fixture
+def full_house(app, db_session):
+    """Ca SEATS chỗ và SEATS người dùng mới"""
+    count = NguoiDung.query.count()
+    users = [NguoiDung(ten_nguoi_dung=f"concurrent{count + i}", email=f"concurrent{count + i}@example.com")
+             for i in range(SEATS)]
+    for user in users:
+        user.dat_mat_khau('password123')
+    db_session.add_all(users)
+    db_session.flush()
+    now = datetime.utcnow()
+    session = CaThucHanh(
+        tieu_de="Đăng ký đồng thời", mo_ta="Ca cho test", ngay=now.date(),
+        gio_bat_dau=now + timedelta(days=1), gio_ket_thuc=now + timedelta(days=1, hours=2),
+        dia_diem="-", so_luong_toi_da=SEATS, dang_hoat_dong=True, ma_xac_thuc="CONC01",
+        nguoi_tao_ma=users[0].id
+    )
+    db_session.add(session)
+    db_session.commit()
+    yield session.id, [user.id for user in users]
+    clear_session_full(session.id)
+
+
+def _register_concurrently(app, user_ids, session_id, attempts):
+    """Mọi luồng cùng gọi register_for_session sau một barrier; trả về các mã kết quả"""
+    barrier = threading.Barrier(len(user_ids) * attempts)
+    codes = []
+    lock = threading.Lock()
+
+    def worker(user_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                _, code = LabSessionService().register_for_session(user_id, session_id)
+            except ServiceError as e:
+                code = e.code
+            finally:
+                db.session.remove()
+            with lock:
+                codes.append(code)
+
+    threads = [threading.Thread(target=worker, args=(user_id,))
+               for user_id in user_ids for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return codes
+
+
+def test_concurrent_registrations_fill_exactly_the_seats(app, db_session, full_house):
+    session_id, user_ids = full_house
+
+    # Mỗi người gửi hai lần: đủ SEATS chỗ, lần thứ hai luôn là trùng lặp
+    codes = _register_concurrently(app, user_ids, session_id, attempts=2)
+
+    assert Counter(codes) == {200: SEATS, 409: SEATS}
+    db_session.expire_all()
+    assert db_session.get(CaThucHanh, session_id).so_dang_ky == SEATS
+    assert DangKyCa.query.filter_by(ca_thuc_hanh_ma=session_id).count() == SEATS